@@ -4,6 +4,9 @@ from gitgo.backend.backend import Backend, RepoBackend, ObjectStoreBackend, Inde
 from gitgo.backend.base import BackendBase, T_BACKEND, T_FRONTEND
 
 import gitgo.backend.null as null
+import gitgo.backend.git as git
+import gitgo.backend.script as script
+import gitgo.backend.native as native
 
 __all__ =[
     'BackendBase',
@@ -16,5 +19,8 @@ __all__ =[
     'BinaryModes',
     'T_BACKEND',
     'T_FRONTEND',
-    'null'
+    'null',
+    'git',
+    'script',
+    'native',
 ]
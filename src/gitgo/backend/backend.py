@@ -1,14 +1,16 @@
 from abc import abstractmethod
 import io
-from typing import cast, Literal, overload, TYPE_CHECKING
+from typing import cast, Iterable, Iterator, Literal, Optional, overload, TYPE_CHECKING
 from pathlib import Path
-from secrets import token_hex
+import os
 
 from gitgo.backend.base import T_FRONTEND, BackendBase
 
 if TYPE_CHECKING:
-    from gitgo.index import IndexEntry, FileMode
-    from gitgo.object import Oid, GitObj
+    from gitgo.index import IndexEntry, IndexTable
+    from gitgo.worktree.status import StatusEngine, WorktreeChanges
+    from gitgo.worktree.watcher import WorktreeWatcher
+    from gitgo.object import Oid, GitObj, ObjType, CommitInfo, HashAlgorithm
     from gitgo.repo import Repo  # noqa: F401
     from gitgo.worktree import Worktree  # noqa: F401
     from gitgo.objectstore import ObjectStore  # noqa: F401
@@ -53,7 +55,7 @@ class Backend(BackendBase['Frontend']):
         print(f'__init_subclass__ called for {cls.__name__}')
         for method in ('make_repo', 'make_worktree', 'make_object_store', 'make_index'):
             m = getattr(cls, method)
-            def wrapper(self, frontend: T_FRONTEND, *args, **kwargs) -> T_FRONTEND:
+            def wrapper(self, frontend: T_FRONTEND, *args, m=m, method=method, **kwargs) -> T_FRONTEND:
                 print(f'wrapper called for {cls.__name__}.{method}')
                 val = m(self, *args, **kwargs)
                 frontend.backend = val
@@ -79,6 +81,42 @@ class ObjectStoreBackend(BackendBase['ObjectStore']):
     @abstractmethod
     def store(self, oid: 'Oid', value: 'GitObj') -> None:
         ...
+    @abstractmethod
+    def read_header(self, oid: 'Oid') -> Optional[tuple['ObjType', int]]:
+        '''
+        Return the type and size of the object, or None if it is not present.
+        '''
+        ...
+    @abstractmethod
+    def read(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        '''
+        Return the type and raw contents of the object, or None if it is not present.
+        '''
+        ...
+    def read_many(self, oids: Iterable['Oid']) -> Iterator[tuple['Oid', Optional[tuple['ObjType', bytes]]]]:
+        '''
+        Read many objects, yielding each oid with its type and contents (or
+        None) as they are read, in whatever order the backend reads them
+        best. By default, they are read one at a time; backends override
+        this to batch or reorder the reads.
+        '''
+        for oid in oids:
+            yield oid, self.read(oid)
+
+    def read_commit(self, oid: 'Oid') -> Optional['CommitInfo']:
+        '''
+        Return the tree, parents and time of a commit, or None if it is not
+        present. By default, the commit object is read and parsed; backends
+        with faster sources (such as a commit-graph) override this.
+        '''
+        from gitgo.object import parse_commit
+        found = self.read(oid)
+        if found is None:
+            return None
+        type, data = found
+        if type != 'commit':
+            raise ValueError(f'{oid} is a {type}, not a commit')
+        return parse_commit(data)
 
 class IndexBackend(BackendBase['GitIndex']):
     def __init__(self, /, **kwargs):
@@ -102,19 +140,61 @@ class WorktreeBackend(BackendBase['Worktree']):
     def __init__(self, path: Path, /, **kwargs):
         super().__init__(**kwargs)
         self.path = path
+        self._root = os.fsencode(path) + b'/'
+        self._status: Optional['StatusEngine'] = None
+        # If set and running, status looks only at what it reports changed.
+        self.watcher: Optional['WorktreeWatcher'] = None
+
+    def lstat(self, path: bytes) -> os.stat_result:
+        '''
+        lstat a file, by its path in the index (relative, and encoded).
+        '''
+        return os.lstat(self._root + path)
+
+    def hash_blob(self, path: bytes, st: os.stat_result,
+                  algorithm: 'HashAlgorithm' = 'sha1') -> 'Oid':
+        '''
+        The blob id git would give a file, by its path in the index, given
+        its `lstat`.
+        '''
+        from gitgo.worktree.hashing import hash_file
+        return hash_file(self._root + path, algorithm=algorithm, st=st).oid
+
+    def status(self, index: 'GitIndex | IndexTable', /, *,
+               index_mtime_ns: Optional[int] = None) -> 'WorktreeChanges':
+        '''
+        Compare an index with this worktree, without running git. The mtime
+        of the file of a `GitPhysIndex` is found for itself.
+        '''
+        from gitgo.index import GitPhysIndex, IndexTable
+        from gitgo.worktree.status import StatusEngine
+        if self._status is None:
+            self._status = StatusEngine(self)
+        table = index if isinstance(index, IndexTable) else index._table
+        if index_mtime_ns is None and isinstance(index, GitPhysIndex) and index.file is not None:
+            try:
+                index_mtime_ns = os.stat(index.path).st_mtime_ns
+            except FileNotFoundError:
+                pass
+        if self.watcher is not None and self.watcher.running:
+            return self.watcher.status(self._status, table, index_mtime_ns=index_mtime_ns)
+        return self._status.status(table, index_mtime_ns=index_mtime_ns)
 
     @abstractmethod
-    def stat(self, path: Path) -> 'IndexEntry':
-        stat = path.stat()
-        oid = token_hex(20)
+    def stat(self, path: Path, *, algorithm: 'HashAlgorithm' = 'sha1') -> 'IndexEntry':
+        from gitgo.index import IndexEntry, split_mode
+        from gitgo.worktree.hashing import hash_file
+        from gitgo.worktree.status import worktree_mode
+        stat = os.lstat(path)
+        type, mode = split_mode(worktree_mode(stat))
         return IndexEntry(
             name=path.name,
-            type='blob',
-            oid=cast(Oid, oid),
+            type=type,
+            oid=hash_file(path, algorithm=algorithm, st=stat).oid,
             size=stat.st_size,
             uid=stat.st_uid,
             gid=stat.st_gid,
-            mode=cast(FileMode, stat.st_mode),
+            mode=mode,
             ctime=stat.st_ctime,
             mtime=stat.st_mtime,
             dev = stat.st_dev,
@@ -0,0 +1,6 @@
+from gitgo.backend.git.git import GitBackendBase, GitObjectStoreBackend
+
+__all__ =[
+    'GitBackendBase',
+    'GitObjectStoreBackend',
+]
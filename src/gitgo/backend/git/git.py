@@ -0,0 +1,72 @@
+### Git backend
+#
+# Backends that hand the work off to the git CLI.
+
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, cast, TYPE_CHECKING
+
+from gitgo.backend import BackendBase, ObjectStoreBackend
+from gitgo.lowlevel.catfile import CatFilePool
+
+if TYPE_CHECKING:
+    from gitgo.object import Oid, GitObj, ObjType
+
+class GitBackendBase(BackendBase):
+    ...
+
+class GitObjectStoreBackend(ObjectStoreBackend, GitBackendBase):
+    '''
+    An object store backend that reads objects through a pool of long-lived
+    ``git cat-file --batch`` coprocesses, rather than a process per object.
+    '''
+    path: Path
+    pool: CatFilePool
+
+    def __init__(self, path: Path, /, *, pool_size: int = 2, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.pool = CatFilePool(path, size=pool_size)
+
+    def read_header(self, oid: 'Oid') -> Optional[tuple['ObjType', int]]:
+        header = self.pool.header(oid)
+        if header is None:
+            return None
+        return cast('ObjType', header.type), header.size
+
+    def read(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        result = self.pool.read(oid)
+        if result is None:
+            return None
+        header, data = result
+        return cast('ObjType', header.type), data
+
+    def read_many(self, oids: Iterable['Oid']) -> Iterator[tuple['Oid', Optional[tuple['ObjType', bytes]]]]:
+        '''
+        All the requests are written to one ``cat-file --batch`` process,
+        and the objects read back as it answers.
+        '''
+        for oid, result in self.pool.read_many(oids):
+            if result is None:
+                yield oid, None  # type: ignore[misc]
+            else:
+                yield oid, (cast('ObjType', result[0].type), result[1])  # type: ignore[misc]
+
+    def fetch(self, oid: 'Oid') -> 'GitObj':
+        from gitgo.object import make_obj
+        header = self.read_header(oid)
+        if header is None:
+            raise KeyError(oid)
+        return make_obj(self.frontend, oid, header[0])
+
+    def store(self, oid: 'Oid', value: 'GitObj') -> None:
+        '''
+        Objects are content-addressed; we can only confirm that git already has it.
+        '''
+        if self.read_header(oid) is None:
+            raise ValueError(f'{oid} is not present in {self.path}')
+
+    def close(self) -> None:
+        '''
+        Shut down the ``cat-file`` coprocesses.
+        '''
+        self.pool.close()
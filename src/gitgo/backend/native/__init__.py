@@ -0,0 +1,22 @@
+from gitgo.backend.native.loose import LooseObjects
+from gitgo.backend.native.pack import Pack, PackIndex, PackedObjects, DeltaBaseCache, apply_delta
+from gitgo.backend.native.midx import MultiPackIndex
+from gitgo.backend.native.commitgraph import CommitGraph, GraphCommit
+from gitgo.backend.native.native import NativeBackendBase, NativeObjectStoreBackend, NativeWorktreeBackend, \
+    object_format
+
+__all__ =[
+    'LooseObjects',
+    'Pack',
+    'PackIndex',
+    'PackedObjects',
+    'DeltaBaseCache',
+    'apply_delta',
+    'MultiPackIndex',
+    'CommitGraph',
+    'GraphCommit',
+    'NativeBackendBase',
+    'NativeObjectStoreBackend',
+    'NativeWorktreeBackend',
+    'object_format',
+]
@@ -0,0 +1,397 @@
+'''
+The commit-graph: parents, root tree, commit time and generation number for
+each commit, read through memory maps without inflating commit objects.
+
+The graph is ``objects/info/commit-graph``, or a split chain of layers
+listed (base first) in ``objects/info/commit-graphs/commit-graph-chain``.
+Commits are numbered by their position across the whole chain: a layer's
+positions follow those of the layers below it.
+
+Generation numbers let ancestry walks stop early: a commit's generation is
+always greater than its parents', so nothing with a lower generation than A
+can have A as an ancestor. The corrected commit dates (GDA2) are used when
+every layer has them, and topological levels otherwise.
+'''
+
+from heapq import heappush, heappop
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional, TYPE_CHECKING
+import mmap
+import os
+import struct
+
+from gitgo.object import HASH_LENGTHS
+
+if TYPE_CHECKING:
+    from gitgo.object import Oid, HashAlgorithm
+
+SIGNATURE = b'CGPH'
+HASH_VERSIONS: dict[str, int] = {'sha1': 1, 'sha256': 2}
+
+NO_PARENT = 0x70000000
+EXTRA_EDGES = 0x80000000
+LAST_EDGE = 0x80000000
+GENERATION_OVERFLOW = 0x80000000
+
+_u32 = struct.Struct('>I')
+_u64 = struct.Struct('>Q')
+_cdat = struct.Struct('>III')
+
+class GraphCommit(NamedTuple):
+    '''
+    A commit, as recorded in the commit-graph.
+    '''
+    oid: 'Oid'
+    tree: 'Oid'
+    parents: tuple['Oid', ...]
+    time: int
+    generation: int
+
+class GraphLayer:
+    '''
+    One commit-graph file, memory-mapped.
+    '''
+    path: Path
+    count: int
+    base_count: int
+
+    def __init__(self, path: Path, /, *, algorithm: 'HashAlgorithm' = 'sha1', base_count: int = 0):
+        self.path = path
+        self.hash_len = hl = HASH_LENGTHS[algorithm]
+        self.base_count = base_count
+        with open(path, 'rb') as f:
+            self._mm = mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:4] != SIGNATURE or mm[4] != 1:
+            mm.close()
+            raise ValueError(f'{path} is not a version 1 commit-graph')
+        if mm[5] != HASH_VERSIONS[algorithm]:
+            mm.close()
+            raise ValueError(f'{path} does not use {algorithm}')
+        chunks: dict[bytes, int] = {}
+        for i in range(mm[6]):
+            entry = 8 + i * 12
+            chunks[mm[entry:entry + 4]] = _u64.unpack_from(mm, entry + 4)[0]
+        try:
+            self._fanout = struct.unpack_from('>256I', mm, chunks[b'OIDF'])
+            self._oids = chunks[b'OIDL']
+            self._data = chunks[b'CDAT']
+        except KeyError as ex:
+            mm.close()
+            raise ValueError(f'{path} is missing the {ex.args[0].decode()} chunk') from None
+        self._edges = chunks.get(b'EDGE')
+        self._gda2 = chunks.get(b'GDA2')
+        self._gdo2 = chunks.get(b'GDO2')
+        self.count = self._fanout[255]
+        self._stride = hl + 16
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.path}, count={self.count})'
+
+    @property
+    def has_corrected_dates(self) -> bool:
+        return self._gda2 is not None
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def find(self, oid: bytes) -> Optional[int]:
+        '''
+        Return the local position of the binary oid, or None.
+        '''
+        first = oid[0]
+        lo = self._fanout[first - 1] if first else 0
+        hi = self._fanout[first]
+        mm, base, hl = self._mm, self._oids, self.hash_len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * hl
+            probe = mm[start:start + hl]
+            if probe < oid:
+                lo = mid + 1
+            elif probe > oid:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def oid_at(self, i: int) -> bytes:
+        start = self._oids + i * self.hash_len
+        return self._mm[start:start + self.hash_len]
+
+    def tree_at(self, i: int) -> bytes:
+        start = self._data + i * self._stride
+        return self._mm[start:start + self.hash_len]
+
+    def parent_positions(self, i: int) -> list[int]:
+        p1, p2, _ = _cdat.unpack_from(self._mm, self._data + i * self._stride + self.hash_len)
+        if p1 == NO_PARENT:
+            return []
+        if p2 == NO_PARENT:
+            return [p1]
+        if not p2 & EXTRA_EDGES:
+            return [p1, p2]
+        if self._edges is None:
+            raise ValueError(f'{self.path} has an octopus merge but no EDGE chunk')
+        parents = [p1]
+        edge = self._edges + (p2 & ~EXTRA_EDGES) * 4
+        while True:
+            value = _u32.unpack_from(self._mm, edge)[0]
+            parents.append(value & ~LAST_EDGE)
+            if value & LAST_EDGE:
+                return parents
+            edge += 4
+
+    def time_and_level(self, i: int) -> tuple[int, int]:
+        _, _, word = _cdat.unpack_from(self._mm, self._data + i * self._stride + self.hash_len)
+        low = _u32.unpack_from(self._mm, self._data + i * self._stride + self.hash_len + 12)[0]
+        return ((word & 3) << 32) | low, word >> 2
+
+    def corrected_date(self, i: int, time: int) -> int:
+        offset = _u32.unpack_from(self._mm, self._gda2 + i * 4)[0]  # type: ignore[operator]
+        if offset & GENERATION_OVERFLOW:
+            if self._gdo2 is None:
+                raise ValueError(f'{self.path} has a generation overflow but no GDO2 chunk')
+            offset = _u64.unpack_from(self._mm, self._gdo2 + (offset & ~GENERATION_OVERFLOW) * 8)[0]
+        return time + offset
+
+class CommitGraph:
+    '''
+    A commit-graph, possibly split into a chain of layers.
+    '''
+    layers: list[GraphLayer]
+    algorithm: 'HashAlgorithm'
+
+    def __init__(self, layers: list[GraphLayer], /, *,
+                 algorithm: 'HashAlgorithm' = 'sha1',
+                 stamp: tuple[int, int] = (0, 0)):
+        self.layers = layers
+        self.algorithm = algorithm
+        self.stamp = stamp
+        self.corrected = all(layer.has_corrected_dates for layer in layers)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(layers={len(self.layers)}, commits={len(self)})'
+
+    def __len__(self) -> int:
+        return sum(layer.count for layer in self.layers)
+
+    @staticmethod
+    def stamp_of(objects: Path) -> tuple[int, int]:
+        '''
+        The modification times of the commit-graph files of an objects
+        directory (0 if absent), to tell when they have been rewritten.
+        '''
+        def mtime(path: Path) -> int:
+            try:
+                return os.stat(path).st_mtime_ns
+            except OSError:
+                return 0
+        info = objects / 'info'
+        return mtime(info / 'commit-graph'), mtime(info / 'commit-graphs' / 'commit-graph-chain')
+
+    @classmethod
+    def open(cls, objects: Path, /, *, algorithm: 'HashAlgorithm' = 'sha1') -> Optional['CommitGraph']:
+        '''
+        Load the commit-graph of an objects directory, or return None if it
+        has none. A split chain takes precedence over a single file.
+        '''
+        info = objects / 'info'
+        stamp = cls.stamp_of(objects)
+        chain = info / 'commit-graphs' / 'commit-graph-chain'
+        try:
+            hashes = [h for h in chain.read_text().split() if h]
+            paths = [info / 'commit-graphs' / f'graph-{h}.graph' for h in hashes]
+        except FileNotFoundError:
+            single = info / 'commit-graph'
+            if not single.exists():
+                return None
+            paths = [single]
+        layers: list[GraphLayer] = []
+        base = 0
+        try:
+            for path in paths:
+                layer = GraphLayer(path, algorithm=algorithm, base_count=base)
+                layers.append(layer)
+                base += layer.count
+        except BaseException:
+            for layer in layers:
+                layer.close()
+            raise
+        return cls(layers, algorithm=algorithm, stamp=stamp)
+
+    def is_stale(self, objects: Path) -> bool:
+        '''
+        Return True if the commit-graph files in objects have changed.
+        '''
+        return self.stamp_of(objects) != self.stamp
+
+    def close(self) -> None:
+        for layer in self.layers:
+            layer.close()
+
+    def _layer(self, pos: int) -> tuple[GraphLayer, int]:
+        for layer in reversed(self.layers):
+            if pos >= layer.base_count:
+                return layer, pos - layer.base_count
+        raise ValueError(f'Invalid commit-graph position {pos}')
+
+    def position(self, oid: 'Oid') -> Optional[int]:
+        '''
+        Return the position of the commit in the graph, or None if absent.
+        '''
+        boid = bytes.fromhex(oid)
+        for layer in self.layers:
+            i = layer.find(boid)
+            if i is not None:
+                return layer.base_count + i
+        return None
+
+    def __contains__(self, oid: 'Oid') -> bool:
+        return self.position(oid) is not None
+
+    def oid_at(self, pos: int) -> 'Oid':
+        layer, i = self._layer(pos)
+        return layer.oid_at(i).hex()  # type: ignore[return-value]
+
+    def parents_at(self, pos: int) -> list[int]:
+        layer, i = self._layer(pos)
+        return layer.parent_positions(i)
+
+    def generation_at(self, pos: int) -> int:
+        layer, i = self._layer(pos)
+        time, level = layer.time_and_level(i)
+        return layer.corrected_date(i, time) if self.corrected else level
+
+    def commit_at(self, pos: int) -> GraphCommit:
+        layer, i = self._layer(pos)
+        time, level = layer.time_and_level(i)
+        return GraphCommit(
+            layer.oid_at(i).hex(),  # type: ignore[arg-type]
+            layer.tree_at(i).hex(),  # type: ignore[arg-type]
+            tuple(self.oid_at(p) for p in layer.parent_positions(i)),
+            time,
+            layer.corrected_date(i, time) if self.corrected else level,
+        )
+
+    def get(self, oid: 'Oid') -> Optional[GraphCommit]:
+        pos = self.position(oid)
+        return self.commit_at(pos) if pos is not None else None
+
+    def __getitem__(self, oid: 'Oid') -> GraphCommit:
+        commit = self.get(oid)
+        if commit is None:
+            raise KeyError(oid)
+        return commit
+
+    def _positions(self, oids: Iterable['Oid']) -> list[int]:
+        positions = []
+        for oid in oids:
+            pos = self.position(oid)
+            if pos is None:
+                raise KeyError(oid)
+            positions.append(pos)
+        return positions
+
+    def _paint(self, one: int, twos: list[int], *, stale: bool) -> Iterator[tuple[int, int]]:
+        '''
+        Walk down from one and twos in decreasing generation order, yielding
+        (position, flags) for each commit once all its descendants in the
+        walk have been seen. Bit 1 of flags is set if it is reachable from
+        one, bit 2 if from any of twos.
+
+        Without stale, the walk goes on until every commit left is reachable
+        from both. With stale, the ancestors of a commit reachable from both
+        are marked STALE (bit 4) and not yielded, and the walk stops once
+        only stale commits are left, as in git's paint_down_to_common.
+        '''
+        done = 7 if stale else 3
+        flags: dict[int, int] = {}
+        heap: list[tuple[int, int]] = []
+        queued: set[int] = set()
+        # How many queued commits are not yet done: the walk stops at none,
+        # as git's queue_has_nonstale, without rescanning the heap.
+        pending = 0
+        def push(pos: int, flag: int) -> None:
+            nonlocal pending
+            old = flags.get(pos, 0)
+            new = old | flag
+            if new == old:
+                return
+            flags[pos] = new
+            if not old:
+                heappush(heap, (-self.generation_at(pos), pos))
+                queued.add(pos)
+                pending += new & done != done
+            elif pos in queued and old & done != done and new & done == done:
+                pending -= 1
+        push(one, 1)
+        for two in twos:
+            push(two, 2)
+        while pending:
+            _, pos = heappop(heap)
+            queued.discard(pos)
+            f = flags[pos]
+            pending -= f & done != done
+            if stale:
+                if f & 4:
+                    for parent in self.parents_at(pos):
+                        push(parent, f)
+                    continue
+                if f == 3:
+                    yield pos, f
+                    f |= 4
+            else:
+                yield pos, f
+            for parent in self.parents_at(pos):
+                push(parent, f)
+
+    def is_ancestor(self, ancestor: 'Oid', descendant: 'Oid') -> bool:
+        '''
+        Return True if ancestor is reachable from descendant (or is it).
+        '''
+        a, d = self._positions((ancestor, descendant))
+        if a == d:
+            return True
+        generation = self.generation_at(a)
+        seen = {d}
+        stack = [d]
+        while stack:
+            pos = stack.pop()
+            for parent in self.parents_at(pos):
+                if parent == a:
+                    return True
+                if parent not in seen and self.generation_at(parent) >= generation:
+                    seen.add(parent)
+                    stack.append(parent)
+        return False
+
+    def merge_bases(self, one: 'Oid', *others: 'Oid') -> list['Oid']:
+        '''
+        Return the best common ancestors of one and each of others, as
+        ``git merge-base`` (without ``--all``, take the first).
+        '''
+        o, *ts = self._positions((one, *others))
+        common = [pos for pos, _ in self._paint(o, ts, stale=True)]
+        # Keep only those that are not ancestors of another candidate, in
+        # decreasing generation order (as git does).
+        common.sort(key=lambda p: -self.generation_at(p))
+        result: list[int] = []
+        for pos in common:
+            oid = self.oid_at(pos)
+            if not any(self.is_ancestor(oid, self.oid_at(r)) for r in result):
+                result.append(pos)
+        return [self.oid_at(p) for p in result]
+
+    def ahead_behind(self, one: 'Oid', two: 'Oid') -> tuple[int, int]:
+        '''
+        Return the number of commits reachable from one but not two, and
+        from two but not one (as ``git rev-list --left-right --count``).
+        '''
+        o, t = self._positions((one, two))
+        ahead = behind = 0
+        for _, f in self._paint(o, [t], stale=False):
+            if f == 1:
+                ahead += 1
+            elif f == 2:
+                behind += 1
+        return ahead, behind
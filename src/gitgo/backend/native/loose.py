@@ -0,0 +1,143 @@
+'''
+Loose objects, read and written directly.
+
+A loose object is stored in ``objects/xx/yyyy...`` (the first two hex digits
+of its oid naming the directory), as the zlib-compressed bytes
+``<type> <size>\\0<contents>``.
+'''
+
+from pathlib import Path
+from typing import Iterator, Optional, TYPE_CHECKING
+import hashlib
+import os
+import tempfile
+import zlib
+
+if TYPE_CHECKING:
+    from gitgo.object import Oid, ObjType, HashAlgorithm
+
+OBJ_TYPES = frozenset((b'blob', b'tree', b'commit', b'tag'))
+
+# How much compressed input is read at a time when only the header is
+# wanted, and the longest header accepted.
+HEADER_CHUNK = 64
+
+def parse_header(header: bytes, oid: str) -> tuple['ObjType', int]:
+    type, _, size = header.partition(b' ')
+    if type not in OBJ_TYPES or not size.isdigit():
+        raise ValueError(f'Corrupt loose object header for {oid}: {header!r}')
+    return type.decode(), int(size)  # type: ignore[return-value]
+
+class LooseObjects:
+    '''
+    The loose objects in one objects directory.
+
+    :param algorithm: The repository's hash algorithm.
+    :param compression: The zlib level for objects written (git's
+        core.looseCompression defaults to 1).
+    '''
+    objects: Path
+    algorithm: 'HashAlgorithm'
+    compression: int
+
+    def __init__(self, objects: Path, /, *,
+                 algorithm: 'HashAlgorithm' = 'sha1',
+                 compression: int = 1):
+        self.objects = objects
+        self.algorithm = algorithm
+        self.compression = compression
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.objects}, algorithm={self.algorithm!r})'
+
+    def path(self, oid: 'Oid') -> Path:
+        return self.objects / oid[:2] / oid[2:]
+
+    def __contains__(self, oid: 'Oid') -> bool:
+        return os.path.exists(self.path(oid))
+
+    def read_header(self, oid: 'Oid') -> Optional[tuple['ObjType', int]]:
+        '''
+        Return the type and size of the object, or None if it is not a loose
+        object here. Only as much is inflated as is needed for the header.
+        '''
+        try:
+            f = open(self.path(oid), 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            d = zlib.decompressobj()
+            out = b''
+            while (end := out.find(b'\0')) < 0:
+                chunk = f.read(HEADER_CHUNK)
+                if not chunk:
+                    raise ValueError(f'Corrupt loose object {oid}: no header')
+                out += d.decompress(chunk)
+                if len(out) > HEADER_CHUNK and b'\0' not in out:
+                    raise ValueError(f'Corrupt loose object {oid}: header too long')
+        return parse_header(out[:end], oid)
+
+    def read(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        '''
+        Return the type and contents of the object, or None if it is not a
+        loose object here.
+        '''
+        try:
+            with open(self.path(oid), 'rb') as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            return None
+        end = raw.find(b'\0')
+        if end < 0:
+            raise ValueError(f'Corrupt loose object {oid}: no header')
+        type, size = parse_header(raw[:end], oid)
+        data = raw[end + 1:]
+        if len(data) != size:
+            raise ValueError(f'Corrupt loose object {oid}: expected {size} bytes, got {len(data)}')
+        return type, data
+
+    def write(self, type: 'ObjType', data: bytes) -> 'Oid':
+        '''
+        Write an object, if not already present, and return its oid. The file
+        is written under a temporary name and renamed into place.
+        '''
+        header = f'{type} {len(data)}\0'.encode()
+        h = hashlib.new(self.algorithm)
+        h.update(header)
+        h.update(data)
+        oid: 'Oid' = h.hexdigest()  # type: ignore[assignment]
+        path = self.path(oid)
+        if os.path.exists(path):
+            return oid
+        path.parent.mkdir(exist_ok=True)
+        c = zlib.compressobj(self.compression)
+        compressed = c.compress(header) + c.compress(data) + c.flush()
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='tmp_obj_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compressed)
+            os.chmod(tmp, 0o444)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        return oid
+
+    def __iter__(self) -> Iterator['Oid']:
+        '''
+        The oids of all the loose objects here.
+        '''
+        try:
+            dirs = os.scandir(self.objects)
+        except FileNotFoundError:
+            return
+        with dirs:
+            for d in dirs:
+                if len(d.name) != 2 or not d.is_dir():
+                    continue
+                for f in os.scandir(d.path):
+                    if not f.name.startswith('tmp'):
+                        yield d.name + f.name  # type: ignore[misc]
@@ -0,0 +1,121 @@
+'''
+The multi-pack-index: one sorted oid table across many packs.
+
+``objects/pack/multi-pack-index`` maps each oid to a pack (by its position
+in the sorted list of pack names) and an offset in that pack, so a lookup is
+one binary search rather than one per pack. Packs written since the MIDX
+was last written are not covered by it, and need their own ``.idx``.
+'''
+
+from pathlib import Path
+from typing import Optional, TYPE_CHECKING
+import mmap
+import os
+import struct
+
+from gitgo.object import HASH_LENGTHS
+
+if TYPE_CHECKING:
+    from gitgo.object import HashAlgorithm
+
+SIGNATURE = b'MIDX'
+HASH_VERSIONS: dict[str, int] = {'sha1': 1, 'sha256': 2}
+LARGE_OFFSET = 0x80000000
+
+_u32 = struct.Struct('>I')
+_u64 = struct.Struct('>Q')
+_ooff = struct.Struct('>II')
+
+def midx_checksum(path: Path, algorithm: 'HashAlgorithm' = 'sha1') -> Optional[bytes]:
+    '''
+    Return the trailing checksum of a MIDX file, or None if there is none.
+    The checksum changes whenever the MIDX is rewritten with new contents.
+    '''
+    hl = HASH_LENGTHS[algorithm]
+    try:
+        with open(path, 'rb') as f:
+            f.seek(-hl, os.SEEK_END)
+            return f.read(hl)
+    except (FileNotFoundError, OSError):
+        return None
+
+class MultiPackIndex:
+    '''
+    A memory-mapped multi-pack-index.
+    '''
+    path: Path
+    hash_len: int
+    count: int
+    pack_names: list[str]
+    checksum: bytes
+
+    def __init__(self, path: Path, /, *, algorithm: 'HashAlgorithm' = 'sha1'):
+        self.path = path
+        self.hash_len = HASH_LENGTHS[algorithm]
+        with open(path, 'rb') as f:
+            self._mm = mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if mm[:4] != SIGNATURE or mm[4] != 1:
+                raise ValueError(f'{path} is not a version 1 multi-pack-index')
+            if mm[5] != HASH_VERSIONS[algorithm]:
+                raise ValueError(f'{path} does not use {algorithm}')
+            chunk_count = mm[6]
+            pack_count = _u32.unpack_from(mm, 8)[0]
+            chunks: dict[bytes, int] = {}
+            for i in range(chunk_count):
+                entry = 12 + i * 12
+                chunks[mm[entry:entry + 4]] = _u64.unpack_from(mm, entry + 4)[0]
+            try:
+                names = chunks[b'PNAM']
+                self._fanout = struct.unpack_from('>256I', mm, chunks[b'OIDF'])
+                self._oids = chunks[b'OIDL']
+                self._offsets = chunks[b'OOFF']
+            except KeyError as ex:
+                raise ValueError(f'{path} is missing the {ex.args[0].decode()} chunk') from None
+            self._large = chunks.get(b'LOFF')
+            self.pack_names = []
+            pos = names
+            for _ in range(pack_count):
+                end = mm.find(b'\0', pos)
+                self.pack_names.append(mm[pos:end].decode())
+                pos = end + 1
+            self.count = self._fanout[255]
+            self.checksum = mm[len(mm) - self.hash_len:]
+        except BaseException:
+            mm.close()
+            raise
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.path}, packs={len(self.pack_names)}, count={self.count})'
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def find(self, oid: bytes) -> Optional[tuple[int, int]]:
+        '''
+        Return (pack number, offset) for the binary oid, or None. The pack
+        number indexes `pack_names`.
+        '''
+        first = oid[0]
+        lo = self._fanout[first - 1] if first else 0
+        hi = self._fanout[first]
+        mm, base, hl = self._mm, self._oids, self.hash_len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * hl
+            probe = mm[start:start + hl]
+            if probe < oid:
+                lo = mid + 1
+            elif probe > oid:
+                hi = mid
+            else:
+                pack, offset = _ooff.unpack_from(mm, self._offsets + mid * 8)
+                if offset & LARGE_OFFSET:
+                    if self._large is None:
+                        raise ValueError(f'{self.path} has a large offset but no LOFF chunk')
+                    offset = _u64.unpack_from(mm, self._large + (offset & ~LARGE_OFFSET) * 8)[0]
+                return pack, offset
+        return None
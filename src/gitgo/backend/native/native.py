@@ -0,0 +1,255 @@
+### Native backend
+#
+# Backends that read and write the repository's files directly, without
+# running git.
+
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, TYPE_CHECKING
+import io
+import os
+import re
+
+from gitgo.backend import BackendBase, ObjectStoreBackend, WorktreeBackend, TextModes, BinaryModes
+from gitgo.backend.native.loose import LooseObjects
+from gitgo.backend.native.commitgraph import CommitGraph
+from gitgo.backend.native.pack import Pack, PackedObjects, DeltaBaseCache, DEFAULT_CACHE_BYTES
+from gitgo.lowlevel.cache import find_git_dir, common_dir
+
+if TYPE_CHECKING:
+    from gitgo.object import Oid, GitObj, ObjType, HashAlgorithm, CommitInfo
+    from gitgo.worktree.watcher import WorktreeWatcher
+
+RE_SECTION = re.compile(r'^\s*\[\s*([A-Za-z0-9.-]+)\s*\]')
+RE_OBJECT_FORMAT = re.compile(r'^\s*objectformat\s*=\s*(\w+)', re.IGNORECASE)
+
+def object_format(git_dir: Path) -> 'HashAlgorithm':
+    '''
+    Return the repository's hash algorithm, from extensions.objectFormat in
+    its config (sha1 if not set).
+    '''
+    try:
+        lines = (common_dir(git_dir) / 'config').read_text().splitlines()
+    except FileNotFoundError:
+        return 'sha1'
+    section = ''
+    for line in lines:
+        if m := RE_SECTION.match(line):
+            section = m[1].lower()
+            line = line[m.end():]
+        if section == 'extensions' and (m := RE_OBJECT_FORMAT.match(line)):
+            algorithm = m[1].lower()
+            if algorithm not in ('sha1', 'sha256'):
+                raise ValueError(f'Unsupported object format {algorithm!r} in {git_dir}')
+            return algorithm  # type: ignore[return-value]
+    return 'sha1'
+
+def alternates(objects: Path) -> list[Path]:
+    '''
+    The alternate object directories listed in objects/info/alternates.
+    '''
+    try:
+        lines = (objects / 'info' / 'alternates').read_text().splitlines()
+    except FileNotFoundError:
+        return []
+    return [
+        (objects / line).resolve()
+        for line in map(str.strip, lines)
+        if line and not line.startswith('#')
+    ]
+
+class NativeBackendBase(BackendBase):
+    ...
+
+class NativeObjectStoreBackend(ObjectStoreBackend, NativeBackendBase):
+    '''
+    An object store backend that reads objects from packs and loose objects
+    itself, and writes loose objects, with mmap, zlib and hashlib. Objects
+    in alternates are found as well; new objects are always written to the
+    repository's own objects directory.
+
+    Commit parents and trees come from the commit-graph, when it has them,
+    and packed objects are looked up through the multi-pack-index, if any.
+
+    :param cache_bytes: The size of the delta base cache shared by all packs.
+    '''
+    path: Path
+    git_dir: Path
+    objects: Path
+    algorithm: 'HashAlgorithm'
+    loose: LooseObjects
+    cache: DeltaBaseCache
+    stores: list[PackedObjects | LooseObjects]
+
+    def __init__(self, path: Path, /, *,
+                 compression: int = 1,
+                 cache_bytes: int = DEFAULT_CACHE_BYTES,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        git_dir = find_git_dir(Path(path).resolve())
+        if git_dir is None:
+            raise ValueError(f'{path} is not in a git repository')
+        self.git_dir = git_dir
+        self.algorithm = object_format(git_dir)
+        self.objects = objects = Path(os.environ.get('GIT_OBJECT_DIRECTORY')
+                                      or common_dir(git_dir) / 'objects')
+        self._graph: Optional[CommitGraph] = None
+        self._graph_stamp: Optional[tuple[int, int]] = None
+        self.loose = LooseObjects(objects, algorithm=self.algorithm, compression=compression)
+        self.cache = DeltaBaseCache(cache_bytes)
+        # Packs first: most objects are packed, and a lookup there costs no syscall.
+        self.stores = []
+        for dir in (objects, *alternates(objects)):
+            self.stores.append(PackedObjects(dir, algorithm=self.algorithm,
+                                             cache=self.cache,
+                                             resolve=self.read))
+            self.stores.append(self.loose if dir == objects
+                               else LooseObjects(dir, algorithm=self.algorithm))
+
+    def read_header(self, oid: 'Oid') -> Optional[tuple['ObjType', int]]:
+        for store in self.stores:
+            header = store.read_header(oid)
+            if header is not None:
+                return header
+        return None
+
+    def read(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        for store in self.stores:
+            result = store.read(oid)
+            if result is not None:
+                return result
+        return None
+
+    def read_many(self, oids: Iterable['Oid']) -> Iterator[tuple['Oid', Optional[tuple['ObjType', bytes]]]]:
+        '''
+        The packed objects are read pack by pack, in offset order, so the
+        reads move forward through each pack (and a delta's base, usually
+        just before it, is in the delta base cache); then the rest.
+        '''
+        packed: list[tuple[Pack, int, 'Oid']] = []
+        rest: list['Oid'] = []
+        for oid in oids:
+            for store in self.stores:
+                if isinstance(store, PackedObjects):
+                    found = store.locate(oid)
+                    if found is not None:
+                        packed.append((found[0], found[1], oid))
+                        break
+            else:
+                rest.append(oid)
+        packed.sort(key=lambda p: (str(p[0].path), p[1]))
+        for pack, offset, oid in packed:
+            yield oid, pack.read_at(offset)
+        for oid in rest:
+            yield oid, self.read(oid)
+
+    @property
+    def commit_graph(self) -> Optional[CommitGraph]:
+        '''
+        The repository's commit-graph, or None if it has none.
+        '''
+        if self._graph_stamp is None:
+            self._load_graph()
+        return self._graph
+
+    def _load_graph(self) -> None:
+        # Any previous graph is left for the collector to unmap; other
+        # threads may still be using it.
+        self._graph_stamp = CommitGraph.stamp_of(self.objects)
+        self._graph = CommitGraph.open(self.objects, algorithm=self.algorithm)
+
+    def read_commit(self, oid: 'Oid') -> Optional['CommitInfo']:
+        from gitgo.object import CommitInfo
+        graph = self.commit_graph
+        found = graph.get(oid) if graph is not None else None
+        if found is None and CommitGraph.stamp_of(self.objects) != self._graph_stamp:
+            self._load_graph()
+            graph = self._graph
+            found = graph.get(oid) if graph is not None else None
+        if found is not None:
+            return CommitInfo(found.tree, found.parents, found.time)
+        return super().read_commit(oid)
+
+    def write_midx(self, **kwargs) -> None:
+        '''
+        Write (or refresh) the multi-pack-index for this repository's packs,
+        with ``git multi-pack-index write``, and pick it up. Keyword
+        arguments are passed to `git_multi_pack_index`.
+        '''
+        from gitgo.lowlevel import git_multi_pack_index, run_options
+        with run_options(cwd=self.path):
+            git_multi_pack_index('write', object_dir=self.objects, **kwargs)
+        self.stores[0].rescan()  # type: ignore[union-attr]
+
+    def write(self, type: 'ObjType', data: bytes) -> 'Oid':
+        return self.loose.write(type, data)
+
+    def fetch(self, oid: 'Oid') -> 'GitObj':
+        from gitgo.object import make_obj
+        header = self.read_header(oid)
+        if header is None:
+            raise KeyError(oid)
+        return make_obj(self.frontend, oid, header[0])
+
+    def store(self, oid: 'Oid', value: 'GitObj') -> None:
+        '''
+        Objects are content-addressed; use `write` to add contents. This only
+        confirms the object is present.
+        '''
+        if self.read_header(oid) is None:
+            raise ValueError(f'{oid} is not present in {self.path}')
+
+    def close(self) -> None:
+        '''
+        Unmap the packs and commit-graph, and drop the delta base cache.
+        '''
+        if self._graph is not None:
+            self._graph.close()
+            self._graph = None
+        self._graph_stamp = None
+        for store in self.stores:
+            if isinstance(store, PackedObjects):
+                store.close()
+        self.cache.clear()
+
+class NativeWorktreeBackend(WorktreeBackend, NativeBackendBase):
+    '''
+    A worktree backend that works on the files directly. `status` compares
+    an index with the files without running git; after `watch`, only the
+    files changed since the last status are looked at.
+    '''
+    def __init__(self, path: Path, /, **kwargs):
+        super().__init__(path, **kwargs)
+
+    def _open_text(self, path: Path, mode: TextModes, **kwargs) -> io.TextIOBase:
+        return open(self.path / path, mode, **kwargs)  # type: ignore[return-value]
+
+    def _open_binary(self, path: Path, mode: BinaryModes, **kwargs) -> io.BufferedIOBase:
+        return open(self.path / path, mode, **kwargs)  # type: ignore[return-value]
+
+    def _open_raw(self, path: Path, mode: str, **kwargs) -> io.IOBase:
+        return open(self.path / path, mode, buffering=0, **kwargs)  # type: ignore[return-value]
+
+    def watch(self, *, serve: bool = False) -> 'WorktreeWatcher':
+        '''
+        Start watching the worktree with inotify (Linux only).
+
+        :param serve: Also answer git's fsmonitor hook (see
+            `gitgo.worktree.watcher`).
+        '''
+        from gitgo.worktree.watcher import WorktreeWatcher
+        if self.watcher is None:
+            self.watcher = WorktreeWatcher(self.path)
+        self.watcher.start()
+        if serve:
+            self.watcher.serve()
+        return self.watcher
+
+    def close(self) -> None:
+        '''
+        Stop the watcher and the status threads.
+        '''
+        if self.watcher is not None:
+            self.watcher.close()
+        if self._status is not None:
+            self._status.close()
@@ -0,0 +1,583 @@
+'''
+Packed objects, read through memory maps.
+
+A pack (``objects/pack/pack-*.pack``) holds a sequence of zlib-compressed
+objects, some stored whole and some as deltas against another object in the
+pack: either by offset (OFS_DELTA) or by oid (REF_DELTA). Its ``.idx`` (v2)
+maps oids to offsets: a 256-entry fanout table by first byte, then the
+sorted oids, CRCs, and offsets.
+
+Resolving a delta chain means inflating every object in it, so the bases
+met along the way are kept in a `DeltaBaseCache`, a byte-bounded LRU shared
+by all the packs of a store.
+'''
+
+from collections import OrderedDict
+from functools import cached_property
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, TYPE_CHECKING
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from gitgo.backend.native.midx import MultiPackIndex, midx_checksum
+from gitgo.object import HASH_LENGTHS, decode_offset
+
+if TYPE_CHECKING:
+    from gitgo.object import Oid, ObjType, HashAlgorithm
+
+IDX_MAGIC = b'\377tOc'
+PACK_MAGIC = b'PACK'
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_NAMES: dict[int, 'ObjType'] = {
+    OBJ_COMMIT: 'commit',
+    OBJ_TREE: 'tree',
+    OBJ_BLOB: 'blob',
+    OBJ_TAG: 'tag',
+}
+
+TYPE_CODES: dict[str, int] = {name: code for code, name in TYPE_NAMES.items()}
+
+# Compressed bytes fed to zlib at a time.
+WINDOW = 64 * 1024
+
+# git's default core.deltaBaseCacheLimit.
+DEFAULT_CACHE_BYTES = 96 * 1024 * 1024
+
+_u32 = struct.Struct('>I')
+_u64 = struct.Struct('>Q')
+
+def _map(path: Path) -> mmap.mmap:
+    with open(path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+class PackIndex:
+    '''
+    A memory-mapped version 2 pack index.
+    '''
+    path: Path
+    hash_len: int
+    count: int
+
+    def __init__(self, path: Path, /, *, algorithm: 'HashAlgorithm' = 'sha1'):
+        self.path = path
+        self.hash_len = HASH_LENGTHS[algorithm]
+        self._mm = mm = _map(path)
+        if mm[:4] != IDX_MAGIC or _u32.unpack_from(mm, 4)[0] != 2:
+            mm.close()
+            raise ValueError(f'{path} is not a version 2 pack index')
+        self._fanout = struct.unpack_from('>256I', mm, 8)
+        self.count = n = self._fanout[255]
+        self._oids = 8 + 256 * 4
+        self._offsets = self._oids + n * (self.hash_len + 4)
+        self._large = self._offsets + n * 4
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.path}, count={self.count})'
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def oid_at(self, i: int) -> bytes:
+        start = self._oids + i * self.hash_len
+        return self._mm[start:start + self.hash_len]
+
+    def offset_at(self, i: int) -> int:
+        offset = _u32.unpack_from(self._mm, self._offsets + i * 4)[0]
+        if offset & 0x80000000:
+            offset = _u64.unpack_from(self._mm, self._large + (offset & 0x7fffffff) * 8)[0]
+        return offset
+
+    def find(self, oid: bytes) -> Optional[int]:
+        '''
+        Return the pack offset of the object with the given binary oid, or
+        None. Searches only the fanout bucket for the first byte.
+        '''
+        first = oid[0]
+        lo = self._fanout[first - 1] if first else 0
+        hi = self._fanout[first]
+        mm, base, hl = self._mm, self._oids, self.hash_len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * hl
+            probe = mm[start:start + hl]
+            if probe < oid:
+                lo = mid + 1
+            elif probe > oid:
+                hi = mid
+            else:
+                return self.offset_at(mid)
+        return None
+
+    def __iter__(self) -> Iterator[bytes]:
+        return (self.oid_at(i) for i in range(self.count))
+
+class DeltaBaseCache:
+    '''
+    An LRU cache of inflated delta bases, keyed by (pack, offset), bounded
+    by the total size of the cached objects.
+    '''
+    max_bytes: int
+    size: int
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[tuple['Pack', int], tuple['ObjType', bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(max_bytes={self.max_bytes}, size={self.size}, entries={len(self._entries)})'
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, pack: 'Pack', offset: int) -> Optional[tuple['ObjType', bytes]]:
+        with self._lock:
+            entry = self._entries.get((pack, offset))
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end((pack, offset))
+            return entry
+
+    def put(self, pack: 'Pack', offset: int, type: 'ObjType', data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            key = (pack, offset)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (type, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+def write_pack(objects: Iterable[tuple['ObjType', bytes]], /, *,
+               algorithm: 'HashAlgorithm' = 'sha1',
+               compression: int = 1) -> bytes:
+    '''
+    A version 2 pack of the objects, each stored whole (no deltas), as
+    ``git index-pack --stdin`` and ``git unpack-objects`` take it.
+    '''
+    objects = list(objects)
+    out = bytearray(PACK_MAGIC + _u32.pack(2) + _u32.pack(len(objects)))
+    for type, data in objects:
+        code = TYPE_CODES.get(type)
+        if code is None:
+            raise ValueError(f'Cannot pack an object of type {type!r}')
+        size = len(data)
+        byte = code << 4 | size & 0x0f
+        size >>= 4
+        while size:
+            out.append(byte | 0x80)
+            byte = size & 0x7f
+            size >>= 7
+        out.append(byte)
+        out += zlib.compress(data, compression)
+    out += hashlib.new(algorithm, out).digest()
+    return bytes(out)
+
+def _varint(data: bytes, pos: int) -> tuple[int, int]:
+    '''
+    Decode a delta header size (little-endian base 128) at pos.
+    '''
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+def delta_sizes(delta: bytes) -> tuple[int, int, int]:
+    '''
+    Return the base size, result size, and the position of the first
+    instruction of a delta.
+    '''
+    base_size, pos = _varint(delta, 0)
+    result_size, pos = _varint(delta, pos)
+    return base_size, result_size, pos
+
+def apply_delta(base: bytes, delta: bytes) -> bytes:
+    '''
+    Apply a git delta to base.
+    '''
+    base_size, result_size, pos = delta_sizes(delta)
+    if base_size != len(base):
+        raise ValueError(f'Delta base size mismatch: expected {base_size}, got {len(base)}')
+    out = bytearray()
+    end = len(delta)
+    while pos < end:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            out += base[offset:offset + (size or 0x10000)]
+        elif op:
+            out += delta[pos:pos + op]
+            pos += op
+        else:
+            raise ValueError('Invalid delta instruction 0')
+    if len(out) != result_size:
+        raise ValueError(f'Delta result size mismatch: expected {result_size}, got {len(out)}')
+    return bytes(out)
+
+# Finds an object outside this pack, for REF_DELTA bases: (type, data) or None.
+BaseResolver = Callable[['Oid'], Optional[tuple['ObjType', bytes]]]
+
+class Pack:
+    '''
+    A memory-mapped pack and its index. The index is only mapped when
+    first needed, which it is not for lookups through a multi-pack-index.
+
+    :param resolve: Used to find REF_DELTA bases that are not in this pack.
+    '''
+    path: Path
+    hash_len: int
+    cache: DeltaBaseCache
+
+    def __init__(self, path: Path, /, *,
+                 algorithm: 'HashAlgorithm' = 'sha1',
+                 cache: Optional[DeltaBaseCache] = None,
+                 resolve: Optional[BaseResolver] = None):
+        self.path = path
+        self.algorithm = algorithm
+        self.hash_len = HASH_LENGTHS[algorithm]
+        self.cache = cache if cache is not None else DeltaBaseCache()
+        self.resolve = resolve
+        self._mm = mm = _map(path)
+        if mm[:4] != PACK_MAGIC or _u32.unpack_from(mm, 4)[0] not in (2, 3):
+            mm.close()
+            raise ValueError(f'{path} is not a pack')
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.path})'
+
+    @cached_property
+    def index(self) -> PackIndex:
+        return PackIndex(self.path.with_suffix('.idx'), algorithm=self.algorithm)
+
+    def close(self) -> None:
+        self._mm.close()
+        if 'index' in self.__dict__:
+            self.index.close()
+
+    def find(self, oid: 'Oid') -> Optional[int]:
+        return self.index.find(bytes.fromhex(oid))
+
+    def _entry(self, offset: int) -> tuple[int, int, int]:
+        '''
+        Parse the object header at offset: (type, size, position of the data).
+        '''
+        mm = self._mm
+        byte = mm[offset]
+        type = (byte >> 4) & 7
+        size = byte & 0x0f
+        shift = 4
+        pos = offset + 1
+        while byte & 0x80:
+            byte = mm[pos]
+            pos += 1
+            size |= (byte & 0x7f) << shift
+            shift += 7
+        return type, size, pos
+
+    def _base(self, type: int, offset: int, pos: int) -> tuple[Optional[int], Optional['Oid'], int]:
+        '''
+        For a delta at offset, with data at pos, return (base offset, None,
+        pos) for OFS_DELTA, or (None, base oid, pos) for REF_DELTA, with pos
+        moved past the base reference.
+        '''
+        mm = self._mm
+        if type == OBJ_OFS_DELTA:
+            distance, pos = decode_offset(mm, pos)  # type: ignore[arg-type]
+            return offset - distance, None, pos
+        hl = self.hash_len
+        oid: 'Oid' = mm[pos:pos + hl].hex()  # type: ignore[assignment]
+        return None, oid, pos + hl
+
+    def _inflate(self, pos: int, size: int, limit: Optional[int] = None) -> bytes:
+        '''
+        Inflate the zlib stream at pos, which should produce size bytes. With
+        limit, stop once at least that much has been produced.
+        '''
+        d = zlib.decompressobj()
+        mm = self._mm
+        parts: list[bytes] = []
+        produced = 0
+        window = min(WINDOW, size + 64) if limit is None else 64
+        while not d.eof:
+            chunk = mm[pos:pos + window]
+            if not chunk:
+                raise ValueError(f'Truncated object in {self.path}')
+            pos += len(chunk)
+            part = d.decompress(chunk)
+            parts.append(part)
+            produced += len(part)
+            if limit is not None and produced >= limit:
+                return b''.join(parts)
+        data = b''.join(parts)
+        if len(data) != size:
+            raise ValueError(f'Corrupt object in {self.path}: expected {size} bytes, got {len(data)}')
+        return data
+
+    def _lookup_base(self, oid: 'Oid') -> tuple[Optional[int], Optional[tuple['ObjType', bytes]]]:
+        offset = self.find(oid)
+        if offset is not None:
+            return offset, None
+        found = self.resolve(oid) if self.resolve is not None else None
+        if found is None:
+            raise ValueError(f'Missing delta base {oid} for {self.path}')
+        return None, found
+
+    def read_header_at(self, offset: int) -> tuple['ObjType', int]:
+        '''
+        Return the type and size of the object at offset. For a delta, only
+        the start of each delta in the chain is inflated.
+        '''
+        type, size, pos = self._entry(offset)
+        if type in TYPE_NAMES:
+            return TYPE_NAMES[type], size
+        base_offset, base_oid, pos = self._base(type, offset, pos)
+        _, result_size, _ = delta_sizes(self._inflate(pos, size, limit=20))
+        while True:
+            if base_offset is None:
+                base_offset, found = self._lookup_base(base_oid)  # type: ignore[arg-type]
+                if found is not None:
+                    return found[0], result_size
+            type, _, pos = self._entry(base_offset)
+            if type in TYPE_NAMES:
+                return TYPE_NAMES[type], result_size
+            base_offset, base_oid, pos = self._base(type, base_offset, pos)
+
+    def read_at(self, offset: int) -> tuple['ObjType', bytes]:
+        '''
+        Return the type and contents of the object at offset, resolving deltas.
+        '''
+        # Walk down the chain until a whole object (or a cached base) is found.
+        deltas: list[tuple[int, bytes]] = []
+        current = offset
+        while True:
+            if deltas:
+                cached = self.cache.get(self, current)
+                if cached is not None:
+                    base_type, data = cached
+                    break
+            type, size, pos = self._entry(current)
+            if type in TYPE_NAMES:
+                base_type, data = TYPE_NAMES[type], self._inflate(pos, size)
+                if deltas:
+                    self.cache.put(self, current, base_type, data)
+                break
+            base_offset, base_oid, pos = self._base(type, current, pos)
+            deltas.append((current, self._inflate(pos, size)))
+            if base_offset is None:
+                base_offset, found = self._lookup_base(base_oid)  # type: ignore[arg-type]
+                if found is not None:
+                    base_type, data = found
+                    break
+            current = base_offset
+        # Apply the deltas back up, caching the intermediate bases.
+        for i in range(len(deltas) - 1, -1, -1):
+            at, delta = deltas[i]
+            data = apply_delta(data, delta)
+            if i:
+                self.cache.put(self, at, base_type, data)
+        return base_type, data
+
+    def read_header(self, oid: 'Oid') -> Optional[tuple['ObjType', int]]:
+        offset = self.find(oid)
+        return self.read_header_at(offset) if offset is not None else None
+
+    def read(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        offset = self.find(oid)
+        return self.read_at(offset) if offset is not None else None
+
+class _Layout(NamedTuple):
+    '''
+    The packs of a directory, as of one scan; replaced as a whole so that
+    readers never see a mixture of two scans.
+    '''
+    packs: tuple[Pack, ...]
+    midx: Optional[MultiPackIndex]
+    # The Pack for each of the MIDX's pack names (None if it has gone).
+    midx_packs: tuple[Optional[Pack], ...]
+    # Packs the MIDX does not cover (all of them, without a MIDX).
+    uncovered: tuple[Pack, ...]
+
+_EMPTY = _Layout((), None, (), ())
+
+class PackedObjects:
+    '''
+    All the packs in an objects directory. If there is a multi-pack-index,
+    it is searched first, and only the packs it does not cover are probed
+    one by one.
+
+    The pack directory is rescanned when an object is not found and the
+    directory has changed, so packs added by fetch or gc, and a rewritten
+    MIDX (detected by its checksum), are picked up.
+    '''
+    objects: Path
+    algorithm: 'HashAlgorithm'
+    cache: DeltaBaseCache
+
+    def __init__(self, objects: Path, /, *,
+                 algorithm: 'HashAlgorithm' = 'sha1',
+                 cache: Optional[DeltaBaseCache] = None,
+                 resolve: Optional[BaseResolver] = None):
+        self.objects = objects
+        self.algorithm = algorithm
+        self.cache = cache if cache is not None else DeltaBaseCache()
+        self.resolve = resolve
+        self._layout = _EMPTY
+        self._scanned: Optional[int] = None
+        self._lock = threading.Lock()
+        self.rescan()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.objects}, packs={len(self.packs)})'
+
+    @property
+    def packs(self) -> tuple[Pack, ...]:
+        return self._layout.packs
+
+    @property
+    def midx(self) -> Optional[MultiPackIndex]:
+        return self._layout.midx
+
+    def _mtime(self) -> int:
+        try:
+            return os.stat(self.objects / 'pack').st_mtime_ns
+        except OSError:
+            return 0
+
+    def rescan(self) -> bool:
+        '''
+        Pick up added packs, drop removed ones, and reload the MIDX if its
+        checksum has changed, if the pack directory has changed. Returns
+        True if it had.
+        '''
+        with self._lock:
+            mtime = self._mtime()
+            if mtime == self._scanned:
+                return False
+            self._scanned = mtime
+            old = self._layout
+            known = {p.path: p for p in old.packs}
+            packs: list[Pack] = []
+            pack_dir = self.objects / 'pack'
+            paths = sorted(pack_dir.glob('pack-*.pack'), key=_newest_first) if pack_dir.is_dir() else []
+            for path in paths:
+                pack = known.pop(path, None)
+                if pack is None:
+                    if not path.with_suffix('.idx').exists():
+                        continue
+                    pack = Pack(path, algorithm=self.algorithm, cache=self.cache, resolve=self._resolve)
+                packs.append(pack)
+            midx = old.midx
+            midx_path = pack_dir / 'multi-pack-index'
+            checksum = midx_checksum(midx_path, self.algorithm)
+            if checksum != (midx.checksum if midx is not None else None):
+                # The old one is left for the collector; readers may still hold it.
+                midx = MultiPackIndex(midx_path, algorithm=self.algorithm) if checksum else None
+            if midx is not None:
+                by_name = {p.path.with_suffix('.idx').name: p for p in packs}
+                midx_packs = tuple(by_name.get(name) for name in midx.pack_names)
+                covered = set(midx_packs)
+                uncovered = tuple(p for p in packs if p not in covered)
+            else:
+                midx_packs = ()
+                uncovered = tuple(packs)
+            # Removed packs are not closed, but left for the collector, like
+            # the old MIDX: readers in other threads may still hold them.
+            self._layout = _Layout(tuple(packs), midx, midx_packs, uncovered)
+            return True
+
+    def _search(self, oid: 'Oid') -> Optional[tuple[Pack, int]]:
+        layout = self._layout
+        boid = bytes.fromhex(oid)
+        if layout.midx is not None:
+            found = layout.midx.find(boid)
+            if found is not None:
+                pack = layout.midx_packs[found[0]]
+                if pack is not None:
+                    return pack, found[1]
+        for pack in layout.uncovered:
+            offset = pack.index.find(boid)
+            if offset is not None:
+                return pack, offset
+        return None
+
+    def _resolve(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        found = self._search(oid)
+        if found is not None:
+            return found[0].read_at(found[1])
+        return self.resolve(oid) if self.resolve is not None else None
+
+    def locate(self, oid: 'Oid') -> Optional[tuple[Pack, int]]:
+        '''
+        Return the pack containing the object, and its offset, or None.
+        '''
+        found = self._search(oid)
+        if found is None and self.rescan():
+            found = self._search(oid)
+        return found
+
+    def __contains__(self, oid: 'Oid') -> bool:
+        return self.locate(oid) is not None
+
+    def read_header(self, oid: 'Oid') -> Optional[tuple['ObjType', int]]:
+        found = self.locate(oid)
+        return found[0].read_header_at(found[1]) if found is not None else None
+
+    def read(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        found = self.locate(oid)
+        return found[0].read_at(found[1]) if found is not None else None
+
+    def close(self) -> None:
+        with self._lock:
+            layout, self._layout = self._layout, _EMPTY
+            for pack in layout.packs:
+                pack.close()
+            if layout.midx is not None:
+                layout.midx.close()
+            self._scanned = None
+
+def _newest_first(path: Path) -> float:
+    # Recent packs are the likeliest to hold recently used objects.
+    try:
+        return -path.stat().st_mtime
+    except OSError:
+        return 0.0
@@ -0,0 +1,13 @@
+from gitgo.backend.script.script import Script, ScriptCommand, ScriptBackendBase, ScriptBackend, \
+    ScriptRepoBackend, ScriptObjectStoreBackend, ScriptIndexBackend, ScriptWorktreeBackend
+
+__all__ =[
+    'Script',
+    'ScriptCommand',
+    'ScriptBackendBase',
+    'ScriptBackend',
+    'ScriptRepoBackend',
+    'ScriptObjectStoreBackend',
+    'ScriptIndexBackend',
+    'ScriptWorktreeBackend',
+]
@@ -0,0 +1,343 @@
+### Script backend
+#
+# Backends that record the operations requested by the frontend, rather than
+# performing them, so they can be run later as a handful of batched git
+# commands.
+
+from pathlib import Path
+from typing import NamedTuple, Optional, TYPE_CHECKING
+import io
+
+from gitgo.backend import Backend, BackendBase, RepoBackend, ObjectStoreBackend, WorktreeBackend, IndexBackend, \
+    TextModes, BinaryModes
+from gitgo.lowlevel.cmdargs import CmdResult, BytesCmdResult
+from gitgo.lowlevel.lowlevel import git
+
+if TYPE_CHECKING:
+    from gitgo.index import IndexEntry
+    from gitgo.object import Oid, GitObj, ObjType, HashAlgorithm
+
+# git's default transfer.unpackLimit: smaller packs are exploded into loose
+# objects, larger ones kept.
+UNPACK_LIMIT = 100
+
+class ScriptCommand(NamedTuple):
+    '''
+    One git command in a script, with the data to feed it on stdin.
+    '''
+    args: tuple[str, ...]
+    input: Optional[bytes]
+
+class Script:
+    '''
+    A record of operations on a repository, to be performed as a batch:
+
+    - blobs are written with a single ``git fast-import``
+    - other objects as a single pack, through ``git unpack-objects`` (or
+      ``git index-pack``, for UNPACK_LIMIT objects or more)
+    - index changes with a single ``git update-index -z --index-info``
+    - ref changes with a single ``git update-ref -z --stdin`` transaction
+    - worktree files are written directly, before the rest
+
+    Objects are hashed as they are recorded, so their OIDs are available
+    immediately.
+    '''
+    path: Path
+    algorithm: 'HashAlgorithm'
+
+    def __init__(self, path: Path, /, *, algorithm: 'HashAlgorithm' = 'sha1'):
+        self.path = path
+        self.algorithm = algorithm
+        self.clear()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.path}, operations={len(self)})'
+
+    def __len__(self) -> int:
+        return len(self._objects) + len(self._index) + len(self._refs) + len(self._files)
+
+    def clear(self) -> None:
+        '''
+        Discard all recorded operations.
+        '''
+        self._objects: dict['Oid', tuple['ObjType', bytes]] = {}
+        self._index: list[bytes] = []
+        self._refs: list[bytes] = []
+        self._files: dict[Path, Optional[bytes]] = {}
+
+    def write_object(self, type: 'ObjType', data: bytes) -> 'Oid':
+        '''
+        Record an object to be written, returning its OID.
+        '''
+        from gitgo.object import hash_object
+        oid = hash_object(type, data, self.algorithm)
+        self._objects.setdefault(oid, (type, data))
+        return oid
+
+    def pending_object(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        '''
+        Return the type and contents of an object recorded but not yet written.
+        '''
+        return self._objects.get(oid)
+
+    def update_index(self, path: str, oid: 'Oid', mode: int, stage: int = 0) -> None:
+        '''
+        Record an index entry to be added or replaced. The mode is the git
+        mode, e.g. 0o100644.
+        '''
+        self._index.append(f'{mode:o} {oid} {stage}\t{path}\0'.encode())
+
+    def remove_from_index(self, path: str) -> None:
+        '''
+        Record the removal of a path from the index.
+        '''
+        zero = '0' * (64 if self.algorithm == 'sha256' else 40)
+        self._index.append(f'0 {zero}\t{path}\0'.encode())
+
+    def update_ref(self, ref: str, new: 'Oid', old: Optional['Oid'] = None) -> None:
+        '''
+        Record a ref update. If old is given, the update only happens if the
+        ref currently has that value.
+        '''
+        self._refs.append(f'update {ref}\0{new}\0{old or ""}\0'.encode())
+
+    def create_ref(self, ref: str, new: 'Oid') -> None:
+        '''
+        Record the creation of a ref, which must not already exist.
+        '''
+        self._refs.append(f'create {ref}\0{new}\0'.encode())
+
+    def delete_ref(self, ref: str, old: Optional['Oid'] = None) -> None:
+        '''
+        Record the deletion of a ref.
+        '''
+        self._refs.append(f'delete {ref}\0{old or ""}\0'.encode())
+
+    def write_file(self, path: Path, data: Optional[bytes]) -> None:
+        '''
+        Record the contents of a worktree file, relative to the worktree,
+        or its removal if data is None.
+        '''
+        self._files[path] = data
+
+    def commands(self) -> list[ScriptCommand]:
+        '''
+        Return the git commands that perform the recorded operations, in order.
+        Worktree files are not included; see `apply_files`.
+        '''
+        cmds: list[ScriptCommand] = []
+        blobs = [data for type, data in self._objects.values() if type == 'blob']
+        if blobs:
+            stream = b''.join(
+                b'blob\ndata %d\n%s\n' % (len(data), data)
+                for data in blobs
+            )
+            cmds.append(ScriptCommand(('fast-import', '--quiet'), stream))
+        others = [(type, data) for type, data in self._objects.values() if type != 'blob']
+        if others:
+            from gitgo.backend.native.pack import write_pack
+            pack = write_pack(others, algorithm=self.algorithm)
+            if len(others) < UNPACK_LIMIT:
+                cmds.append(ScriptCommand(('unpack-objects', '-q'), pack))
+            else:
+                cmds.append(ScriptCommand(('index-pack', '--stdin'), pack))
+        if self._index:
+            cmds.append(ScriptCommand(('update-index', '-z', '--index-info'), b''.join(self._index)))
+        if self._refs:
+            cmds.append(ScriptCommand(('update-ref', '-z', '--stdin'), b''.join(self._refs)))
+        return cmds
+
+    def apply_files(self) -> None:
+        '''
+        Write (or remove) the recorded worktree files.
+        '''
+        for path, data in self._files.items():
+            full = self.path / path
+            if data is None:
+                full.unlink(missing_ok=True)
+            else:
+                full.parent.mkdir(parents=True, exist_ok=True)
+                full.write_bytes(data)
+
+    def run(self) -> list[CmdResult | BytesCmdResult]:
+        '''
+        Perform the recorded operations, and clear them.
+        '''
+        self.apply_files()
+        results = [
+            git(*cmd.args, input=cmd.input, text=False, cwd=self.path)
+            for cmd in self.commands()
+        ]
+        self.clear()
+        return results
+
+class ScriptBackendBase(BackendBase):
+    script: Script
+
+class ScriptBackend(Backend, ScriptBackendBase):
+    '''
+    A backend whose component backends all record into one shared `Script`.
+
+    :param base: An optional object store backend to read existing objects from.
+    :param algorithm: The repository's hash algorithm; by default, read from
+        its config.
+    '''
+    def __init__(self, path: Path, /, *,
+                 base: Optional[ObjectStoreBackend] = None,
+                 algorithm: Optional['HashAlgorithm'] = None,
+                 **kwargs):
+        super().__init__(**kwargs)
+        if algorithm is None:
+            from gitgo.backend.native import object_format
+            from gitgo.lowlevel.cache import find_git_dir
+            git_dir = find_git_dir(Path(path).resolve())
+            algorithm = object_format(git_dir) if git_dir is not None else 'sha1'
+        self.script = Script(path, algorithm=algorithm)
+        self.base = base
+
+    def make_repo(self, /, **kwargs) -> RepoBackend:
+        return ScriptRepoBackend(self.script, self.make_object_store_backend(), **kwargs)
+
+    def make_worktree(self, path: Path, /, **kwargs) -> WorktreeBackend:
+        return ScriptWorktreeBackend(self.script, path, **kwargs)
+
+    def make_object_store(self, /, **kwargs) -> ObjectStoreBackend:
+        return self.make_object_store_backend(**kwargs)
+
+    def make_object_store_backend(self, /, **kwargs) -> 'ScriptObjectStoreBackend':
+        return ScriptObjectStoreBackend(self.script, base=self.base, **kwargs)
+
+    def make_index(self, **kwargs) -> IndexBackend:
+        return ScriptIndexBackend(self.script, **kwargs)
+
+    def run(self) -> list[CmdResult | BytesCmdResult]:
+        '''
+        Perform the recorded operations.
+        '''
+        return self.script.run()
+
+class ScriptRepoBackend(RepoBackend, ScriptBackendBase):
+    def __init__(self, script: Script, object_store: 'ScriptObjectStoreBackend', /, **kwargs):
+        super().__init__()
+        self.script = script
+        self._object_store = object_store
+
+    @property
+    def object_store(self) -> ObjectStoreBackend:
+        return self._object_store
+
+    def update_ref(self, ref: str, new: 'Oid', old: Optional['Oid'] = None) -> None:
+        self.script.update_ref(ref, new, old)
+
+    def create_ref(self, ref: str, new: 'Oid') -> None:
+        self.script.create_ref(ref, new)
+
+    def delete_ref(self, ref: str, old: Optional['Oid'] = None) -> None:
+        self.script.delete_ref(ref, old)
+
+class ScriptObjectStoreBackend(ObjectStoreBackend, ScriptBackendBase):
+    '''
+    Records object writes. Reads see pending writes first, then the base
+    backend, if any.
+    '''
+    base: Optional[ObjectStoreBackend]
+
+    def __init__(self, script: Script, /, *, base: Optional[ObjectStoreBackend] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.script = script
+        self.base = base
+
+    def write(self, type: 'ObjType', data: bytes) -> 'Oid':
+        return self.script.write_object(type, data)
+
+    def read(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        pending = self.script.pending_object(oid)
+        if pending is not None:
+            return pending
+        return self.base.read(oid) if self.base else None
+
+    def read_header(self, oid: 'Oid') -> Optional[tuple['ObjType', int]]:
+        pending = self.script.pending_object(oid)
+        if pending is not None:
+            return pending[0], len(pending[1])
+        return self.base.read_header(oid) if self.base else None
+
+    def fetch(self, oid: 'Oid') -> 'GitObj':
+        from gitgo.object import make_obj
+        header = self.read_header(oid)
+        if header is None:
+            raise KeyError(oid)
+        return make_obj(self.frontend, oid, header[0])
+
+    def store(self, oid: 'Oid', value: 'GitObj') -> None:
+        if self.read_header(oid) is None:
+            raise ValueError(f'{oid} has no recorded contents')
+
+class ScriptIndexBackend(IndexBackend, ScriptBackendBase):
+    '''
+    Records index updates.
+    '''
+    def __init__(self, script: Script, /, **kwargs):
+        super().__init__(**kwargs)
+        self.script = script
+        self._entries: dict['Oid', 'IndexEntry'] = {}
+
+    def fetch(self, oid: 'Oid') -> 'IndexEntry':
+        return self._entries[oid]
+
+    def store(self, oid: 'Oid', value: 'IndexEntry', stage: int = 0) -> None:
+        from gitgo.index import git_mode
+        self._entries[oid] = value
+        self.script.update_index(value.name, oid, git_mode(value.type, value.mode), stage)
+
+    def remove(self, path: str) -> None:
+        self.script.remove_from_index(path)
+
+class _RecordingBuffer(io.BytesIO):
+    '''
+    A buffer that records its contents into the script when closed.
+    '''
+    def __init__(self, script: Script, path: Path, initial: bytes = b''):
+        super().__init__(initial)
+        self.script = script
+        self.path = path
+        if initial:
+            self.seek(0, io.SEEK_END)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.script.write_file(self.path, self.getvalue())
+        super().close()
+
+class ScriptWorktreeBackend(WorktreeBackend, ScriptBackendBase):
+    '''
+    Records worktree file writes. Reads see pending writes first, then
+    the files on disk.
+    '''
+    def __init__(self, script: Script, path: Path, /, **kwargs):
+        super().__init__(path, **kwargs)
+        self.script = script
+
+    def stat(self, path: Path, **kwargs) -> 'IndexEntry':
+        kwargs.setdefault('algorithm', self.script.algorithm)
+        return super().stat(self.path / path, **kwargs)
+
+    def _current(self, path: Path) -> bytes:
+        if path in self.script._files:
+            return self.script._files[path] or b''
+        full = self.path / path
+        return full.read_bytes() if full.exists() else b''
+
+    def _open_binary(self, path: Path, mode: BinaryModes, **kwargs) -> io.BufferedIOBase:
+        if mode.startswith('r') and '+' not in mode:
+            return io.BytesIO(self._current(path))
+        initial = self._current(path) if mode.startswith('a') or '+' in mode else b''
+        return _RecordingBuffer(self.script, path, initial)
+
+    def _open_text(self, path: Path, mode: TextModes, **kwargs) -> io.TextIOBase:
+        bmode = mode.replace('t', '') + 'b'
+        buffer = self._open_binary(path, bmode, **kwargs)  # type: ignore[arg-type]
+        return io.TextIOWrapper(buffer, encoding=kwargs.get('encoding', 'utf-8'))  # type: ignore[arg-type]
+
+    def _open_raw(self, path: Path, mode: str, **kwargs) -> io.IOBase:
+        return self._open_binary(path, mode, **kwargs)  # type: ignore[arg-type]
@@ -1,4 +1,9 @@
-from gitgo.index.index import IndexEntry, GitIndex, GitPhysIndex, Ellipsis, FileMode, Timestamp, Idx_Flag
+from gitgo.index.index import IndexEntry, GitIndex, GitPhysIndex, Ellipsis, FileMode, Timestamp, Idx_Flag, \
+    git_mode, split_mode
+from gitgo.index.indexfile import IndexFile, CacheTreeEntry, ResolveUndo, UntrackedCache, UntrackedDir, \
+    StatData, read_index
+from gitgo.index.table import IndexTable, StageView
+from gitgo.index.writer import LockFile, write_index, update_cache_tree
 
 __all__ = [
     'IndexEntry',
@@ -8,4 +13,18 @@ __all__ = [
     'FileMode',
     'Timestamp',
     'Idx_Flag',
+    'git_mode',
+    'split_mode',
+    'IndexFile',
+    'CacheTreeEntry',
+    'ResolveUndo',
+    'UntrackedCache',
+    'UntrackedDir',
+    'StatData',
+    'read_index',
+    'IndexTable',
+    'StageView',
+    'LockFile',
+    'write_index',
+    'update_cache_tree',
 ]
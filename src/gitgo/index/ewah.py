@@ -0,0 +1,89 @@
+'''
+EWAH-compressed bitmaps, as git stores them in index extensions.
+
+On disk: the number of bits (32-bit), the number of 64-bit words (32-bit),
+the words, and the position of the last run-length word (32-bit), all
+big-endian. The words alternate between a run-length word (bit 0: the
+running bit; bits 1-32: how many words of it; bits 33-63: how many literal
+words follow) and that many literal words. They are used by the untracked
+cache and the split index.
+'''
+
+from typing import Iterable, Iterator
+import struct
+
+_u32 = struct.Struct('>I')
+_header = struct.Struct('>II')
+
+RUN_BITS = 32
+LITERAL_BITS = 31
+MAX_RUN = (1 << RUN_BITS) - 1
+MAX_LITERALS = (1 << LITERAL_BITS) - 1
+
+def _words(data: bytes, pos: int) -> tuple[int, tuple[int, ...], int]:
+    if len(data) - pos < 8:
+        raise ValueError('Truncated EWAH bitmap')
+    bit_size, count = _header.unpack_from(data, pos)
+    pos += 8
+    end = pos + count * 8 + 4
+    if end > len(data):
+        raise ValueError('Truncated EWAH bitmap')
+    words = struct.unpack_from(f'>{count}Q', data, pos)
+    return bit_size, words, end
+
+def _bits(words: tuple[int, ...]) -> Iterator[int]:
+    i = 0
+    bit = 0
+    n = len(words)
+    while i < n:
+        rlw = words[i]
+        i += 1
+        run = (rlw >> 1) & MAX_RUN
+        literals = rlw >> (1 + RUN_BITS)
+        if rlw & 1:
+            yield from range(bit, bit + run * 64)
+        bit += run * 64
+        for word in words[i:i + literals]:
+            while word:
+                low = word & -word
+                yield bit + low.bit_length() - 1
+                word ^= low
+            bit += 64
+        i += literals
+
+def decode(data: bytes, pos: int = 0) -> tuple[list[int], int]:
+    '''
+    Decode the bitmap at pos. Returns the positions of the set bits, in
+    ascending order, and the position just past the bitmap.
+    '''
+    bit_size, words, end = _words(data, pos)
+    return [b for b in _bits(words) if b < bit_size], end
+
+def encode(bits: Iterable[int], bit_size: int) -> bytes:
+    '''
+    Encode a bitmap of bit_size bits with the given bits set. Runs of zero
+    words are compressed; any other word is stored as a literal.
+    '''
+    literal: dict[int, int] = {}
+    for b in bits:
+        if not 0 <= b < bit_size:
+            raise ValueError(f'Bit {b} out of range for a bitmap of {bit_size} bits')
+        literal[b >> 6] = literal.get(b >> 6, 0) | (1 << (b & 63))
+    nwords = (bit_size + 63) >> 6
+    words: list[int] = []
+    last_rlw = 0
+    i = 0
+    while i < nwords or not words:
+        run = 0
+        while i < nwords and i not in literal and run < MAX_RUN:
+            run += 1
+            i += 1
+        start = i
+        while i < nwords and i in literal and i - start < MAX_LITERALS:
+            i += 1
+        last_rlw = len(words)
+        words.append((run << 1) | ((i - start) << (1 + RUN_BITS)))
+        words.extend(literal[j] for j in range(start, i))
+    return (_header.pack(bit_size, len(words))
+            + struct.pack(f'>{len(words)}Q', *words)
+            + _u32.pack(last_rlw))
@@ -1,10 +1,16 @@
 from dataclasses import dataclass, field
-from typing import Iterator, overload, Generic, Optional, Literal, Set
+from pathlib import Path
+from typing import AbstractSet, Iterator, MutableMapping, overload, Generic, Optional, Literal, Set, TYPE_CHECKING
 
 from gitgo.frontend.base import FrontendBase
 
 from gitgo.object import Oid, T_IndexType, ObjIType
 
+if TYPE_CHECKING:
+    from gitgo.object import HashAlgorithm
+    from gitgo.index.indexfile import IndexFile
+    from gitgo.index.table import IndexTable
+
 # ruff: noqa: E501
 
 Ellipsis = type(...)
@@ -15,6 +21,32 @@ Idx_Flag = Literal['assume-valid', 'skip-worktree', 'intent-to-add']
 
 Timestamp = float
 
+def git_mode(type: ObjIType, mode: FileMode) -> int:
+    '''
+    Return the mode git records in the index and in trees for an entry
+    of the given type and file mode.
+    '''
+    match type:
+        case 'symlink':
+            return 0o120000
+        case 'gitlink' | 'module':
+            return 0o160000
+        case _:
+            return 0o100755 if mode == 0o755 else 0o100644
+
+def split_mode(gmode: int) -> tuple[ObjIType, FileMode]:
+    '''
+    The inverse of `git_mode`: return the entry type and file mode for
+    a mode recorded by git.
+    '''
+    match gmode & 0o170000:
+        case 0o120000:
+            return 'symlink', 0
+        case 0o160000:
+            return 'gitlink', 0
+        case _:
+            return 'blob', (0o755 if gmode & 0o100 else 0o644)
+
 @dataclass
 class IndexEntry(Generic[T_IndexType]):
     '''
@@ -35,7 +67,7 @@ class IndexEntry(Generic[T_IndexType]):
 
 _Index_Version = Literal[2, 3, 4]
 
-_Stage = dict[Oid, IndexEntry[ObjIType]]
+_Stage = MutableMapping[str, IndexEntry[ObjIType]]
 _Stages = tuple[_Stage, _Stage, _Stage, _Stage]
 _Entries = tuple[
         Optional[IndexEntry[ObjIType]],
@@ -44,8 +76,12 @@ _Entries = tuple[
         Optional[IndexEntry[ObjIType]]
     ]
 _Stage_idx = Literal[0, 1, 2, 3]
-_Stage_oid = tuple[_Stage_idx, Oid]
-_Ellipse_oid = tuple[Ellipsis, Oid]  # How could I resist this name?
+_Stage_path = tuple[_Stage_idx, str]
+_Ellipse_path = tuple[Ellipsis, str]  # How could I resist this name?
+
+def _new_table() -> 'IndexTable':
+    from gitgo.index.table import IndexTable
+    return IndexTable()
 
 @dataclass
 class GitIndex(FrontendBase):
@@ -57,28 +93,31 @@ class GitIndex(FrontendBase):
     - stage 2: On a merge, the LEFT commit (typically this branch)
     - stage 3: the RIGHT commit (typically the other branch)
 
-    The index is keyed by (stage, oid), where stage is 0, 1, 2, or 3.
+    The index is keyed by (stage, path), where stage is 0, 1, 2, or 3.
     i.e.:
 
-    index[0, oid] = entry for the working tree
-    index[1, oid] = entry for the common ancestor
-    index[2, oid] = entry for the LEFT commit in a merge
-    index[3, oid] = entry for the RIGHT commit in a merge
-    index[..., oid] = (index[0, oid], index[1, oid], index[2, oid], index[3, oid])
+    index[0, path] = entry for the working tree
+    index[1, path] = entry for the common ancestor
+    index[2, path] = entry for the LEFT commit in a merge
+    index[3, path] = entry for the RIGHT commit in a merge
+    index[..., path] = (index[0, path], index[1, path], index[2, path], index[3, path])
+
+    The stage is defauilted to 0, so index[path] is equivalent to
+    index[0, path].
 
-    The stage is defauilted to 0, so index[oid] is equivalent to
-    index[0, oid].
+    Paths are found by binary search; `under` and `paths` give the entries
+    or paths under a directory, and `conflicts` the conflicted paths.
 
     Stage 0 and stages 1-3 are mutually exclusive for a particular file.
     Thit is, if a file is in stage 0, it cannot be in any of stages 1-3,
     and vice versa.
+
+    The entries are kept column by column in an `IndexTable`; an
+    `IndexEntry` is made only when one is looked up.
     '''
-    _stages: _Stages = field(init=False, default_factory=lambda : (  
-        dict(),
-        dict(),
-        dict(),
-        dict()
-    ))
+    _table: 'IndexTable' = field(init=False, default_factory=_new_table, repr=False)
+    _ls_files: Optional[tuple['IndexTable', int, bool, AbstractSet[str]]] = \
+        field(init=False, default=None, repr=False, compare=False)
 
     version: _Index_Version = field(default=3, kw_only=True)
 
@@ -88,127 +127,194 @@ class GitIndex(FrontendBase):
         '''
         if self.version not in (2, 3, 4):
             raise ValueError(f'Invalid index version {self.version}')
+
+    @property
+    def _stages(self) -> _Stages:
+        from gitgo.index.table import StageView
+        table = self._table
+        return (StageView(table, 0), StageView(table, 1), StageView(table, 2), StageView(table, 3))  # type: ignore[return-value]
     
     @overload
-    def __getitem__(self, name: Oid, /) -> Optional[IndexEntry[ObjIType]]:
+    def __getitem__(self, path: str, /) -> Optional[IndexEntry[ObjIType]]:
         ...
     @overload
-    def __getitem__(self, sidx: _Stage_oid, /) -> Optional[IndexEntry[ObjIType]]:
+    def __getitem__(self, sidx: _Stage_path, /) -> Optional[IndexEntry[ObjIType]]:
         ...
     @overload
-    def __getitem__(self, idx: _Ellipse_oid, /) -> _Entries:
+    def __getitem__(self, idx: _Ellipse_path, /) -> _Entries:
         ...
-    def __getitem__(self, name_or_idx: Oid|_Stage_oid|_Ellipse_oid, /) -> \
+    def __getitem__(self, name_or_idx: str|_Stage_path|_Ellipse_path, /) -> \
             Optional[IndexEntry[ObjIType]] \
             | _Entries:
         stages = self._stages
         match name_or_idx:
-            case Oid() as oid:
-                return stages[0].get(oid, None)
-            case (0|1|2 as idx, Oid() as oid):
-                return stages[idx].get(oid, None)
-            case (Ellipsis(), Oid() as oid):
+            case str() as path:
+                return stages[0].get(path, None)
+            case (0|1|2|3 as idx, str() as path):
+                return stages[idx].get(path, None)
+            case (Ellipsis(), str() as path):
                 return (
-                    stages[0].get(oid, None),
-                    stages[1].get(oid, None),
-                    stages[2].get(oid, None),
-                    stages[3].get(oid, None)
-                )                  
+                    stages[0].get(path, None),
+                    stages[1].get(path, None),
+                    stages[2].get(path, None),
+                    stages[3].get(path, None)
+                )
             case _:
                 raise AttributeError(f'No such attribute: {name_or_idx}')
-    def __delitem__(self, idx: Oid|_Stage_oid|_Ellipse_oid, /) -> None:
+    def __delitem__(self, idx: str|_Stage_path|_Ellipse_path, /) -> None:
         stages = self._stages
         match idx:
-            case Oid() as oid:
-                del stages[0][oid]
-                del stages[1][oid]
-                del stages[2][oid]
-                del stages[3][oid]
-            case (0|1|2|3 as sidx, Oid() as oid):
-                del stages[sidx][oid]
-            case (Ellipsis(), Oid() as oid):
-                del stages[0][oid]
-                del stages[1][oid]
-                del stages[2][oid]
-                del stages[3][oid]
+            case str() as path:
+                if not any([s.pop(path, None) for s in stages]):
+                    raise KeyError(path)
+            case (0|1|2|3 as sidx, str() as path):
+                del stages[sidx][path]
+            case (Ellipsis(), str() as path):
+                if not any([s.pop(path, None) for s in stages]):
+                    raise KeyError(path)
             case _:
                 raise AttributeError(f'No such attribute: {idx}')
 
     @overload
-    def __setitem__(self, oid: Oid, entry: IndexEntry[ObjIType], /) -> None:
+    def __setitem__(self, path: str, entry: IndexEntry[ObjIType], /) -> None:
         ...
     @overload
-    def __setitem__(self, stage: _Stage_oid, entry: IndexEntry[ObjIType], /) -> None:
+    def __setitem__(self, stage: _Stage_path, entry: IndexEntry[ObjIType], /) -> None:
         ...
     @overload
-    def __setitem__(self, idx: _Ellipse_oid, entry: _Entries, /) -> None:
+    def __setitem__(self, idx: _Ellipse_path, entry: _Entries, /) -> None:
         ...
-    def __setitem__(self, 
-                    idx: Oid|_Stage_oid|_Ellipse_oid,
+    def __setitem__(self,
+                    idx: str|_Stage_path|_Ellipse_path,
                     entry: IndexEntry[ObjIType] | _Entries
                     ) -> None:
         stages = self._stages
         match idx:
-            case (1|2|3 as sidx, Oid() as oid):
+            case (1|2|3 as sidx, str() as path):
                 if not isinstance(entry, IndexEntry):
                     raise TypeError(f'Expected IndexEntry, got {type(entry)}')
-                stages[sidx][oid] = entry
-                del stages[0][oid]
-            case (Ellipsis(), Oid() as oid):
-                if oid in stages[0] and (
-                    oid in stages[1] or
-                    oid in stages[2] or
-                    oid in stages[3]
-                ):
-                    msg = f'Cannot set index entry for {oid} in stage 0 and stages 1-3'
-                    raise ValueError(msg)
+                stages[sidx][path] = entry
+                stages[0].pop(path, None)
+            case (Ellipsis(), str() as path):
                 if not isinstance(entry, tuple) \
                     or len(entry) != 4 \
-                    or not all(isinstance(e, IndexEntry) for e in entry):
+                    or not all(e is None or isinstance(e, IndexEntry) for e in entry):
                     raise TypeError(f'Expected 4-tuple of IndexEntry, got {type(entry)}')
+                if entry[0] is not None and any(e is not None for e in entry[1:]):
+                    msg = f'Cannot set index entry for {path} in stage 0 and stages 1-3'
+                    raise ValueError(msg)
                 for s, e in zip(stages, entry):
                     if e is None:
-                        del s[oid]
+                        s.pop(path, None)
                     else:
-                        s[oid] = e
-            case Oid() as oid:
+                        s[path] = e
+            case str() as path:
                 if not isinstance(entry, IndexEntry):
                     raise TypeError(f'Expected IndexEntry, got {type(entry)}')
-                self[..., oid] = (entry, None, None, None)
-            case (0, Oid() as oid):
+                self[..., path] = (entry, None, None, None)
+            case (0, str() as path):
                 if not entry:
-                    del stages[0][oid]
+                    del stages[0][path]
                 elif not isinstance(entry, IndexEntry):
                     raise TypeError(f'Expected IndexEntry, got {type(entry)}')
                 else:
-                    stages[0][oid] = entry
+                    stages[0][path] = entry
                     for s in stages[1:]:
-                        del s[oid]
+                        s.pop(path, None)
             case _:
                 raise AttributeError(f'No such attribute: {idx}')
+
+    def __contains__(self, path: object) -> bool:
+        '''
+        Whether the path is in the index, at any stage.
+        '''
+        if not isinstance(path, str):
+            return False
+        return self._table.has_path(path.encode('utf-8', 'surrogateescape'))
+
     def __iter__(self) -> Iterator[tuple[_Stage_idx, IndexEntry[ObjIType]]]:
-        return iter(
-            (i, v)
-            for i in (0, 1, 2, 3)
-            for v in self._stages[i].values()
-        )
-            
-    def ls_files(self, unmerged:bool = False):
-        '''
-        Return a Set of the the files in the index.
-        '''
-        stages = (0, 1, 2, 3) if unmerged else (0,)
-        return {
-            e.name
-            for i in stages
-            for e in self._stages[i].values()
-        }
-    
+        '''
+        The (stage, entry) pairs, in index order: by path, then stage.
+        '''
+        return iter(self._table)  # type: ignore[arg-type]
+
+    def _range(self, directory: str, prefix: bool) -> tuple[int, int]:
+        table = self._table
+        start = directory.encode('utf-8', 'surrogateescape')
+        if start and not prefix and not start.endswith(b'/'):
+            start += b'/'
+        return table.prefix_range(start)
+
+    def under(self, directory: str = '', *,
+              prefix: bool = False) -> Iterator[tuple[_Stage_idx, IndexEntry[ObjIType]]]:
+        '''
+        The (stage, entry) pairs for the paths under a directory, in index
+        order. Found by binary search, not by a scan.
+
+        :param prefix: Take directory as a plain path prefix: 'do' matches
+            both 'docs/x' and 'dox'.
+        '''
+        table = self._table
+        lo, hi = self._range(directory, prefix)
+        return ((table.stage[i], table.entry_at(i)) for i in range(lo, hi))  # type: ignore[misc]
+
+    def paths(self, directory: str = '', *,
+              unmerged: bool = False,
+              prefix: bool = False) -> Iterator[str]:
+        '''
+        The paths under a directory (all of them by default), in order,
+        each once. Conflicted paths are included only if unmerged is true.
+
+        :param prefix: Take directory as a plain path prefix, as for `under`.
+        '''
+        table = self._table
+        lo, hi = self._range(directory, prefix)
+        stages = table.stage
+        last = None
+        for i in range(lo, hi):
+            if stages[i] and not unmerged:
+                continue
+            path = table.path_at(i)
+            if path != last:
+                last = path
+                yield path.decode('utf-8', 'surrogateescape')
+
+    def conflicts(self) -> Iterator[tuple[str, _Entries]]:
+        '''
+        The conflicted paths, with their entries at each stage (stage 0
+        always None). Only the conflicted rows are visited.
+        '''
+        table = self._table
+        current: Optional[bytes] = None
+        entries: list[Optional[IndexEntry[ObjIType]]] = [None] * 4
+        for i in table.conflict_rows():
+            path = table.path_at(i)
+            if path != current:
+                if current is not None:
+                    yield current.decode('utf-8', 'surrogateescape'), tuple(entries)  # type: ignore[misc]
+                current = path
+                entries = [None] * 4
+            entries[table.stage[i]] = table.entry_at(i)
+        if current is not None:
+            yield current.decode('utf-8', 'surrogateescape'), tuple(entries)  # type: ignore[misc]
+
+    def ls_files(self, unmerged:bool = False) -> AbstractSet[str]:
+        '''
+        Return a Set of the the files in the index. The set is kept until
+        the index next changes.
+        '''
+        table = self._table
+        cached = self._ls_files
+        if cached is None or cached[0] is not table or cached[1:3] != (table.generation, unmerged):
+            cached = (table, table.generation, unmerged, frozenset(self.paths(unmerged=unmerged)))
+            self._ls_files = cached
+        return cached[3]
+
     def len(self) -> int:
         '''
         Return the number of entries in the index.
         '''
-        return sum(len(s) for s in self._stages)
+        return len(self._table)
 
 @dataclass
 class GitPhysIndex(GitIndex):
@@ -216,3 +322,49 @@ class GitPhysIndex(GitIndex):
     A Git index file on the filesystem.
     '''
     path: str
+    # The file as last loaded or saved.
+    file: Optional['IndexFile'] = field(default=None, init=False, repr=False, compare=False)
+
+    def load(self, *,
+             algorithm: 'HashAlgorithm' = 'sha1',
+             verify: bool = False) -> 'IndexFile':
+        '''
+        Read the index file at `path`, replacing the entries here. Returns
+        the parsed file, which also has the entries in index order and the
+        extensions.
+        '''
+        from gitgo.index.indexfile import read_index
+        file = read_index(Path(self.path), algorithm=algorithm, verify=verify)
+        self.version = file.version  # type: ignore[assignment]
+        # Keyed by path, not oid: identical files share an oid.
+        self._table = file.entries
+        self.file = file
+        return file
+
+    def save(self, *,
+             version: Optional[_Index_Version] = None,
+             algorithm: 'HashAlgorithm' = 'sha1',
+             split: bool = False) -> 'IndexFile':
+        '''
+        Write the entries here to the index file at `path`, under its lock.
+        The cache tree and resolve-undo records of the file last loaded or
+        saved are kept, less the directories whose entries have changed.
+
+        :param split: Write a split index (see `gitgo.index.writer`).
+        '''
+        from gitgo.index.writer import write_index, update_cache_tree
+        table = self._table
+        previous = self.file
+        cache_tree = resolve_undo = None
+        if previous is not None:
+            if previous.cache_tree:
+                cache_tree = update_cache_tree(previous.cache_tree, table.changed)
+            resolve_undo = previous.resolve_undo
+        self.file = write_index(Path(self.path), table,
+                                version=version or self.version,
+                                algorithm=algorithm,
+                                cache_tree=cache_tree,
+                                resolve_undo=resolve_undo,
+                                split=split)
+        table.changed.clear()
+        return self.file
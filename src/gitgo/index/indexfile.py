@@ -0,0 +1,402 @@
+'''
+Reading the index file (``.git/index``) directly.
+
+The file is a header (``DIRC``, version, entry count), the entries sorted
+by path and stage, a sequence of extensions (4-byte signature, 32-bit size,
+data), and a trailing hash of everything before it.
+
+Each entry is the stat data git compares against the worktree, the oid, a
+16-bit flags word (assume-valid, extended, stage, name length) and, in
+version 3 and later, a second flags word if the extended bit is set. In
+versions 2 and 3 the path follows, NUL-terminated and padded to a multiple
+of 8 bytes; in version 4 it is prefix-compressed against the previous path.
+
+With a split index, the file holds only the entries changed since the
+shared index (``sharedindex.<hash>`` beside it) was written, and a ``link``
+extension naming the shared index and the entries deleted or replaced.
+'''
+
+from pathlib import Path
+from typing import NamedTuple, Optional, TYPE_CHECKING
+import hashlib
+import mmap
+import struct
+
+from gitgo.index.table import IndexTable, Row, ASSUME_VALID, SKIP_WORKTREE, INTENT_TO_ADD, NS
+from gitgo.index import ewah
+from gitgo.object import HASH_LENGTHS, decode_offset
+
+if TYPE_CHECKING:
+    from gitgo.object import Oid, HashAlgorithm
+
+SIGNATURE = b'DIRC'
+
+FLAG_ASSUME_VALID = 0x8000
+FLAG_EXTENDED = 0x4000
+STAGE_SHIFT = 12
+NAME_MASK = 0x0fff
+XFLAG_SKIP_WORKTREE = 0x4000
+XFLAG_INTENT_TO_ADD = 0x2000
+
+# Extensions whose signature starts with a lowercase letter must be
+# understood; these are the ones that are.
+REQUIRED_KNOWN = frozenset((b'link', b'sdir'))
+
+_header = struct.Struct('>4sII')
+_u16 = struct.Struct('>H')
+_u32 = struct.Struct('>I')
+_stat = struct.Struct('>9I')
+
+def _cstring(data: bytes, pos: int) -> tuple[bytes, int]:
+    end = data.index(b'\0', pos)
+    return data[pos:end], end + 1
+
+def _path(raw: bytes) -> str:
+    return raw.decode('utf-8', 'surrogateescape')
+
+def _oid(raw: bytes) -> Optional['Oid']:
+    return raw.hex() if raw.strip(b'\0') else None  # type: ignore[return-value]
+
+class CacheTreeEntry(NamedTuple):
+    '''
+    A directory in the TREE (cache-tree) extension. The entries are listed
+    depth first, parents before children.
+    '''
+    # The directory, relative to the top ('' for the top itself).
+    path: str
+    # How many index entries it covers, or -1 if invalidated.
+    entry_count: int
+    subtrees: int
+    # The tree object for the directory, if still valid.
+    oid: Optional['Oid']
+
+class ResolveUndo(NamedTuple):
+    '''
+    A REUC entry: the conflicted stages (1-3) of a path that has since been
+    resolved, so the conflict can be recreated. A mode of 0 means the stage
+    was absent.
+    '''
+    path: str
+    modes: tuple[int, int, int]
+    oids: tuple[Optional['Oid'], Optional['Oid'], Optional['Oid']]
+
+class StatData(NamedTuple):
+    '''
+    The stat data the untracked cache keeps, with times in nanoseconds.
+    '''
+    ctime: int
+    mtime: int
+    dev: int
+    ino: int
+    uid: int
+    gid: int
+    size: int
+
+    @classmethod
+    def unpack(cls, data: bytes, pos: int) -> 'StatData':
+        cs, cns, ms, mns, dev, ino, uid, gid, size = _stat.unpack_from(data, pos)
+        return cls(cs * 1_000_000_000 + cns, ms * 1_000_000_000 + mns, dev, ino, uid, gid, size)
+
+class UntrackedDir(NamedTuple):
+    '''
+    A directory in the untracked cache.
+    '''
+    # With a trailing '/', or '' for the top.
+    path: str
+    untracked: list[str]
+    valid: bool
+    check_only: bool
+    # The directory's stat data, if valid.
+    stat: Optional[StatData]
+    # The oid of its per-directory exclude file, if recorded.
+    exclude_oid: Optional['Oid']
+
+class UntrackedCache(NamedTuple):
+    '''
+    The UNTR extension: the untracked files found by the last status, and
+    what the result depended on.
+    '''
+    ident: str
+    info_exclude: StatData
+    info_exclude_oid: Optional['Oid']
+    excludes_file: StatData
+    excludes_file_oid: Optional['Oid']
+    dir_flags: int
+    exclude_per_dir: str
+    dirs: list[UntrackedDir]
+
+class IndexFile(NamedTuple):
+    '''
+    A parsed index file.
+    '''
+    version: int
+    # (stage, entry), in index order.
+    entries: IndexTable
+    cache_tree: Optional[list[CacheTreeEntry]]
+    resolve_undo: Optional[list[ResolveUndo]]
+    untracked: Optional[UntrackedCache]
+    # All the extensions, unparsed, by signature.
+    extensions: dict[str, bytes]
+    checksum: bytes
+    # The hash of the shared index, for a split index.
+    shared_index: Optional[str] = None
+
+class SplitLink(NamedTuple):
+    '''
+    The ``link`` extension of a split index.
+    '''
+    shared_index: str
+    # Positions in the shared index.
+    deleted: list[int]
+    replaced: list[int]
+
+def parse_link(data: bytes, algorithm: 'HashAlgorithm' = 'sha1') -> SplitLink:
+    '''
+    Parse the link extension.
+    '''
+    hl = HASH_LENGTHS[algorithm]
+    deleted: list[int] = []
+    replaced: list[int] = []
+    if len(data) > hl:
+        deleted, pos = ewah.decode(data, hl)
+        replaced, pos = ewah.decode(data, pos)
+    return SplitLink(data[:hl].hex(), deleted, replaced)
+
+def merge_split(shared: IndexTable, front: IndexTable, link: SplitLink) -> IndexTable:
+    '''
+    Combine the entries of a shared index with those of the split index
+    that refers to it. The first entries of the split index replace the
+    shared entries marked in the replace bitmap (taking their paths, if
+    left empty); the rest are added.
+    '''
+    if len(link.replaced) > front.rows:
+        raise ValueError('Split index replaces more entries than it has')
+    changes: dict[tuple[bytes, int], Optional[Row]] = {}
+    for i in link.deleted:
+        if i >= shared.rows:
+            raise ValueError(f'Split index deletes entry {i} of {shared.rows}')
+        changes[shared.key_at(i)] = None
+    for j, i in enumerate(link.replaced):
+        if i >= shared.rows:
+            raise ValueError(f'Split index replaces entry {i} of {shared.rows}')
+        old = shared.key_at(i)
+        path = front.path_at(j) or old[0]
+        if (path, front.stage[j]) != old:
+            changes.setdefault(old, None)
+        changes[path, front.stage[j]] = front.row_at(j)
+    for j in range(len(link.replaced), front.rows):
+        changes[front.key_at(j)] = front.row_at(j)
+    return shared.merged(changes)
+
+def parse_cache_tree(data: bytes, algorithm: 'HashAlgorithm' = 'sha1') -> list[CacheTreeEntry]:
+    '''
+    Parse the TREE extension.
+    '''
+    hl = HASH_LENGTHS[algorithm]
+    result: list[CacheTreeEntry] = []
+    # The directories still to be filled: (path, subtrees remaining).
+    open_dirs: list[list] = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        name, pos = _cstring(data, pos)
+        line_end = data.index(b'\n', pos)
+        count, subtrees = (int(n) for n in data[pos:line_end].split(b' '))
+        pos = line_end + 1
+        oid = None
+        if count >= 0:
+            oid = data[pos:pos + hl].hex()
+            pos += hl
+        while open_dirs and open_dirs[-1][1] == 0:
+            open_dirs.pop()
+        if open_dirs:
+            open_dirs[-1][1] -= 1
+            path = f'{open_dirs[-1][0]}{_path(name)}/'
+        else:
+            path = ''
+        result.append(CacheTreeEntry(path.rstrip('/'), count, subtrees, oid))  # type: ignore[arg-type]
+        open_dirs.append([path, subtrees])
+    return result
+
+def parse_resolve_undo(data: bytes, algorithm: 'HashAlgorithm' = 'sha1') -> list[ResolveUndo]:
+    '''
+    Parse the REUC extension.
+    '''
+    hl = HASH_LENGTHS[algorithm]
+    result: list[ResolveUndo] = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        path, pos = _cstring(data, pos)
+        modes = []
+        for _ in range(3):
+            mode, pos = _cstring(data, pos)
+            modes.append(int(mode, 8))
+        oids: list[Optional['Oid']] = []
+        for mode in modes:
+            if mode:
+                oids.append(data[pos:pos + hl].hex())  # type: ignore[arg-type]
+                pos += hl
+            else:
+                oids.append(None)
+        result.append(ResolveUndo(_path(path), tuple(modes), tuple(oids)))  # type: ignore[arg-type]
+    return result
+
+def parse_untracked_cache(data: bytes, algorithm: 'HashAlgorithm' = 'sha1') -> UntrackedCache:
+    '''
+    Parse the UNTR extension.
+    '''
+    hl = HASH_LENGTHS[algorithm]
+    ident_len, pos = decode_offset(data, 0)
+    ident = data[pos:pos + ident_len].decode('utf-8', 'replace')
+    pos += ident_len
+    info_exclude = StatData.unpack(data, pos)
+    excludes_file = StatData.unpack(data, pos + _stat.size)
+    pos += 2 * _stat.size
+    dir_flags = _u32.unpack_from(data, pos)[0]
+    pos += 4
+    info_exclude_oid = _oid(data[pos:pos + hl])
+    excludes_file_oid = _oid(data[pos + hl:pos + 2 * hl])
+    pos += 2 * hl
+    exclude_per_dir, pos = _cstring(data, pos)
+    count, pos = decode_offset(data, pos)
+    dirs: list[tuple[str, list[str]]] = []
+    if count:
+        # Depth first: each directory's own names, then its subdirectories.
+        pending = [('', 1)]
+        while pending:
+            prefix, remaining = pending.pop()
+            if remaining > 1:
+                pending.append((prefix, remaining - 1))
+            untracked_count, pos = decode_offset(data, pos)
+            subdirs, pos = decode_offset(data, pos)
+            name, pos = _cstring(data, pos)
+            path = f'{prefix}{_path(name)}/' if dirs else ''
+            names = []
+            for _ in range(untracked_count):
+                untracked, pos = _cstring(data, pos)
+                names.append(_path(untracked))
+            dirs.append((path, names))
+            if subdirs:
+                pending.append((path, subdirs))
+        if len(dirs) != count:
+            raise ValueError(f'Untracked cache lists {len(dirs)} directories, expected {count}')
+        valid, pos = ewah.decode(data, pos)
+        check_only, pos = ewah.decode(data, pos)
+        hashed, pos = ewah.decode(data, pos)
+        stats: dict[int, StatData] = {}
+        for i in valid:
+            stats[i] = StatData.unpack(data, pos)
+            pos += _stat.size
+        oids: dict[int, 'Oid'] = {}
+        for i in hashed:
+            oids[i] = data[pos:pos + hl].hex()  # type: ignore[assignment]
+            pos += hl
+        valid_set, check_set = set(valid), set(check_only)
+        untracked_dirs = [
+            UntrackedDir(path, names, i in valid_set, i in check_set, stats.get(i), oids.get(i))
+            for i, (path, names) in enumerate(dirs)
+        ]
+    else:
+        untracked_dirs = []
+    return UntrackedCache(ident, info_exclude, info_exclude_oid,
+                          excludes_file, excludes_file_oid,
+                          dir_flags, exclude_per_dir.decode(), untracked_dirs)
+
+def read_index(path: Path, /, *,
+               algorithm: 'HashAlgorithm' = 'sha1',
+               verify: bool = False) -> IndexFile:
+    '''
+    Read an index file of version 2, 3 or 4.
+
+    :param verify: Check the trailing checksum (not done by default: it
+        means hashing the whole file). A zero checksum, written with
+        index.skipHash, is not checked.
+    '''
+    hl = HASH_LENGTHS[algorithm]
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _parse(mm, path, algorithm, hl, verify)
+
+def _parse(mm: mmap.mmap, path: Path, algorithm: 'HashAlgorithm', hl: int, verify: bool) -> IndexFile:
+    if len(mm) < _header.size + hl:
+        raise ValueError(f'{path} is too short to be an index')
+    signature, version, count = _header.unpack_from(mm, 0)
+    if signature != SIGNATURE:
+        raise ValueError(f'{path} is not an index file')
+    if version not in (2, 3, 4):
+        raise ValueError(f'{path} has unsupported index version {version}')
+    end = len(mm) - hl
+    checksum = mm[end:]
+    if verify and checksum.strip(b'\0'):
+        if hashlib.new(algorithm, mm[:end]).digest() != checksum:
+            raise ValueError(f'{path} has a bad checksum')
+    entry = struct.Struct(f'>10I{hl}sH')
+    fixed = entry.size
+    entries = IndexTable(algorithm)
+    append = entries.append
+    pos = _header.size
+    name = b''
+    for _ in range(count):
+        (cs, cns, ms, mns, dev, ino, mode, uid, gid, size,
+         oid, flags) = entry.unpack_from(mm, pos)
+        start = pos
+        pos += fixed
+        xflags = 0
+        if flags & FLAG_EXTENDED:
+            if version < 3:
+                raise ValueError(f'{path}: extended flags in a version {version} index')
+            xflags = _u16.unpack_from(mm, pos)[0]
+            pos += 2
+        if version == 4:
+            strip, pos = decode_offset(mm, pos)  # type: ignore[arg-type]
+            suffix_end = mm.find(b'\0', pos)
+            name = name[:len(name) - strip] + mm[pos:suffix_end]
+            pos = suffix_end + 1
+        else:
+            length = flags & NAME_MASK
+            if length == NAME_MASK:
+                length = mm.find(b'\0', pos) - pos
+            name = mm[pos:pos + length]
+            # Padded with 1-8 NULs to a multiple of 8 bytes.
+            pos = start + ((pos - start + length + 8) & ~7)
+        bits = ((ASSUME_VALID if flags & FLAG_ASSUME_VALID else 0)
+                | (SKIP_WORKTREE if xflags & XFLAG_SKIP_WORKTREE else 0)
+                | (INTENT_TO_ADD if xflags & XFLAG_INTENT_TO_ADD else 0))
+        append(name, (flags >> STAGE_SHIFT) & 3,
+               (cs * NS + cns, ms * NS + mns, dev, ino, mode, uid, gid, size, oid, bits))
+    extensions: dict[str, bytes] = {}
+    while pos + 8 <= end:
+        signature, size = struct.unpack_from('>4sI', mm, pos)
+        pos += 8
+        if pos + size > end:
+            raise ValueError(f'{path}: extension {signature!r} runs past the end')
+        if signature[:1].islower() and signature not in REQUIRED_KNOWN:
+            raise ValueError(f'{path}: unsupported index extension {signature.decode()!r}')
+        extensions[signature.decode()] = mm[pos:pos + size]
+        pos += size
+    if pos != end:
+        raise ValueError(f'{path}: trailing garbage after the extensions')
+    shared_index = None
+    if (link_data := extensions.get('link')) is not None:
+        link = parse_link(link_data, algorithm)
+        if link.shared_index.strip('0'):
+            shared_path = path.parent / f'sharedindex.{link.shared_index}'
+            shared = read_index(shared_path, algorithm=algorithm, verify=verify)
+            if shared.shared_index is not None:
+                raise ValueError(f'{shared_path} is itself a split index')
+            entries = merge_split(shared.entries, entries, link)
+            shared_index = link.shared_index
+    tree = extensions.get('TREE')
+    reuc = extensions.get('REUC')
+    untr = extensions.get('UNTR')
+    return IndexFile(
+        version=version,
+        entries=entries,
+        cache_tree=parse_cache_tree(tree, algorithm) if tree is not None else None,
+        resolve_undo=parse_resolve_undo(reuc, algorithm) if reuc is not None else None,
+        untracked=parse_untracked_cache(untr, algorithm) if untr is not None else None,
+        extensions=extensions,
+        checksum=checksum,
+        shared_index=shared_index,
+    )
@@ -0,0 +1,443 @@
+'''
+Column-oriented storage for index entries.
+
+An `IndexEntry` per file costs several hundred bytes: an instance dict, a
+set for the flags, and strings for the oid and path. `IndexTable` instead
+keeps each field in an `array` (or, for oids and paths, one `bytearray`),
+so an entry costs its on-disk size plus a few bytes, and an `IndexEntry` is
+only made when one is asked for.
+
+The rows are kept sorted by path and stage, as in the index file, so a
+path is found by binary search. Changes go to a small overlay, keyed by
+(path, stage), and are merged into the columns (`compact`) when the rows
+are next needed in order.
+'''
+
+from array import array
+import re
+from typing import Iterable, Iterator, Mapping, MutableMapping, Optional, Sequence, TYPE_CHECKING, overload
+
+from gitgo.index.index import IndexEntry, Idx_Flag, git_mode, split_mode
+from gitgo.object import HASH_LENGTHS
+
+if TYPE_CHECKING:
+    from gitgo.object import HashAlgorithm
+
+# The bits of the flags column.
+ASSUME_VALID = 1
+SKIP_WORKTREE = 2
+INTENT_TO_ADD = 4
+
+_FLAG_BITS: dict[Idx_Flag, int] = {
+    'assume-valid': ASSUME_VALID,
+    'skip-worktree': SKIP_WORKTREE,
+    'intent-to-add': INTENT_TO_ADD,
+}
+
+NS = 1_000_000_000
+
+# A row, less its path and stage: (ctime_ns, mtime_ns, dev, ino, mode, uid,
+# gid, size, oid, flags), with the git mode, binary oid and flag bits.
+Row = tuple[int, int, int, int, int, int, int, int, bytes, int]
+Key = tuple[bytes, int]
+
+def _ns(t: float) -> int:
+    # Whole seconds first: t * NS would lose the low digits.
+    seconds = int(t)
+    return seconds * NS + round((t - seconds) * NS)
+
+def _encode(name: str) -> bytes:
+    return name.encode('utf-8', 'surrogateescape')
+
+def entry_row(entry: IndexEntry) -> Row:
+    '''
+    The row for an `IndexEntry`.
+    '''
+    flags = 0
+    for flag in entry.flags:
+        flags |= _FLAG_BITS[flag]
+    return (_ns(entry.ctime), _ns(entry.mtime),
+            entry.dev & 0xffffffff, entry.ino & 0xffffffff,
+            git_mode(entry.type, entry.mode),
+            entry.uid & 0xffffffff, entry.gid & 0xffffffff, entry.size & 0xffffffff,
+            bytes.fromhex(entry.oid), flags)
+
+def row_entry(path: bytes, row: Row) -> IndexEntry:
+    '''
+    The `IndexEntry` for a row.
+    '''
+    ctime, mtime, dev, ino, mode, uid, gid, size, oid, flags = row
+    type, fmode = split_mode(mode)
+    return IndexEntry(
+        name=path.decode('utf-8', 'surrogateescape'),
+        type=type,
+        oid=oid.hex(),  # type: ignore[arg-type]
+        mode=fmode,
+        ctime=ctime / NS,
+        mtime=mtime / NS,
+        dev=dev,
+        ino=ino,
+        uid=uid,
+        gid=gid,
+        flags={flag for flag, bit in _FLAG_BITS.items() if flags & bit},
+        size=size,
+    )
+
+class IndexTable(Sequence[tuple[int, IndexEntry]]):
+    '''
+    Index entries, column by column. As a sequence, it holds the
+    (stage, entry) pairs in index order.
+
+    :param algorithm: The repository's hash algorithm.
+    '''
+    algorithm: 'HashAlgorithm'
+    hash_len: int
+    ctime: array
+    mtime: array
+    dev: array
+    ino: array
+    mode: array
+    uid: array
+    gid: array
+    size: array
+    stage: array
+    flags: array
+    oids: bytearray
+    paths: bytearray
+    # The end of each path in `paths`; each starts where the previous ends.
+    ends: array
+    # Paths set or removed since `changed` was last cleared.
+    changed: set[bytes]
+    # Counts changes to the entries, so that what is derived from them can
+    # be cached until the next one.
+    generation: int
+
+    def __init__(self, algorithm: 'HashAlgorithm' = 'sha1'):
+        self.algorithm = algorithm
+        self.hash_len = HASH_LENGTHS[algorithm]
+        self.ctime = array('q')
+        self.mtime = array('q')
+        self.dev = array('I')
+        self.ino = array('I')
+        self.mode = array('I')
+        self.uid = array('I')
+        self.gid = array('I')
+        self.size = array('I')
+        self.stage = array('B')
+        self.flags = array('B')
+        self.oids = bytearray()
+        self.paths = bytearray()
+        self.ends = array('I')
+        self.changed = set()
+        self.generation = 0
+        self._changes: dict[Key, Optional[Row]] = {}
+        self._count = 0
+        self._conflicts: Optional[tuple[int, list[int]]] = None
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[tuple[int, IndexEntry]],
+                     algorithm: 'HashAlgorithm' = 'sha1') -> 'IndexTable':
+        '''
+        A table of (stage, entry) pairs, in any order.
+        '''
+        table = cls(algorithm)
+        rows = sorted(
+            ((_encode(e.name), stage, entry_row(e))
+             for stage, e in entries),
+            key=lambda r: r[:2])
+        for path, stage, row in rows:
+            table.append(path, stage, row)
+        return table
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(entries={len(self)}, pending={len(self._changes)})'
+
+    @property
+    def rows(self) -> int:
+        '''
+        The number of rows in the columns, not counting pending changes.
+        '''
+        return len(self.ends)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def nbytes(self) -> int:
+        '''
+        The memory used by the columns.
+        '''
+        arrays = (self.ctime, self.mtime, self.dev, self.ino, self.mode, self.uid,
+                  self.gid, self.size, self.stage, self.flags, self.ends)
+        return (sum(a.itemsize * len(a) for a in arrays)
+                + len(self.oids) + len(self.paths))
+
+    # Rows
+
+    def append(self, path: bytes, stage: int, row: Row) -> None:
+        '''
+        Add a row at the end. The caller keeps the rows in order.
+        '''
+        ctime, mtime, dev, ino, mode, uid, gid, size, oid, flags = row
+        self.ctime.append(ctime)
+        self.mtime.append(mtime)
+        self.dev.append(dev)
+        self.ino.append(ino)
+        self.mode.append(mode)
+        self.uid.append(uid)
+        self.gid.append(gid)
+        self.size.append(size)
+        self.stage.append(stage)
+        self.flags.append(flags)
+        self.oids += oid
+        self.paths += path
+        self.ends.append(len(self.paths))
+        self._count += 1
+        self.generation += 1
+
+    def path_at(self, i: int) -> bytes:
+        return bytes(self.paths[self.ends[i - 1] if i else 0:self.ends[i]])
+
+    def oid_at(self, i: int) -> bytes:
+        hl = self.hash_len
+        return bytes(self.oids[i * hl:(i + 1) * hl])
+
+    def key_at(self, i: int) -> Key:
+        return self.path_at(i), self.stage[i]
+
+    def row_at(self, i: int) -> Row:
+        return (self.ctime[i], self.mtime[i], self.dev[i], self.ino[i], self.mode[i],
+                self.uid[i], self.gid[i], self.size[i], self.oid_at(i), self.flags[i])
+
+    def entry_at(self, i: int) -> IndexEntry:
+        return row_entry(self.path_at(i), self.row_at(i))
+
+    def bisect(self, key: Key, lo: int = 0) -> int:
+        '''
+        The first row at or after key, not counting pending changes.
+        '''
+        hi = len(self.ends)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, path: bytes, stage: int = 0) -> Optional[int]:
+        '''
+        The row for path at stage, not counting pending changes.
+        '''
+        i = self.bisect((path, stage))
+        if i < len(self.ends) and self.stage[i] == stage and self.path_at(i) == path:
+            return i
+        return None
+
+    # Changes
+
+    def get(self, path: bytes, stage: int = 0) -> Optional[Row]:
+        '''
+        The row for path at stage, or None.
+        '''
+        key = (path, stage)
+        if key in self._changes:
+            return self._changes[key]
+        i = self.find(path, stage)
+        return self.row_at(i) if i is not None else None
+
+    def has_path(self, path: bytes) -> bool:
+        '''
+        Whether path has a row at any stage.
+        '''
+        return any(self.get(path, stage) is not None for stage in range(4))
+
+    def prefix_range(self, prefix: bytes) -> tuple[int, int]:
+        '''
+        The rows (start, end) whose paths start with prefix, after merging
+        the pending changes.
+        '''
+        self.compact()
+        n = len(self.ends)
+        if not prefix:
+            return 0, n
+        lo = self.bisect((prefix, 0))
+        # The first path past the prefix: drop trailing 0xff bytes, and
+        # increment the last byte left.
+        stem = prefix.rstrip(b'\xff')
+        if not stem:
+            return lo, n
+        upper = stem[:-1] + bytes([stem[-1] + 1])
+        return lo, self.bisect((upper, 0), lo)
+
+    def conflict_rows(self) -> list[int]:
+        '''
+        The rows at stages 1-3, in order. Found by scanning the stage column
+        as bytes, and kept until the next change.
+        '''
+        self.compact()
+        if self._conflicts is None or self._conflicts[0] != self.generation:
+            rows = [i
+                    for m in re.finditer(rb'[\x01-\x03]+', self.stage.tobytes())
+                    for i in range(m.start(), m.end())]
+            self._conflicts = (self.generation, rows)
+        return self._conflicts[1]
+
+    def put(self, path: bytes, stage: int, row: Row) -> None:
+        '''
+        Add or replace the row for path at stage.
+        '''
+        if self.get(path, stage) is None:
+            self._count += 1
+        self._changes[path, stage] = row
+        self.changed.add(path)
+        self.generation += 1
+
+    def remove(self, path: bytes, stage: int = 0) -> bool:
+        '''
+        Remove the row for path at stage. Returns False if there was none.
+        '''
+        if self.get(path, stage) is None:
+            return False
+        self._changes[path, stage] = None
+        self._count -= 1
+        self.changed.add(path)
+        self.generation += 1
+        return True
+
+    def _extend(self, other: 'IndexTable', start: int, end: int) -> None:
+        '''
+        Copy rows start to end of other to the end of this table.
+        '''
+        if start >= end:
+            return
+        for name in ('ctime', 'mtime', 'dev', 'ino', 'mode', 'uid', 'gid', 'size', 'stage', 'flags'):
+            getattr(self, name).extend(getattr(other, name)[start:end])
+        hl = self.hash_len
+        self.oids += other.oids[start * hl:end * hl]
+        first = other.ends[start - 1] if start else 0
+        shift = len(self.paths) - first
+        self.paths += other.paths[first:other.ends[end - 1]]
+        self.ends.extend(e + shift for e in other.ends[start:end])
+        self._count += end - start
+        self.generation += 1
+
+    def merged(self, changes: Mapping[Key, Optional[Row]]) -> 'IndexTable':
+        '''
+        A new table with the given changes (None to remove) applied to the
+        rows here. Runs of unchanged rows are copied column by column.
+        '''
+        out = type(self)(self.algorithm)
+        pos = 0
+        n = len(self.ends)
+        for key in sorted(changes):
+            i = self.bisect(key, pos)
+            out._extend(self, pos, i)
+            pos = i
+            if i < n and self.key_at(i) == key:
+                pos += 1
+            row = changes[key]
+            if row is not None:
+                out.append(key[0], key[1], row)
+        out._extend(self, pos, n)
+        return out
+
+    def compact(self) -> None:
+        '''
+        Merge the pending changes into the columns.
+        '''
+        if not self._changes:
+            return
+        merged = self.merged(self._changes)
+        changed, generation = self.changed, self.generation
+        self.__dict__.update(merged.__dict__)
+        # The entries are the same, only stored differently.
+        self.changed, self.generation = changed, generation
+
+    # Sequence
+
+    @overload
+    def __getitem__(self, i: int) -> tuple[int, IndexEntry]:
+        ...
+    @overload
+    def __getitem__(self, i: slice) -> list[tuple[int, IndexEntry]]:
+        ...
+    def __getitem__(self, i: int | slice) -> tuple[int, IndexEntry] | list[tuple[int, IndexEntry]]:
+        self.compact()
+        if isinstance(i, slice):
+            return [(self.stage[j], self.entry_at(j)) for j in range(len(self.ends))[i]]
+        if i < 0:
+            i += len(self.ends)
+        if not 0 <= i < len(self.ends):
+            raise IndexError(i)
+        return self.stage[i], self.entry_at(i)
+
+    def __iter__(self) -> Iterator[tuple[int, IndexEntry]]:
+        self.compact()
+        for i in range(len(self.ends)):
+            yield self.stage[i], self.entry_at(i)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, IndexTable):
+            return NotImplemented
+        self.compact()
+        other.compact()
+        return all(getattr(self, name) == getattr(other, name)
+                   for name in ('ctime', 'mtime', 'dev', 'ino', 'mode', 'uid', 'gid',
+                                'size', 'stage', 'flags', 'oids', 'paths', 'ends'))
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def stage_count(self, stage: int) -> int:
+        self.compact()
+        return self.stage.count(stage)
+
+    def stage_rows(self, stage: int) -> Iterator[int]:
+        '''
+        The rows at the given stage, in order.
+        '''
+        self.compact()
+        stages = self.stage
+        return (i for i in range(len(stages)) if stages[i] == stage)
+
+class StageView(MutableMapping[str, IndexEntry]):
+    '''
+    One stage of a table, as a mapping from path to entry.
+    '''
+    table: IndexTable
+    stage: int
+
+    def __init__(self, table: IndexTable, stage: int):
+        self.table = table
+        self.stage = stage
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(stage={self.stage}, entries={len(self)})'
+
+    def __getitem__(self, name: str) -> IndexEntry:
+        path = _encode(name)
+        row = self.table.get(path, self.stage)
+        if row is None:
+            raise KeyError(name)
+        return row_entry(path, row)
+
+    def __setitem__(self, name: str, entry: IndexEntry) -> None:
+        self.table.put(_encode(name), self.stage, entry_row(entry))
+
+    def __delitem__(self, name: str) -> None:
+        if not self.table.remove(_encode(name), self.stage):
+            raise KeyError(name)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self.table.get(_encode(name), self.stage) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        table = self.table
+        return (table.path_at(i).decode('utf-8', 'surrogateescape')
+                for i in table.stage_rows(self.stage))
+
+    def __len__(self) -> int:
+        return self.table.stage_count(self.stage)
+
+    def values(self) -> Iterator[IndexEntry]:  # type: ignore[override]
+        table = self.table
+        return (table.entry_at(i) for i in table.stage_rows(self.stage))
@@ -0,0 +1,327 @@
+'''
+Writing the index file.
+
+The index is written the way git writes it: to ``index.lock``, created
+exclusively so that concurrent writers (including git itself) fail rather
+than overwrite each other, then renamed over ``index``.
+
+Valid cache-tree (TREE) entries are kept for the directories whose entries
+have not changed, so a following ``git write-tree`` or ``git commit`` only
+has to hash the trees that did change.
+
+With ``split=True`` the entries are written as a split index: the bulk goes
+to a shared index (``sharedindex.<hash>``), written once, and each later
+write only records the entries changed since.
+'''
+
+from pathlib import Path
+from typing import BinaryIO, Iterable, NamedTuple, Optional, Sequence, TYPE_CHECKING
+import hashlib
+import os
+import struct
+import tempfile
+
+from gitgo.index.index import IndexEntry
+from gitgo.index.indexfile import (
+    CacheTreeEntry, IndexFile, ResolveUndo, SIGNATURE,
+    FLAG_ASSUME_VALID, FLAG_EXTENDED, STAGE_SHIFT, NAME_MASK,
+    XFLAG_SKIP_WORKTREE, XFLAG_INTENT_TO_ADD,
+    read_index,
+)
+from gitgo.index.table import IndexTable, ASSUME_VALID, SKIP_WORKTREE, INTENT_TO_ADD, NS
+from gitgo.index import ewah
+from gitgo.object import encode_offset
+
+if TYPE_CHECKING:
+    from gitgo.object import HashAlgorithm
+
+# git's splitIndex.maxPercentChange: past this, a new shared index is written.
+MAX_PERCENT_CHANGE = 20
+
+_header = struct.Struct('>4sII')
+_ext = struct.Struct('>4sI')
+_u16 = struct.Struct('>H')
+
+class LockFile:
+    '''
+    git's lockfile protocol, as a context manager yielding the file to
+    write: ``<path>.lock`` is created exclusively, and renamed over path if
+    the block completes. Otherwise it is removed, leaving path untouched.
+    '''
+    path: Path
+    lock: Path
+
+    def __init__(self, path: Path, /):
+        self.path = path
+        self.lock = path.with_name(path.name + '.lock')
+        self._file: Optional[BinaryIO] = None
+
+    def __enter__(self) -> BinaryIO:
+        try:
+            fd = os.open(self.lock, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            raise ValueError(f"Unable to create '{self.lock}': File exists. "
+                             'Another git process seems to be running.') from None
+        self._file = os.fdopen(fd, 'wb')
+        return self._file
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        assert self._file is not None
+        file, self._file = self._file, None
+        committed = False
+        try:
+            file.close()
+            if exc_type is None:
+                os.replace(self.lock, self.path)
+                committed = True
+        finally:
+            if not committed:
+                try:
+                    os.unlink(self.lock)
+                except FileNotFoundError:
+                    pass
+
+def serialize_entries(table: IndexTable,
+                      version: int,
+                      strip: int = 0) -> bytes:
+    '''
+    Serialize the rows of a table, in order, in the given index version.
+
+    :param strip: Write the paths of this many leading rows as empty (the
+        replaced entries of a split index).
+    '''
+    table.compact()
+    entry = struct.Struct(f'>10I{table.hash_len}sH')
+    out = bytearray()
+    previous = b''
+    for i in range(table.rows):
+        name = b'' if i < strip else table.path_at(i)
+        bits = table.flags[i]
+        xflags = ((XFLAG_SKIP_WORKTREE if bits & SKIP_WORKTREE else 0)
+                  | (XFLAG_INTENT_TO_ADD if bits & INTENT_TO_ADD else 0))
+        flags = ((table.stage[i] << STAGE_SHIFT)
+                 | min(len(name), NAME_MASK)
+                 | (FLAG_ASSUME_VALID if bits & ASSUME_VALID else 0)
+                 | (FLAG_EXTENDED if xflags else 0))
+        ctime, mtime = table.ctime[i], table.mtime[i]
+        start = len(out)
+        out += entry.pack(ctime // NS, ctime % NS, mtime // NS, mtime % NS,
+                          table.dev[i], table.ino[i], table.mode[i],
+                          table.uid[i], table.gid[i], table.size[i],
+                          table.oid_at(i), flags)
+        if xflags:
+            out += _u16.pack(xflags)
+        if version == 4:
+            common = 0
+            limit = min(len(name), len(previous))
+            while common < limit and name[common] == previous[common]:
+                common += 1
+            out += encode_offset(len(previous) - common)
+            out += name[common:]
+            out += b'\0'
+            previous = name
+        else:
+            out += name
+            # Pad with 1-8 NULs to a multiple of 8 bytes.
+            out += b'\0' * (8 - (len(out) - start) % 8)
+    return bytes(out)
+
+def serialize_cache_tree(tree: Iterable[CacheTreeEntry]) -> bytes:
+    '''
+    Serialize the TREE extension.
+    '''
+    out = bytearray()
+    for t in tree:
+        name = t.path.rpartition('/')[2].encode('utf-8', 'surrogateescape')
+        out += b'%s\0%d %d\n' % (name, t.entry_count, t.subtrees)
+        if t.entry_count >= 0 and t.oid is not None:
+            out += bytes.fromhex(t.oid)
+    return bytes(out)
+
+def serialize_resolve_undo(entries: Iterable[ResolveUndo]) -> bytes:
+    '''
+    Serialize the REUC extension.
+    '''
+    out = bytearray()
+    for r in entries:
+        out += r.path.encode('utf-8', 'surrogateescape') + b'\0'
+        for mode in r.modes:
+            out += b'%o\0' % mode
+        for mode, oid in zip(r.modes, r.oids):
+            if mode and oid is not None:
+                out += bytes.fromhex(oid)
+    return bytes(out)
+
+def update_cache_tree(tree: Sequence[CacheTreeEntry],
+                      changed: Iterable[str | bytes]) -> list[CacheTreeEntry]:
+    '''
+    Carry a cache tree over a set of changes: the directories containing
+    any added, removed or changed path (and their parents) are invalidated;
+    the rest keep their trees.
+    '''
+    invalid: set[str] = set()
+    for name in changed:
+        if isinstance(name, bytes):
+            name = name.decode('utf-8', 'surrogateescape')
+        invalid.add('')
+        parts = name.split('/')[:-1]
+        for i in range(1, len(parts) + 1):
+            invalid.add('/'.join(parts[:i]))
+    return [
+        t._replace(entry_count=-1, oid=None) if t.path in invalid else t
+        for t in tree
+    ]
+
+def _write_shared(git_dir: Path, data: bytes, checksum: bytes) -> str:
+    '''
+    Write a shared index, named for its checksum, and return the name.
+    '''
+    name = checksum.hex()
+    path = git_dir / f'sharedindex.{name}'
+    if path.exists():
+        os.utime(path)
+        return name
+    fd, tmp = tempfile.mkstemp(dir=git_dir, prefix='sharedindex_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return name
+
+def _finish(version: int, count: int, body: bytes,
+            extensions: Sequence[tuple[bytes, bytes]],
+            algorithm: 'HashAlgorithm') -> tuple[bytes, bytes]:
+    h = hashlib.new(algorithm)
+    parts = [_header.pack(SIGNATURE, version, count), body]
+    for signature, data in extensions:
+        parts += (_ext.pack(signature, len(data)), data)
+    for part in parts:
+        h.update(part)
+    checksum = h.digest()
+    return b''.join(parts) + checksum, checksum
+
+class _Split(NamedTuple):
+    shared_index: str
+    # The replacements, in shared index order, then the additions.
+    front: IndexTable
+    replaced: int
+    link: bytes
+
+def _split(path: Path,
+           table: IndexTable,
+           algorithm: 'HashAlgorithm',
+           max_percent_change: int) -> Optional[_Split]:
+    '''
+    Work out the split index to write against the current shared index, or
+    None if there is none, or the changes since are too many.
+    '''
+    try:
+        current = read_index(path, algorithm=algorithm)
+    except FileNotFoundError:
+        return None
+    if current.shared_index is None:
+        return None
+    shared = read_index(path.parent / f'sharedindex.{current.shared_index}',
+                        algorithm=algorithm).entries
+    replaced: list[tuple[int, int]] = []
+    added: list[int] = []
+    deleted: list[int] = []
+    # Both are sorted: walk them together.
+    i = j = 0
+    n, m = shared.rows, table.rows
+    while i < n or j < m:
+        old = shared.key_at(i) if i < n else None
+        new = table.key_at(j) if j < m else None
+        if new is None or (old is not None and old < new):
+            deleted.append(i)
+            i += 1
+        elif old is None or new < old:
+            added.append(j)
+            j += 1
+        else:
+            if shared.row_at(i) != table.row_at(j):
+                replaced.append((i, j))
+            i += 1
+            j += 1
+    if (len(replaced) + len(added) + len(deleted)) * 100 > max_percent_change * n:
+        return None
+    front = IndexTable(algorithm)
+    for j in [j for _, j in replaced] + added:
+        front.append(table.path_at(j), table.stage[j], table.row_at(j))
+    link = (bytes.fromhex(current.shared_index)
+            + ewah.encode(deleted, n)
+            + ewah.encode((i for i, _ in replaced), n))
+    return _Split(current.shared_index, front, len(replaced), link)
+
+def write_index(path: Path,
+                entries: IndexTable | Iterable[tuple[int, IndexEntry]], /, *,
+                version: int = 2,
+                algorithm: 'HashAlgorithm' = 'sha1',
+                cache_tree: Optional[Sequence[CacheTreeEntry]] = None,
+                resolve_undo: Optional[Sequence[ResolveUndo]] = None,
+                split: bool = False,
+                max_percent_change: int = MAX_PERCENT_CHANGE) -> IndexFile:
+    '''
+    Write a table, or (stage, entry) pairs in any order, to the index file
+    at path, under its lock.
+
+    As git does, version 2 is written as 3 if any entry has extended flags
+    (skip-worktree, intent-to-add), and 3 as 2 if none does.
+
+    :param split: Write a split index. The current shared index is reused
+        if the changes since it amount to no more than max_percent_change
+        percent of its entries; otherwise a new one is written.
+    :return: What was written, as if read back.
+    '''
+    if version not in (2, 3, 4):
+        raise ValueError(f'Invalid index version {version}')
+    if isinstance(entries, IndexTable):
+        table = entries
+        table.compact()
+    else:
+        table = IndexTable.from_entries(entries, algorithm)
+    if version < 4:
+        extended = SKIP_WORKTREE | INTENT_TO_ADD
+        version = 3 if any(bits & extended for bits in table.flags) else 2
+    extensions: list[tuple[bytes, bytes]] = []
+    if cache_tree:
+        extensions.append((b'TREE', serialize_cache_tree(cache_tree)))
+    if resolve_undo:
+        extensions.append((b'REUC', serialize_resolve_undo(resolve_undo)))
+    shared_name = None
+    with LockFile(path) as f:
+        if split:
+            plan = _split(path, table, algorithm, max_percent_change)
+            if plan is None:
+                data, checksum = _finish(version, table.rows,
+                                         serialize_entries(table, version),
+                                         (), algorithm)
+                shared_name = _write_shared(path.parent, data, checksum)
+                empty = ewah.encode((), table.rows)
+                plan = _Split(shared_name, IndexTable(algorithm), 0, checksum + empty + empty)
+            shared_name = plan.shared_index
+            body = serialize_entries(plan.front, version, strip=plan.replaced)
+            count = plan.front.rows
+            extensions.insert(0, (b'link', plan.link))
+        else:
+            body = serialize_entries(table, version)
+            count = table.rows
+        data, checksum = _finish(version, count, body, extensions, algorithm)
+        f.write(data)
+    return IndexFile(
+        version=version,
+        entries=table,
+        cache_tree=list(cache_tree) if cache_tree else None,
+        resolve_undo=list(resolve_undo) if resolve_undo else None,
+        untracked=None,
+        extensions={sig.decode(): ext for sig, ext in extensions},
+        checksum=checksum,
+        shared_index=shared_name,
+    )
@@ -1,6 +1,17 @@
 from gitgo.lowlevel.lowlevel import git_tag, git_branch, git_checkout, git_clone, git_config, \
     git_credential, git_set_credentials, git_init, git_push, git_pull, git_status, git_merge, \
-    git_remote, git_fetch
+    git_remote, git_fetch, git_rev_parse, git_multi_pack_index
+from gitgo.lowlevel.async_lowlevel import async_git_fetch, async_git_status, async_git_rev_parse
+from gitgo.lowlevel.catfile import CatFile, CatFilePool, ObjHeader
+from gitgo.lowlevel.runner import run_options
+from gitgo.lowlevel.fanout import fan_out, FanoutResult
+from gitgo.lowlevel.metrics import MetricsRegistry, metrics, enable_metrics, disable_metrics
+from gitgo.lowlevel.config import ConfigSnapshot, ConfigEntry, config_snapshot, \
+    enable_config_snapshots, disable_config_snapshots
+from gitgo.lowlevel.status import git_status_v2, parse_status_v2, BranchStatus, \
+    ChangedEntry, RenamedEntry, UnmergedEntry, UntrackedEntry, IgnoredEntry, StatusEntry, StatusRecord
+from gitgo.lowlevel.fetch import FetchCoordinator, FetchStats
+from gitgo.lowlevel.cache import CommandCache, CacheStats, enable_cache, disable_cache, command_cache
 
 __all__ = [
     'git_tag',
@@ -17,4 +28,41 @@ __all__ = [
     'git_merge',
     'git_remote',
     'git_fetch',
+    'git_rev_parse',
+    'git_multi_pack_index',
+    'async_git_fetch',
+    'async_git_status',
+    'async_git_rev_parse',
+    'CatFile',
+    'CatFilePool',
+    'ObjHeader',
+    'run_options',
+    'fan_out',
+    'FanoutResult',
+    'MetricsRegistry',
+    'metrics',
+    'enable_metrics',
+    'disable_metrics',
+    'ConfigSnapshot',
+    'ConfigEntry',
+    'config_snapshot',
+    'enable_config_snapshots',
+    'disable_config_snapshots',
+    'git_status_v2',
+    'parse_status_v2',
+    'BranchStatus',
+    'ChangedEntry',
+    'RenamedEntry',
+    'UnmergedEntry',
+    'UntrackedEntry',
+    'IgnoredEntry',
+    'StatusEntry',
+    'StatusRecord',
+    'FetchCoordinator',
+    'FetchStats',
+    'CommandCache',
+    'CacheStats',
+    'enable_cache',
+    'disable_cache',
+    'command_cache',
 ]
\ No newline at end of file
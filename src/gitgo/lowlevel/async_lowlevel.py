@@ -0,0 +1,11 @@
+# Asyncio versions of the git command wrappers.
+#
+# These take the same arguments as their synchronous counterparts in
+# gitgo.lowlevel.lowlevel, and run through async_git, which bounds the
+# number of git processes running at once.
+
+from gitgo.lowlevel.lowlevel import git_fetch, git_status, git_rev_parse
+
+async_git_fetch = git_fetch.run_async
+async_git_status = git_status.run_async
+async_git_rev_parse = git_rev_parse.run_async
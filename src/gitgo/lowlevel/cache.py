@@ -0,0 +1,302 @@
+'''
+An opt-in cache for the results of idempotent, read-only git commands.
+
+Entries are keyed by the argument list, the working directory, and a cheap
+fingerprint of the repository state: the modification times of ``HEAD``,
+``packed-refs``, every directory under ``refs``, the reftable table list,
+and the config files. git writes a ref by renaming a lock file over it,
+which changes the mtime of the directory it is in, however deeply nested.
+Anything that moves a ref or changes the config changes the fingerprint,
+so stale entries are simply never hit again, and age out of the LRU.
+
+Commands run through a runner that are not known to be read-only invalidate
+the entries for their repository. Writes made by other means can be
+announced with `CommandCache.invalidate`.
+'''
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, NamedTuple, Optional
+import os
+import threading
+
+# Subcommands whose output depends only on the repository state in the fingerprint.
+CACHEABLE = frozenset((
+    'rev-parse',
+    'cat-file',
+    'ls-tree',
+    'merge-base',
+    'show-ref',
+    'for-each-ref',
+    'var',
+))
+
+# Config actions that only read.
+CONFIG_READS = frozenset((
+    '--get',
+    '--get-all',
+    '--get-regexp',
+    '--get-urlmatch',
+    '--list',
+    '-l',
+))
+
+# Subcommands that may not be cached, but do not change the repository either.
+READ_ONLY = CACHEABLE | frozenset((
+    'config',  # Writes are dealt with in is_read_only()
+    'status',
+    'log',
+    'show',
+    'diff',
+    'ls-files',
+    'ls-remote',
+    'rev-list',
+    'describe',
+    'blame',
+    'grep',
+    'credential',
+))
+
+def subcommand(xargs: list[str]) -> Optional[str]:
+    '''
+    Return the git subcommand in the argument list, or None if there are
+    global options we do not try to interpret.
+    '''
+    if not xargs or xargs[0].startswith('-'):
+        return None
+    return xargs[0]
+
+def is_cacheable(cmd: str, xargs: list[str]) -> bool:
+    '''
+    Return True if the command's result can be cached.
+    '''
+    if cmd != 'git':
+        return False
+    match subcommand(xargs):
+        case 'config':
+            return any(a in CONFIG_READS for a in xargs[1:])
+        case None:
+            return False
+        case sub:
+            return sub in CACHEABLE
+
+def is_read_only(cmd: str, xargs: list[str]) -> bool:
+    '''
+    Return True if the command is known not to modify the repository.
+    '''
+    if cmd != 'git':
+        return True
+    match subcommand(xargs):
+        case 'config':
+            return is_cacheable(cmd, xargs)
+        case None:
+            return False
+        case sub:
+            return sub in READ_ONLY
+
+def _find_git_dir(cwd: Path) -> tuple[Optional[Path], tuple[Path, ...]]:
+    '''
+    Find the git directory, returning it with the directories looked in.
+    '''
+    searched: list[Path] = []
+    for d in (cwd, *cwd.parents):
+        searched.append(d)
+        dotgit = d / '.git'
+        if dotgit.is_dir():
+            return dotgit, tuple(searched)
+        if dotgit.is_file():
+            line = dotgit.read_text().strip()
+            if line.startswith('gitdir:'):
+                return (d / line[7:].strip()).resolve(), tuple(searched)
+        if d.name.endswith('.git') and (d / 'HEAD').is_file() and (d / 'objects').is_dir():
+            return d, tuple(searched)
+    return None, tuple(searched)
+
+def find_git_dir(cwd: Path) -> Optional[Path]:
+    '''
+    Find the git directory for the repository containing cwd, following
+    ``.git`` files (as used by linked worktrees and submodules).
+    '''
+    return _find_git_dir(cwd)[0]
+
+def common_dir(git_dir: Path) -> Path:
+    '''
+    Return the common git directory; for a linked worktree, this is the
+    main repository's git directory.
+    '''
+    common = git_dir / 'commondir'
+    if common.is_file():
+        return (git_dir / common.read_text().strip()).resolve()
+    return git_dir
+
+def _mtime(path: Path) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+def _global_configs() -> tuple[Path, ...]:
+    home = Path.home()
+    xdg = Path(os.environ.get('XDG_CONFIG_HOME') or home / '.config')
+    configs = (home / '.gitconfig', xdg / 'git' / 'config')
+    if 'GIT_CONFIG_GLOBAL' in os.environ:
+        return (*configs, Path(os.environ['GIT_CONFIG_GLOBAL']))
+    return configs
+
+def _tree_mtimes(top: Path) -> tuple[int, ...]:
+    '''
+    The mtimes of top and of every directory under it, in a fixed order.
+    '''
+    mtimes: list[int] = []
+    stack = [os.fsencode(top)]
+    while stack:
+        d = stack.pop()
+        try:
+            mtimes.append(os.stat(d).st_mtime_ns)
+            with os.scandir(d) as entries:
+                stack.extend(sorted((e.path for e in entries if e.is_dir(follow_symlinks=False)),
+                                    reverse=True))
+        except OSError:
+            mtimes.append(0)
+    return tuple(mtimes)
+
+def repo_fingerprint(git_dir: Path) -> tuple[int, ...]:
+    '''
+    A cheap fingerprint of the repository state: the mtimes of the files
+    and ref directories whose change could change the result of a read-only
+    command.
+    '''
+    common = common_dir(git_dir)
+    paths = (
+        git_dir / 'HEAD',
+        git_dir / 'config.worktree',
+        common / 'packed-refs',
+        common / 'config',
+        common / 'reftable' / 'tables.list',
+        *_global_configs(),
+    )
+    refs = _tree_mtimes(common / 'refs')
+    if git_dir != common:
+        # Per-worktree refs, such as refs/bisect.
+        refs += _tree_mtimes(git_dir / 'refs')
+    return (*(_mtime(p) for p in paths), *refs)
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    size: int
+
+class CommandCache:
+    '''
+    An LRU cache of command results, keyed on argv, cwd, and repository state.
+    '''
+    maxsize: int
+    _entries: OrderedDict[Hashable, Any]
+
+    def __init__(self, maxsize: int = 256):
+        if maxsize < 1:
+            raise ValueError(f'Invalid cache size {maxsize}')
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        # The git directory for each cwd, with the directories searched for
+        # it and their mtimes: creating or removing a .git changes them.
+        self._git_dirs: dict[Path, tuple[Optional[Path], tuple[Path, ...], tuple[int, ...]]] = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(maxsize={self.maxsize}, size={len(self._entries)})'
+
+    def git_dir(self, cwd: Path) -> Optional[Path]:
+        '''
+        The git directory for cwd, remembered for future calls while the
+        directories searched for it are unchanged.
+        '''
+        found = self._git_dirs.get(cwd)
+        if found is not None:
+            git_dir, searched, mtimes = found
+            if tuple(_mtime(d) for d in searched) == mtimes:
+                return git_dir
+        git_dir, searched = _find_git_dir(cwd)
+        self._git_dirs[cwd] = (git_dir, searched, tuple(_mtime(d) for d in searched))
+        return git_dir
+
+    def key(self, cmd: str, xargs: list[str], cwd: Optional[Path|str], *options: Hashable) -> Optional[Hashable]:
+        '''
+        Return the cache key for the command, or None if it cannot be cached.
+        '''
+        if not is_cacheable(cmd, xargs):
+            return None
+        xcwd = Path(cwd).resolve() if cwd is not None else Path.cwd()
+        git_dir = self.git_dir(xcwd)
+        if git_dir is None:
+            return None
+        return (git_dir, repo_fingerprint(git_dir), xcwd, cmd, tuple(xargs), options)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, cwd: Optional[Path|str] = None) -> None:
+        '''
+        Drop cached results for the repository containing cwd, or all
+        cached results if cwd is None.
+        '''
+        with self._lock:
+            self.invalidations += 1
+            if cwd is None:
+                self._entries.clear()
+                self._git_dirs.clear()
+                return
+            git_dir = self.git_dir(Path(cwd).resolve())
+            for key in [k for k in self._entries if k[0] == git_dir]:
+                del self._entries[key]
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(self.hits, self.misses, self.evictions, self.invalidations, len(self._entries))
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+_active: Optional[CommandCache] = None
+
+def enable_cache(maxsize: int = 256) -> CommandCache:
+    '''
+    Start caching read-only command results. Returns the cache.
+    '''
+    global _active
+    _active = CommandCache(maxsize)
+    return _active
+
+def disable_cache() -> None:
+    '''
+    Stop caching command results, and discard the cache.
+    '''
+    global _active
+    _active = None
+
+def command_cache() -> Optional[CommandCache]:
+    '''
+    Return the active cache, if caching is enabled.
+    '''
+    return _active
@@ -0,0 +1,352 @@
+'''
+Long-lived ``git cat-file --batch`` coprocesses.
+
+Spawning ``git cat-file`` once per object dominates the cost of any
+traversal of the object store. Instead, we keep a ``cat-file`` process
+running per repository and talk to it over its pipes, one request line
+per object.
+'''
+
+from typing import IO, Iterable, Iterator, Optional, Literal, NamedTuple, cast
+from pathlib import Path
+from subprocess import Popen, PIPE, DEVNULL
+from queue import Queue, Empty
+import threading
+import weakref
+
+from gitgo.log import log
+
+CatFileMode = Literal['batch', 'batch-check']
+
+# Requests written to a batch process at a time.
+BATCH_LINES = 256
+
+class ObjHeader(NamedTuple):
+    '''
+    The header line returned by ``cat-file``: the full OID, type, and size.
+    '''
+    oid: str
+    type: str
+    size: int
+
+def _terminate(proc: Popen) -> None:
+    '''
+    Shut down a ``cat-file`` process. Closing stdin lets it exit on its own;
+    we only kill it if it does not.
+    '''
+    if proc.poll() is not None:
+        return
+    try:
+        if proc.stdin:
+            proc.stdin.close()
+        proc.wait(timeout=5)
+    except Exception:
+        proc.kill()
+        proc.wait()
+
+class CatFile:
+    '''
+    A single ``git cat-file --batch`` or ``--batch-check`` coprocess.
+
+    Requests are serialized with a lock, so an instance may be shared between
+    threads, but only one request is in flight at a time. Use a `CatFilePool`
+    for concurrency.
+
+    If the process dies, it is restarted and the request retried once.
+    '''
+    mode: CatFileMode
+    cwd: Optional[Path]
+    cmd: str
+    _proc: Optional[Popen]
+
+    def __init__(self, cwd: Optional[Path|str] = None, /, *,
+                 mode: CatFileMode = 'batch',
+                 cmd: str = 'git'):
+        self.mode = mode
+        self.cwd = Path(cwd) if cwd is not None else None
+        self.cmd = cmd
+        self._proc = None
+        self._lock = threading.Lock()
+        self._finalizer: Optional[weakref.finalize] = None
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.cwd}, mode={self.mode!r})'
+
+    def __enter__(self) -> 'CatFile':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    @property
+    def running(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self) -> None:
+        '''
+        Start the coprocess, if it is not already running.
+        '''
+        if self.running:
+            return
+        if self._proc is not None:
+            log.warning(f'{self} exited with {self._proc.returncode}; restarting')
+            self.close()
+        argv = [self.cmd, 'cat-file', f'--{self.mode}']
+        log.debug(f'> {argv} (coprocess)')
+        self._proc = Popen(argv,
+                           cwd=self.cwd,
+                           stdin=PIPE,
+                           stdout=PIPE,
+                           stderr=DEVNULL)
+        self._finalizer = weakref.finalize(self, _terminate, self._proc)
+
+    def close(self) -> None:
+        '''
+        Shut down the coprocess. It will be restarted on the next request.
+        '''
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._proc = None
+
+    @property
+    def _stdin(self) -> IO[bytes]:
+        return cast(IO[bytes], cast(Popen, self._proc).stdin)
+
+    @property
+    def _stdout(self) -> IO[bytes]:
+        return cast(IO[bytes], cast(Popen, self._proc).stdout)
+
+    @staticmethod
+    def _check(obj: str) -> str:
+        if '\n' in obj:
+            raise ValueError(f'Invalid object name {obj!r}')
+        return obj
+
+    def _send(self, *objs: str) -> None:
+        self._stdin.write(b''.join(f'{o}\n'.encode() for o in objs))
+        self._stdin.flush()
+
+    def _read_header(self, obj: str) -> Optional[ObjHeader]:
+        line = self._stdout.readline()
+        if not line:
+            raise EOFError(f'{self} closed its output')
+        text = line.decode().rstrip('\n')
+        # The name is echoed back as given, and may contain spaces.
+        if text.endswith((' missing', ' ambiguous')):
+            return None
+        match text.split():
+            case [oid, type, size] if size.isdigit():
+                return ObjHeader(oid, type, int(size))
+            case _:
+                raise ValueError(f'{self}: unexpected response for {obj}: {line!r}')
+
+    def _read_body(self, header: ObjHeader) -> bytes:
+        data = self._stdout.read(header.size + 1)
+        if len(data) != header.size + 1:
+            raise EOFError(f'{self} closed its output')
+        return data[:-1]
+
+    def _request(self, obj: str, fn):
+        self._check(obj)
+        with self._lock:
+            for attempt in (1, 2):
+                self.start()
+                try:
+                    self._send(obj)
+                    return fn(obj)
+                except (BrokenPipeError, EOFError):
+                    self.close()
+                    if attempt == 2:
+                        raise
+                except BaseException:
+                    # Whatever is left of the response is still in the pipe.
+                    cast(Popen, self._proc).kill()
+                    self.close()
+                    raise
+
+    def header(self, obj: str) -> Optional[ObjHeader]:
+        '''
+        Return the header for the given object name, or None if it does not exist.
+        In ``batch`` mode, the contents are read and discarded.
+        '''
+        def fn(obj: str):
+            header = self._read_header(obj)
+            if header is not None and self.mode == 'batch':
+                self._read_body(header)
+            return header
+        return self._request(obj, fn)
+
+    def read(self, obj: str) -> Optional[tuple[ObjHeader, bytes]]:
+        '''
+        Return the header and contents for the given object name, or None
+        if it does not exist. Requires ``batch`` mode.
+        '''
+        if self.mode != 'batch':
+            raise ValueError(f'{self} cannot read object contents')
+        def fn(obj: str):
+            header = self._read_header(obj)
+            if header is None:
+                return None
+            return header, self._read_body(header)
+        return self._request(obj, fn)
+
+    def read_many(self, objs: Iterable[str]) -> Iterator[tuple[str, Optional[tuple[ObjHeader, bytes]]]]:
+        '''
+        Read many objects in one pipelined exchange, yielding each object
+        name with its header and contents (or None) as they arrive. The
+        requests are written from another thread, so neither side blocks on
+        a full pipe. Requires ``batch`` mode.
+
+        Nothing else can use this process until the iteration finishes. If
+        it is abandoned part way, the process is stopped, to be restarted
+        by the next request.
+        '''
+        if self.mode != 'batch':
+            raise ValueError(f'{self} cannot read object contents')
+        objs = [self._check(o) for o in objs]
+        if not objs:
+            return
+        with self._lock:
+            self.start()
+            proc = cast(Popen, self._proc)
+            stdin = self._stdin
+            def write() -> None:
+                try:
+                    for i in range(0, len(objs), BATCH_LINES):
+                        stdin.write(b''.join(f'{o}\n'.encode() for o in objs[i:i + BATCH_LINES]))
+                        stdin.flush()
+                except (OSError, ValueError):
+                    # The process died, or was stopped; the reader sees it.
+                    pass
+            writer = threading.Thread(target=write, name='gitgo-cat-file', daemon=True)
+            writer.start()
+            done = 0
+            try:
+                for obj in objs:
+                    header = self._read_header(obj)
+                    result = (header, self._read_body(header)) if header is not None else None
+                    done += 1
+                    yield obj, result
+            finally:
+                if done < len(objs):
+                    proc.kill()
+                writer.join()
+                if done < len(objs):
+                    self.close()
+
+class CatFilePool:
+    '''
+    A small pool of `CatFile` coprocesses for one repository, one set for
+    contents (``--batch``) and one for headers (``--batch-check``).
+
+    Processes are started lazily, up to `size` of each kind.
+    '''
+    cwd: Optional[Path]
+    size: int
+
+    def __init__(self, cwd: Optional[Path|str] = None, /, *,
+                 size: int = 2,
+                 cmd: str = 'git'):
+        if size < 1:
+            raise ValueError(f'Invalid pool size {size}')
+        self.cwd = Path(cwd) if cwd is not None else None
+        self.size = size
+        self.cmd = cmd
+        self._lock = threading.Lock()
+        self._closed = False
+        self._all: list[CatFile] = []
+        self._idle: dict[CatFileMode, Queue[CatFile]] = {
+            'batch': Queue(),
+            'batch-check': Queue(),
+        }
+        self._count: dict[CatFileMode, int] = {
+            'batch': 0,
+            'batch-check': 0,
+        }
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.cwd}, size={self.size})'
+
+    def __enter__(self) -> 'CatFilePool':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def _take(self, mode: CatFileMode) -> Optional[CatFile]:
+        '''
+        An idle process, or a new one if there are fewer than `size`; None
+        if every one is in use.
+        '''
+        if self._closed:
+            raise ValueError(f'{self} is closed')
+        try:
+            return self._idle[mode].get_nowait()
+        except Empty:
+            pass
+        with self._lock:
+            if self._count[mode] < self.size:
+                self._count[mode] += 1
+                proc = CatFile(self.cwd, mode=mode, cmd=self.cmd)
+                self._all.append(proc)
+                return proc
+        return None
+
+    def _acquire(self, mode: CatFileMode) -> CatFile:
+        return self._take(mode) or self._idle[mode].get()
+
+    def _release(self, proc: CatFile) -> None:
+        if self._closed:
+            proc.close()
+        else:
+            self._idle[proc.mode].put(proc)
+
+    def header(self, obj: str) -> Optional[ObjHeader]:
+        '''
+        Return the header for the given object name, or None if it does not exist.
+        '''
+        proc = self._acquire('batch-check')
+        try:
+            return proc.header(obj)
+        finally:
+            self._release(proc)
+
+    def read(self, obj: str) -> Optional[tuple[ObjHeader, bytes]]:
+        '''
+        Return the header and contents for the given object name, or None
+        if it does not exist.
+        '''
+        proc = self._acquire('batch')
+        try:
+            return proc.read(obj)
+        finally:
+            self._release(proc)
+
+    def read_many(self, objs: Iterable[str]) -> Iterator[tuple[str, Optional[tuple[ObjHeader, bytes]]]]:
+        '''
+        Read many objects through one process (see `CatFile.read_many`).
+
+        The process is held until the iteration ends, so when every one is
+        taken, perhaps by read_many calls the caller is still iterating
+        (as in a nested walk of a tree), waiting for one could be waiting
+        for ever: a temporary process is used instead.
+        '''
+        proc = self._take('batch')
+        if proc is None:
+            with CatFile(self.cwd, mode='batch', cmd=self.cmd) as temp:
+                yield from temp.read_many(objs)
+            return
+        try:
+            yield from proc.read_many(objs)
+        finally:
+            self._release(proc)
+
+    def close(self) -> None:
+        '''
+        Shut down all the coprocesses in the pool.
+        '''
+        self._closed = True
+        with self._lock:
+            for proc in self._all:
+                proc.close()
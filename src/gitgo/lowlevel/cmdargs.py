@@ -1,5 +1,6 @@
-from typing import Generator, Optional, Callable, Any, cast, Tuple, NamedTuple
+from typing import Generator, Iterator, Optional, Callable, Any, cast, Tuple, NamedTuple
 from pathlib import Path
+from dataclasses import dataclass, field
 
 # The type of thing we can pass to commands
 CmdArg = str | Path | int | float | bool
@@ -9,6 +10,89 @@ class CmdResult(NamedTuple):
     stderr: str
     returncode: int | bool
 
+def split_records(data: bytes|bytearray, sep: bytes = b'\0') -> Iterator[memoryview]:
+    '''
+    Return an iterator of records in data, separated by sep, as memoryview
+    slices of the original data, without copying. A trailing separator does
+    not produce an empty final record.
+    '''
+    view = memoryview(data)
+    start = 0
+    end = len(view)
+    while start < end:
+        pos = data.find(sep, start)
+        if pos < 0:
+            pos = end
+        yield view[start:pos]
+        start = pos + len(sep)
+
+class BytesCmdResult:
+    '''
+    The result of running a command in bytes mode. The raw output is kept as
+    `bytes`; `stdout` and `stderr` are decoded (as UTF-8) only when accessed.
+
+    It unpacks and indexes like a `CmdResult`.
+    '''
+    __slots__ = ('raw_stdout', 'raw_stderr', 'returncode', '_stdout', '_stderr')
+    raw_stdout: bytes
+    raw_stderr: bytes
+    returncode: int | bool
+    _stdout: Optional[str]
+    _stderr: Optional[str]
+
+    def __init__(self, raw_stdout: Optional[bytes], raw_stderr: Optional[bytes], returncode: int | bool):
+        self.raw_stdout = raw_stdout or b''
+        self.raw_stderr = raw_stderr or b''
+        self.returncode = returncode
+        self._stdout = None
+        self._stderr = None
+
+    @property
+    def stdout(self) -> str:
+        if self._stdout is None:
+            self._stdout = self.raw_stdout.decode('utf-8', 'surrogateescape')
+        return self._stdout
+
+    @property
+    def stderr(self) -> str:
+        if self._stderr is None:
+            self._stderr = self.raw_stderr.decode('utf-8', 'surrogateescape')
+        return self._stderr
+
+    def view(self) -> memoryview:
+        '''
+        Return a memoryview on the raw stdout.
+        '''
+        return memoryview(self.raw_stdout)
+
+    def records(self, sep: bytes = b'\0') -> Iterator[memoryview]:
+        '''
+        Return an iterator over the records of stdout (NUL-separated by default,
+        for -z output) as memoryview slices.
+        '''
+        return split_records(self.raw_stdout, sep)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter((self.stdout, self.stderr, self.returncode))
+
+    def __getitem__(self, idx: int) -> Any:
+        return (self.stdout, self.stderr, self.returncode)[idx]
+
+    def __len__(self) -> int:
+        return 3
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(raw_stdout=<{len(self.raw_stdout)} bytes>, ' \
+            f'raw_stderr={self.raw_stderr!r}, returncode={self.returncode!r})'
+
+@dataclass(frozen=True)
+class Invocation:
+    '''
+    The arguments for a command, and any options for the runner.
+    '''
+    args: tuple[CmdArg, ...]
+    options: dict[str, Any] = field(default_factory=dict)
+
 def mkstr(v: Optional[CmdArg]) -> str:
     '''
     Return a string representation of the given value for Git.
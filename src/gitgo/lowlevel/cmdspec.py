@@ -0,0 +1,175 @@
+'''
+Declarative command specifications, compiled to fast argv builders.
+
+A `CmdSpec` is a table of the options a command accepts. The first time it
+is used, it is compiled (once) into a Python function with one keyword
+argument per option, which emits the argv fragment directly. All the work
+the generator-based helpers in `gitgo.lowlevel.cmdargs` repeat on every
+call (mapping names to flags, building kwargs dicts, checking keyword
+lists) is done at compile time.
+
+The builders produce exactly the arguments the equivalent `cmdargs`
+helpers would:
+
+    Flag      -- flags():        --name if truthy
+    Value     -- arg1s():        --name=value if truthy
+    Separate  -- arg2s():        --name value if truthy
+    EnumOrTrue -- enum_or_true(): --name if True, --name=value for a keyword
+    OneOf     -- exclusive():    at most one (or exactly one) of its flags
+'''
+
+from abc import ABC, abstractmethod
+from functools import cached_property
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+from gitgo.lowlevel.cmdargs import mkstr
+
+def flag_name(name: str, flag: Optional[str] = None) -> str:
+    '''
+    Return the flag for an argument name, the way `mkflg` does: flag (or the
+    name with underscores replaced by dashes) is used as is if it starts with
+    '-', otherwise '--' is prepended.
+    '''
+    f = flag if flag is not None else name.replace('_', '-')
+    return f if f.startswith('-') else f'--{f}'
+
+class Param(ABC):
+    '''
+    A keyword argument of a command, and how it maps to argv.
+    '''
+    name: str
+    flag: str
+
+    def __init__(self, name: str, flag: Optional[str] = None):
+        if not name.isidentifier():
+            raise ValueError(f'Invalid parameter name {name!r}')
+        self.name = name
+        self.flag = flag_name(name, flag)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.name!r}, {self.flag!r})'
+
+    def names(self) -> Iterable[str]:
+        yield self.name
+
+    @abstractmethod
+    def emit(self, ns: dict[str, Any]) -> list[str]:
+        '''
+        Return the lines of Python for this parameter. ns holds constants
+        referred to by the code.
+        '''
+        ...
+
+class Flag(Param):
+    def emit(self, ns: dict[str, Any]) -> list[str]:
+        return [f'if {self.name}: out.append({self.flag!r})']
+
+class Value(Param):
+    def emit(self, ns: dict[str, Any]) -> list[str]:
+        return [f'if {self.name}: out.append({self.flag + "="!r} + mkstr({self.name}))']
+
+class Separate(Param):
+    def emit(self, ns: dict[str, Any]) -> list[str]:
+        return [f'if {self.name}: out += ({self.flag!r}, mkstr({self.name}))']
+
+class EnumOrTrue(Param):
+    keywords: frozenset[str]
+
+    def __init__(self, name: str, keywords: Sequence[str], flag: Optional[str] = None):
+        super().__init__(name, flag)
+        self.keywords = frozenset(keywords)
+        self._message = f'{self.flag[2:]} must be one of {list(keywords)} or True or False'
+
+    def emit(self, ns: dict[str, Any]) -> list[str]:
+        ns[f'_kw_{self.name}'] = self.keywords
+        ns[f'_msg_{self.name}'] = self._message
+        return [
+            f'if {self.name} is True: out.append({self.flag!r})',
+            f'elif {self.name}:',
+            f'    if {self.name}.__class__ is not str or {self.name} not in _kw_{self.name}:',
+            f'        raise ValueError(_msg_{self.name})',
+            f'    out.append({self.flag + "="!r} + {self.name})',
+        ]
+
+class OneOf(Param):
+    '''
+    A group of flags, at most one of which may be given (exactly one,
+    if required).
+    '''
+    params: tuple[Flag, ...]
+    required: bool
+
+    def __init__(self, *params: Flag, required: bool = False):
+        self.params = params
+        self.required = required
+        self.name = '_'.join(p.name for p in params)
+        self.flag = ''
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}{self.params!r}'
+
+    def names(self) -> Iterable[str]:
+        return (p.name for p in self.params)
+
+    def emit(self, ns: dict[str, Any]) -> list[str]:
+        names = [p.name for p in self.params]
+        ns[f'_names_{self.name}'] = tuple(names)
+        count = ' + '.join(f'(1 if {n} else 0)' for n in names)
+        lines = [
+            f'_n = {count}',
+            'if _n > 1:',
+            f'    raise ValueError(f"Only one of {{[n for n, v in zip(_names_{self.name}, ({", ".join(names)},)) if v]}} may be specified.")',
+        ]
+        if self.required:
+            lines += [
+                'if _n == 0:',
+                f'    raise ValueError("One of {names} must be specified.")',
+            ]
+        for p in self.params:
+            lines += p.emit(ns)
+        return lines
+
+class CmdSpec:
+    '''
+    A table of options for a command. Calling the spec with keyword arguments
+    returns the argv fragment for them, in table order. Omitted arguments
+    are treated as None.
+
+    The wrappers in gitgo.lowlevel.lowlevel call `build` directly, which
+    saves repacking the keyword arguments.
+    '''
+    params: tuple[Param, ...]
+
+    def __init__(self, *params: Param):
+        self.params = params
+        seen: set[str] = set()
+        for name in (n for p in params for n in p.names()):
+            if name in seen:
+                raise ValueError(f'Duplicate parameter {name!r}')
+            seen.add(name)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}{self.params!r}'
+
+    @cached_property
+    def build(self) -> Callable[..., list[str]]:
+        '''
+        The compiled argv builder.
+        '''
+        ns: dict[str, Any] = {'mkstr': mkstr}
+        names = [n for p in self.params for n in p.names()]
+        body = [line for p in self.params for line in p.emit(ns)]
+        signature = ', '.join(f'{n}=None' for n in names)
+        src = '\n'.join((
+            f'def build(*, {signature}):' if names else 'def build():',
+            '    out = []',
+            *(f'    {line}' for line in body),
+            '    return out',
+        ))
+        exec(compile(src, f'<CmdSpec {", ".join(names)}>', 'exec'), ns)
+        build = ns['build']
+        build.__source__ = src
+        return build
+
+    def __call__(self, **kwargs: Any) -> list[str]:
+        return self.build(**kwargs)
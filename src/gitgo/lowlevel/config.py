@@ -0,0 +1,324 @@
+'''
+An in-memory snapshot of the git configuration for a repository.
+
+The whole configuration is read with a single
+``git config --list -z --show-origin --show-scope``, and lookups are then
+answered in-process. The snapshot notes the modification times of the files
+that contributed to it (and of the standard config files, in case one is
+created), and is reloaded when any of them change.
+'''
+
+from pathlib import Path
+from typing import Literal, NamedTuple, Optional
+from urllib.parse import urlsplit
+import os
+import re
+import threading
+
+from gitgo.lowlevel.cache import find_git_dir, common_dir
+from gitgo.lowlevel.runner import runner, current_options
+
+ConfigType = Literal['bool', 'int', 'bool-or-int', 'path']
+ConfigValue = str | int | bool | Path
+
+git = runner('git')
+
+class ConfigEntry(NamedTuple):
+    '''
+    One setting. A value of None means the key was given without a value,
+    which git treats as true.
+    '''
+    key: str
+    value: Optional[str]
+    scope: str
+    origin: str
+
+def canonical_key(key: str) -> str:
+    '''
+    Return the key as git reports it: section and variable names are case
+    insensitive, and lower-cased; a subsection is case sensitive.
+    '''
+    section, _, rest = key.partition('.')
+    subsection, _, name = rest.rpartition('.')
+    if not name:
+        raise ValueError(f'Invalid config key {key!r}')
+    if subsection:
+        return f'{section.lower()}.{subsection}.{name.lower()}'
+    return f'{section.lower()}.{name.lower()}'
+
+TRUE = frozenset(('true', 'yes', 'on', '1'))
+FALSE = frozenset(('false', 'no', 'off', '0', ''))
+RE_INT = re.compile(r'^\s*([-+]?\d+)\s*([kmg]?)\s*$', re.IGNORECASE)
+UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+def to_bool(value: Optional[str]) -> bool:
+    if value is None:
+        return True
+    v = value.lower()
+    if v in TRUE:
+        return True
+    if v in FALSE:
+        return False
+    try:
+        return to_int(value) != 0
+    except ValueError:
+        raise ValueError(f'Invalid boolean config value {value!r}') from None
+
+def to_int(value: Optional[str]) -> int:
+    m = RE_INT.match(value or '')
+    if not m:
+        raise ValueError(f'Invalid integer config value {value!r}')
+    return int(m[1]) * UNITS[m[2].lower()]
+
+def to_path(value: Optional[str]) -> Path:
+    if not value:
+        raise ValueError('Missing path config value')
+    return Path(os.path.expanduser(value))
+
+def coerce(value: Optional[str], type: Optional[ConfigType]) -> Optional[ConfigValue]:
+    '''
+    Convert a raw config value to the given type, as ``git config --type``
+    would interpret it.
+    '''
+    match type:
+        case None:
+            return value
+        case 'bool':
+            return to_bool(value)
+        case 'int':
+            return to_int(value)
+        case 'bool-or-int':
+            try:
+                return to_int(value)
+            except ValueError:
+                return to_bool(value)
+        case 'path':
+            return to_path(value)
+        case _:
+            raise ValueError(f'Unsupported config type {type!r}')
+
+def format_value(value: Optional[ConfigValue]) -> str:
+    '''
+    Format a coerced value the way ``git config --type`` prints it.
+    '''
+    match value:
+        case None:
+            return ''
+        case bool():
+            return str(value).lower()
+        case _:
+            return str(value)
+
+def _mtime(path: Path) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+def _standard_files(git_dir: Optional[Path]) -> list[Path]:
+    '''
+    The config files that may contribute to a repository's configuration,
+    whether or not they currently exist.
+    '''
+    home = Path.home()
+    xdg = Path(os.environ.get('XDG_CONFIG_HOME') or home / '.config')
+    files = [
+        Path(os.environ.get('GIT_CONFIG_SYSTEM', '/etc/gitconfig')),
+        Path(os.environ.get('GIT_CONFIG_GLOBAL', home / '.gitconfig')),
+        xdg / 'git' / 'config',
+    ]
+    if git_dir is not None:
+        files.append(common_dir(git_dir) / 'config')
+        files.append(git_dir / 'config.worktree')
+    return files
+
+class ConfigSnapshot:
+    '''
+    The configuration visible from a directory, as of when it was loaded.
+    '''
+    cwd: Path
+    entries: list[ConfigEntry]
+    _by_key: dict[str, list[ConfigEntry]]
+    _files: dict[Path, int]
+
+    def __init__(self, cwd: Optional[Path|str] = None, /):
+        self.cwd = Path(cwd) if cwd is not None else Path.cwd()
+        self.load()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.cwd}, entries={len(self.entries)})'
+
+    def load(self) -> None:
+        '''
+        (Re)read the configuration.
+        '''
+        git_dir = find_git_dir(self.cwd.resolve())
+        files = _standard_files(git_dir)
+        result = git('config', '--list', '-z', '--show-origin', '--show-scope',
+                     cwd=self.cwd)
+        self.entries = list(self._parse(result.stdout))
+        for e in self.entries:
+            kind, _, origin = e.origin.partition(':')
+            if kind == 'file':
+                files.append(self.cwd / origin)
+        self._files = {f: _mtime(f) for f in files}
+        by_key: dict[str, list[ConfigEntry]] = {}
+        for e in self.entries:
+            by_key.setdefault(e.key, []).append(e)
+        self._by_key = by_key
+
+    @staticmethod
+    def _parse(data: str):
+        fields = data.split('\0')
+        for scope, origin, kv in zip(fields[0::3], fields[1::3], fields[2::3]):
+            key, nl, value = kv.partition('\n')
+            yield ConfigEntry(key, value if nl else None, scope, origin)
+
+    def is_stale(self) -> bool:
+        '''
+        Return True if any contributing config file has changed.
+        '''
+        return any(_mtime(f) != t for f, t in self._files.items())
+
+    def refresh(self) -> 'ConfigSnapshot':
+        '''
+        Reload if stale. Returns self.
+        '''
+        if self.is_stale():
+            self.load()
+        return self
+
+    def _entries(self, key: str, scope: Optional[str]) -> list[ConfigEntry]:
+        entries = self._by_key.get(canonical_key(key), [])
+        if scope is not None:
+            return [e for e in entries if e.scope == scope]
+        return entries
+
+    def get(self, key: str, *,
+            type: Optional[ConfigType] = None,
+            default: Optional[ConfigValue] = None,
+            scope: Optional[str] = None) -> Optional[ConfigValue]:
+        '''
+        Return the value for key (the last one, if it has several), or default.
+        '''
+        entries = self._entries(key, scope)
+        if not entries:
+            return default
+        return coerce(entries[-1].value, type)
+
+    def get_all(self, key: str, *,
+                type: Optional[ConfigType] = None,
+                scope: Optional[str] = None) -> list[Optional[ConfigValue]]:
+        '''
+        Return all the values for a multi-valued key, in order.
+        '''
+        return [coerce(e.value, type) for e in self._entries(key, scope)]
+
+    def get_regexp(self, pattern: str, *,
+                   type: Optional[ConfigType] = None,
+                   scope: Optional[str] = None) -> list[tuple[str, Optional[ConfigValue]]]:
+        '''
+        Return (key, value) for each setting whose key matches the regular
+        expression, in order.
+        '''
+        rx = re.compile(pattern)
+        return [
+            (e.key, coerce(e.value, type))
+            for e in self.entries
+            if rx.search(e.key) and (scope is None or e.scope == scope)
+        ]
+
+    def get_urlmatch(self, key: str, url: str, *,
+                     type: Optional[ConfigType] = None,
+                     default: Optional[ConfigValue] = None,
+                     scope: Optional[str] = None) -> Optional[ConfigValue]:
+        '''
+        Return the value of ``section.name`` that best matches url, considering
+        ``section.<url>.name`` settings as git does: the most specific host,
+        then the longest path, then a matching user name, win. A plain
+        ``section.name`` applies if no URL-specific setting matches.
+        '''
+        section, _, name = canonical_key(key).partition('.')
+        target = urlsplit(url)
+        best: Optional[tuple[tuple[int, int, int], ConfigEntry]] = None
+        for e in self.entries:
+            if scope is not None and e.scope != scope:
+                continue
+            e_section, _, rest = e.key.partition('.')
+            subsection, _, e_name = rest.rpartition('.')
+            if e_section != section or e_name != name:
+                continue
+            if subsection:
+                score = _url_score(subsection, target)
+                if score is None:
+                    continue
+            else:
+                score = (-1, -1, -1)
+            if best is None or score >= best[0]:
+                best = (score, e)
+        if best is None:
+            return default
+        return coerce(best[1].value, type)
+
+def _url_score(pattern: str, target) -> Optional[tuple[int, int, int]]:
+    '''
+    Score how well a config URL pattern matches the target URL, or None if
+    it does not match at all.
+    '''
+    p = urlsplit(pattern)
+    if p.scheme != target.scheme:
+        return None
+    p_host = p.hostname or ''
+    t_host = target.hostname or ''
+    p_labels = p_host.split('.')
+    t_labels = t_host.split('.')
+    if len(p_labels) != len(t_labels) \
+            or not all(pl == '*' or pl == tl for pl, tl in zip(p_labels, t_labels)):
+        return None
+    if p.port != target.port:
+        return None
+    if p.username and p.username != target.username:
+        return None
+    p_path = p.path.rstrip('/')
+    t_path = target.path
+    if p_path and not (t_path == p_path or t_path.startswith(p_path + '/')):
+        return None
+    return ('*' not in p_labels, len(p_path), bool(p.username))
+
+_snapshots: dict[Path, ConfigSnapshot] = {}
+_lock = threading.Lock()
+_enabled = False
+
+def config_snapshot(cwd: Optional[Path|str] = None) -> ConfigSnapshot:
+    '''
+    Return an up-to-date snapshot of the configuration visible from cwd
+    (by default, the runner's cwd), reusing a previous one if still valid.
+    '''
+    if cwd is None:
+        cwd = current_options().get('cwd')
+    xcwd = Path(cwd).resolve() if cwd is not None else Path.cwd()
+    with _lock:
+        snapshot = _snapshots.get(xcwd)
+        if snapshot is None:
+            snapshot = _snapshots[xcwd] = ConfigSnapshot(xcwd)
+            return snapshot
+        return snapshot.refresh()
+
+def enable_config_snapshots() -> None:
+    '''
+    Serve `git_config` lookups from config snapshots.
+    '''
+    global _enabled
+    _enabled = True
+
+def disable_config_snapshots() -> None:
+    '''
+    Run git for every `git_config` lookup, and discard any snapshots.
+    '''
+    global _enabled
+    _enabled = False
+    with _lock:
+        _snapshots.clear()
+
+def config_snapshots_enabled() -> bool:
+    return _enabled
@@ -0,0 +1,228 @@
+'''
+Run a git command wrapper across many repositories at once.
+
+Each job runs one of the wrappers from gitgo.lowlevel (git_fetch, git_pull,
+git_status, ...) inside `run_options`, pointing it at one repository. The
+work is almost entirely waiting on child processes, so a thread pool is
+sufficient.
+
+Jobs are handed to the pool only when they can run: one whose host is at
+its limit waits in a queue for that host, and one waiting to be retried
+waits in a timer heap, neither holding a worker, so other hosts' jobs are
+not held up behind them.
+'''
+
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from subprocess import TimeoutExpired
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional, cast
+from urllib.parse import urlsplit
+from queue import Empty, Queue
+import heapq
+import itertools
+import time
+import re
+
+from gitgo.log import log
+from gitgo.lowlevel.cmdargs import CmdResult
+from gitgo.lowlevel.lowlevel import git_config
+from gitgo.lowlevel.runner import run_options
+
+# The failures that may succeed on another attempt.
+RETRYABLE = (ValueError, OSError, TimeoutExpired)
+
+class FanoutResult(NamedTuple):
+    '''
+    The outcome of running an operation on one repository. Exactly one
+    of result and error is set.
+    '''
+    repo: Path
+    result: Optional[CmdResult]
+    error: Optional[BaseException]
+    attempts: int
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+RE_SCP = re.compile(r'^(?:[^@/]+@)?(?P<host>[^:/]+):')
+
+def url_host(url: str) -> Optional[str]:
+    '''
+    Return the host part of a git remote URL, or None for local paths.
+    Handles both URLs and scp-style ``user@host:path`` remotes.
+    '''
+    if '://' in url:
+        return urlsplit(url).hostname
+    m = RE_SCP.match(url)
+    if m:
+        return m['host']
+    return None
+
+def remote_host(repo: Path, remote: str = 'origin') -> Optional[str]:
+    '''
+    Return the host of the given remote of repo, or None if it has none
+    or it is local.
+    '''
+    with run_options(cwd=repo):
+        url, _, found = git_config(f'remote.{remote}.url', get=True)
+    if not found:
+        return None
+    return url_host(url.strip())
+
+class _Task(NamedTuple):
+    '''
+    A repo to run the operation in, with the attempts made so far.
+    '''
+    repo: Path
+    host: Optional[str]
+    # When the first attempt was started, or None before then.
+    start: Optional[float]
+    attempts: int
+
+class _HostQueues:
+    '''
+    How many jobs are running against each host, and the tasks waiting for
+    it. Used only by the scheduling thread.
+    '''
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self._active: dict[str, int] = {}
+        self._waiting: dict[str, deque[_Task]] = {}
+
+    def admit(self, task: _Task) -> bool:
+        '''
+        Take a slot on the task's host and return True, or queue the task
+        for the host and return False.
+        '''
+        host = task.host
+        if self.limit is None or host is None:
+            return True
+        if self._active.get(host, 0) < self.limit:
+            self._active[host] = self._active.get(host, 0) + 1
+            return True
+        self._waiting.setdefault(host, deque()).append(task)
+        return False
+
+    def release(self, host: Optional[str]) -> Optional[_Task]:
+        '''
+        Give back a slot on host: return the next task waiting for it, which
+        takes the slot, or None.
+        '''
+        if self.limit is None or host is None:
+            return None
+        waiting = self._waiting.get(host)
+        if waiting:
+            return waiting.popleft()
+        self._active[host] -= 1
+        return None
+
+def fan_out(repos: Iterable[Path|str],
+            operation: Callable[..., CmdResult],
+            /,
+            *args: Any,
+            max_workers: int = 8,
+            per_host: Optional[int] = None,
+            host: Callable[[Path], Optional[str]] = remote_host,
+            timeout: Optional[float] = None,
+            retries: int = 0,
+            retry_delay: float = 1.0,
+            **kwargs: Any) -> Iterator[FanoutResult]:
+    '''
+    Run operation(*args, **kwargs) in each of the repos, yielding a
+    `FanoutResult` for each repo as it finishes (not in order).
+
+    For example, ``fan_out(repos, git_fetch, remote='upstream', per_host=4)``.
+
+    Stopping iteration early cancels the jobs that have not yet started.
+
+    :param max_workers: The number of operations run at once.
+    :param per_host: If given, the maximum number of operations running
+        against any one remote host at once.
+    :param host: A function giving the host for a repo, for per_host.
+        The default looks at the URL of the remote named by the ``remote``
+        keyword argument (default 'origin'). An exception it raises is
+        returned in the repo's result.
+    :param timeout: If given, the time limit for each git process, in seconds.
+    :param retries: How many times to retry an operation that failed with
+        one of the RETRYABLE exceptions. Any exception an operation raises
+        is returned in its repo's result, rather than raised.
+    :param retry_delay: The delay before the first retry, in seconds. It
+        doubles with each further retry.
+    '''
+    hosts = _HostQueues(per_host)
+    remote = kwargs.get('remote', 'origin')
+    if host is remote_host:
+        host = lambda repo: remote_host(repo, remote)  # noqa: E731
+
+    def attempt(task: _Task) -> FanoutResult:
+        start = cast(float, task.start)
+        try:
+            with run_options(cwd=task.repo, **({'timeout': timeout} if timeout is not None else {})):
+                result = operation(*args, **kwargs)
+            return FanoutResult(task.repo, result, None, task.attempts, time.monotonic() - start)
+        except Exception as ex:
+            return FanoutResult(task.repo, None, ex, task.attempts, time.monotonic() - start)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gitgo-fanout')
+    # Finished futures, as they finish, so that waiting is not over them all.
+    done: Queue[Future] = Queue()
+    lookups: dict[Future, Path] = {}
+    running: dict[Future, _Task] = {}
+    # (when, tiebreak, task) for the tasks to retry.
+    delayed: list[tuple[float, int, _Task]] = []
+    order = itertools.count()
+
+    def submit(fn: Callable, arg: Any) -> Future:
+        future = executor.submit(fn, arg)
+        future.add_done_callback(done.put)
+        return future
+
+    def launch(task: _Task) -> None:
+        task = task._replace(start=task.start if task.start is not None else time.monotonic(),
+                             attempts=task.attempts + 1)
+        running[submit(attempt, task)] = task
+
+    def run(task: _Task) -> None:
+        if hosts.admit(task):
+            launch(task)
+
+    try:
+        for repo in map(Path, repos):
+            if per_host is None:
+                run(_Task(repo, None, None, 0))
+            else:
+                lookups[submit(host, repo)] = repo
+        while lookups or running or delayed:
+            now = time.monotonic()
+            while delayed and delayed[0][0] <= now:
+                run(heapq.heappop(delayed)[2])
+            try:
+                future = done.get(timeout=delayed[0][0] - now if delayed else None)
+            except Empty:
+                continue
+            if future in lookups:
+                repo = lookups.pop(future)
+                error = future.exception()
+                if error is None:
+                    run(_Task(repo, future.result(), None, 0))
+                else:
+                    yield FanoutResult(repo, None, error, 0, 0.0)
+                continue
+            task = running.pop(future)
+            waiting = hosts.release(task.host)
+            if waiting is not None:
+                launch(waiting)
+            outcome: FanoutResult = future.result()
+            error = outcome.error
+            if error is not None and task.attempts <= retries and isinstance(error, RETRYABLE):
+                # Wait for the retry here, rather than in a worker.
+                log.warning(f'{task.repo}: attempt {task.attempts} failed: {error}; retrying')
+                when = time.monotonic() + retry_delay * 2 ** (task.attempts - 1)
+                heapq.heappush(delayed, (when, next(order), task))
+            else:
+                yield outcome
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,175 @@
+'''
+Coalescing of concurrent fetches.
+
+When several threads fetch from the same remote of the same repository at
+about the same time, running a git fetch for each only makes them contend
+for the repository's lock files and download the same objects repeatedly.
+A `FetchCoordinator` runs one fetch at a time per (repository, remote), and
+merges requests that arrive while one is running:
+
+- A request whose refspecs the running fetch already covers waits for it,
+  and shares its result.
+- Other requests are combined into a single follow-on fetch, with the union
+  of their refspecs, which starts when the running one finishes.
+
+Optionally, a request is answered without fetching at all if a fetch
+covering it completed within the last ``fresh_for`` seconds.
+'''
+
+from pathlib import Path
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+import threading
+import time
+
+from gitgo.lowlevel.cache import find_git_dir, common_dir
+from gitgo.lowlevel.cmdargs import CmdResult
+from gitgo.lowlevel.lowlevel import git_config, git_fetch
+from gitgo.lowlevel.runner import run_options, current_options
+
+class FetchStats(NamedTuple):
+    requests: int
+    fetches: int
+    coalesced: int
+    fresh: int
+
+class _Batch:
+    '''
+    One fetch, and the requests waiting on it. default is True if it fetches
+    the remote's configured refspecs; refspecs holds any others.
+    '''
+    def __init__(self, default: bool, refspecs: tuple[str, ...]):
+        self.default = default
+        self.refspecs = dict.fromkeys(refspecs)
+        self.done = threading.Event()
+        self.result: Optional[CmdResult] = None
+        self.error: Optional[BaseException] = None
+        self.finished = 0.0
+
+    def covers(self, default: bool, refspecs: tuple[str, ...]) -> bool:
+        return (self.default or not default) and all(r in self.refspecs for r in refspecs)
+
+    def add(self, default: bool, refspecs: tuple[str, ...]) -> None:
+        self.default = self.default or default
+        self.refspecs.update(dict.fromkeys(refspecs))
+
+    def wait(self) -> CmdResult:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result  # type: ignore[return-value]
+
+class _Remote:
+    '''
+    The fetch state for one (repository, remote, options).
+    '''
+    def __init__(self):
+        self.running: Optional[_Batch] = None
+        self.pending: Optional[_Batch] = None
+        self.last: Optional[_Batch] = None
+
+class FetchCoordinator:
+    '''
+    Runs git fetches, merging concurrent requests for the same remote of the
+    same repository. Safe to share between threads.
+
+    :param fresh_for: If given, a request covered by a fetch that completed
+        less than this many seconds ago returns that fetch's result.
+    :param fetch: The function that runs the fetch: called as
+        ``fetch(remote, *refspecs, **options)`` in the repository.
+    '''
+    fresh_for: Optional[float]
+
+    def __init__(self, *,
+                 fresh_for: Optional[float] = None,
+                 fetch: Callable[..., CmdResult] = git_fetch):
+        self.fresh_for = fresh_for
+        self._fetch = fetch
+        self._remotes: dict[Hashable, _Remote] = {}
+        self._lock = threading.Lock()
+        self._requests = self._fetches = self._coalesced = self._fresh = 0
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(fresh_for={self.fresh_for}, remotes={len(self._remotes)})'
+
+    @property
+    def stats(self) -> FetchStats:
+        return FetchStats(self._requests, self._fetches, self._coalesced, self._fresh)
+
+    def _key(self, repo: Path, remote: str, options: dict[str, Any]) -> Hashable:
+        git_dir = find_git_dir(repo)
+        where = common_dir(git_dir) if git_dir is not None else repo
+        return (where, remote, tuple(sorted(options.items())))
+
+    def fetch(self, remote: str = 'origin', *refspecs: str,
+              repo: Optional[Path|str] = None,
+              fresh_for: Optional[float] = None,
+              **options: Any) -> CmdResult:
+        '''
+        Fetch refspecs (by default, the remote's configured refspecs) from
+        remote into repo (by default, the runner's cwd), sharing the work
+        with concurrent requests. Other keyword arguments are passed to
+        `git_fetch`; only requests with the same options are merged.
+
+        :param fresh_for: Overrides the coordinator's fresh_for for this request.
+        '''
+        if repo is None:
+            repo = current_options().get('cwd') or Path.cwd()
+        xrepo = Path(repo).resolve()
+        fresh_for = self.fresh_for if fresh_for is None else fresh_for
+        default = not refspecs
+        key = self._key(xrepo, remote, options)
+        with self._lock:
+            self._requests += 1
+            state = self._remotes.get(key)
+            if state is None:
+                state = self._remotes[key] = _Remote()
+            last = state.last
+            if fresh_for is not None and last is not None \
+                    and time.monotonic() - last.finished < fresh_for \
+                    and last.covers(default, refspecs):
+                self._fresh += 1
+                return last.wait()
+            running = state.running
+            if running is not None and running.covers(default, refspecs):
+                self._coalesced += 1
+                batch, leader = running, False
+            elif state.pending is not None:
+                self._coalesced += 1
+                state.pending.add(default, refspecs)
+                batch, leader = state.pending, False
+            elif running is not None:
+                batch = state.pending = _Batch(default, refspecs)
+                leader = True
+            else:
+                batch = state.running = _Batch(default, refspecs)
+                running, leader = None, True
+        if not leader:
+            return batch.wait()
+        if running is not None:
+            # Promoted to running when the current fetch finishes.
+            running.done.wait()
+        self._run(xrepo, remote, state, batch, options)
+        return batch.wait()
+
+    def _run(self, repo: Path, remote: str, state: _Remote, batch: _Batch,
+             options: dict[str, Any]) -> None:
+        with self._lock:
+            self._fetches += 1
+        try:
+            with run_options(cwd=repo):
+                refspecs = [*batch.refspecs]
+                if batch.default and refspecs:
+                    # Explicit refspecs replace the configured ones, so name both.
+                    configured = git_config(f'remote.{remote}.fetch', get_all=True, check=False)
+                    refspecs = [*configured.stdout.splitlines(), *refspecs]
+                batch.result = self._fetch(remote, *refspecs, **options)
+        except BaseException as ex:
+            batch.error = ex
+        finally:
+            with self._lock:
+                batch.finished = time.monotonic()
+                if batch.error is None:
+                    state.last = batch
+                state.running = state.pending
+                state.pending = None
+            batch.done.set()
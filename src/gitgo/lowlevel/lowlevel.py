@@ -1,10 +1,12 @@
 # Pythonic git interface
 
 from pathlib import Path
-from typing import Optional, Literal, overload, TextIO
-from gitgo.lowlevel.cmdargs import CmdArg, CmdResult, flags, arg1s, arg2s, mkstr, \
-                    exclusive, optional, enum_or_true
-from gitgo.lowlevel.runner import runner
+from functools import update_wrapper
+from typing import Callable, Generic, Optional, Literal, ParamSpec, cast, overload, TextIO
+from gitgo.lowlevel.cmdargs import CmdArg, CmdResult, Invocation, mkstr, optional
+from gitgo.lowlevel.cmdspec import CmdSpec, Flag, Value, Separate, EnumOrTrue, OneOf
+from gitgo.lowlevel.runner import runner, async_runner, stream_runner
+from gitgo.lowlevel.config import ConfigType, config_snapshot, config_snapshots_enabled, coerce, format_value
 from gitgo.log import log
 
 # Git command line interface
@@ -15,6 +17,56 @@ from gitgo.log import log
 # removed them, but I have not done a full review of the interface.
 
 git = runner('git')
+async_git = async_runner('git')
+git_stream = stream_runner('git')
+
+P = ParamSpec('P')
+
+class GitCommand(Generic[P]):
+    '''
+    A git command wrapper whose body computes the `Invocation` rather than
+    running it. Calling it runs the command with `git`; `run_async` runs the
+    same invocation with `async_git`.
+    '''
+    def __init__(self, build: Callable[P, Invocation]):
+        self.build = build
+        update_wrapper(self, build)
+
+    def __call__(self, *args: P.args, **kwargs: P.kwargs) -> CmdResult:
+        inv = self.build(*args, **kwargs)
+        return git(*inv.args, **inv.options)
+
+    async def run_async(self, *args: P.args, **kwargs: P.kwargs) -> CmdResult:
+        inv = self.build(*args, **kwargs)
+        return await async_git(*inv.args, **inv.options)
+
+# Compiled argument builders for the commands below (see gitgo.lowlevel.cmdspec).
+# Parameters are listed in the order their arguments appear in argv.
+
+_CONFIG_FILE = CmdSpec(Value('file'), Value('blob'))
+_CONFIG_SCOPE = CmdSpec(
+    OneOf(Flag('is_global', 'global'),
+          Flag('is_system', 'system'),
+          Flag('is_local', 'local')),
+)
+_CONFIG = CmdSpec(
+    OneOf(Flag('get_all'),
+          Flag('get'),
+          Flag('get_regexp'),
+          Flag('get_urlmatch'),
+          Flag('replace_all'),
+          Flag('add'),
+          Flag('unset'),
+          Flag('unset_all'),
+          Flag('list')),
+    Flag('fixed_value'),
+    Flag('null'),
+    Flag('name_only'),
+    Flag('show_origin'),
+    Flag('show_scope'),
+    Value('type'),
+    Value('default'),
+)
 
 def git_config(flag:str, value:Optional[str] = None, /,
                is_global: bool = False,
@@ -44,60 +96,102 @@ def git_config(flag:str, value:Optional[str] = None, /,
     :param check: If True, raise an exception if the command fails
         (including 1 for NotFound).
         default: False
+
+    When config snapshots are enabled (see gitgo.lowlevel.config), plain
+    lookups are answered from the snapshot without running git.
         '''
-    file_args = arg1s(
-        file=file,
-        blob=blob
-    )
-    scope_args = (*file_args,) or \
-        exclusive(
-            is_global=is_global,
-            is_system=is_system,
-            is_local=is_local,
-            file=not not file,
-            blob=not not blob,
-            _map={
-                'is_global': 'global',
-                'is_system': 'system',
-                'is_local': 'local',
-            }
-        )
-    action_args = exclusive(
-        get_all=get_all,
-        get=get,
-        get_regexp=get_regexp,
-        get_urlmatch=get_urlmatch,
-        replace_all=replace_all,
-        add=add,
-        unset=unset,
-        unset_all=unset_all,
-        list=list
-    )
-    options = flags(
-        fixed_value=fixed_value,
-        null=null,
-        name_only=name_only,
-        show_origin=show_origin,
-        show_scope=show_scope,
-    )
-    value_options = arg1s(
-        type=type,
-        default=default,
-    )
+    if config_snapshots_enabled() \
+            and not (file or blob or fixed_value or null or name_only or show_origin or show_scope):
+        scope = 'global' if is_global else 'system' if is_system else 'local' if is_local else None
+        served = _config_from_snapshot(flag, value,
+                                       get=get,
+                                       get_all=get_all,
+                                       get_regexp=get_regexp,
+                                       get_urlmatch=get_urlmatch,
+                                       scope=scope,
+                                       type=type,
+                                       default=default)
+        if served is not None:
+            return served
+    scope_args = _CONFIG_FILE.build(file=file, blob=blob) or \
+        _CONFIG_SCOPE.build(is_global=is_global, is_system=is_system, is_local=is_local)
     args = ("config",
             *scope_args,
-            *action_args,
-            *options,
-            *value_options,
+            *_CONFIG.build(get_all=get_all,
+                           get=get,
+                           get_regexp=get_regexp,
+                           get_urlmatch=get_urlmatch,
+                           replace_all=replace_all,
+                           add=add,
+                           unset=unset,
+                           unset_all=unset_all,
+                           list=list,
+                           fixed_value=fixed_value,
+                           null=null,
+                           name_only=name_only,
+                           show_origin=show_origin,
+                           show_scope=show_scope,
+                           type=type,
+                           default=default),
             flag,
             *optional(value))
     return git(*args,
                boolean_return=True,
                check=check,)
 
+def _config_from_snapshot(flag: str, value: Optional[str], *,
+                          get: bool,
+                          get_all: bool,
+                          get_regexp: bool,
+                          get_urlmatch: bool,
+                          scope: Optional[str],
+                          type: Optional[str],
+                          default: Optional[str|int|bool|Path]) -> Optional[CmdResult]:
+    '''
+    Answer a git_config lookup from the config snapshot, formatted as git
+    would, or return None if it is not a lookup the snapshot can answer.
+    '''
+    if (get, get_all, get_regexp, get_urlmatch).count(True) != 1 \
+            or type not in (None, 'bool', 'int', 'bool-or-int', 'path') \
+            or (value is not None and not get_urlmatch):
+        return None
+    if get_urlmatch and '.' not in flag:
+        # A section alone asks for all its variables, best match each.
+        return None
+    ctype = cast(Optional[ConfigType], type)
+    snapshot = config_snapshot()
+    if get or get_urlmatch:
+        missing = cast(Path, object())
+        if get_urlmatch:
+            v = snapshot.get_urlmatch(flag, cast(str, value), type=ctype, default=missing, scope=scope)
+        else:
+            v = snapshot.get(flag, type=ctype, default=missing, scope=scope)
+        if v is missing:
+            if default is None:
+                return CmdResult('', '', False)
+            v = coerce(format_value(default), ctype)
+        return CmdResult(f'{format_value(v)}\n', '', True)
+    if get_all:
+        values = snapshot.get_all(flag, type=ctype, scope=scope)
+        lines = ''.join(f'{format_value(v)}\n' for v in values)
+    else:
+        pairs = snapshot.get_regexp(flag, type=ctype, scope=scope)
+        lines = ''.join(f'{k}\n' if v is None else f'{k} {format_value(v)}\n' for k, v in pairs)
+    return CmdResult(lines, '', bool(lines))
+
 # Acceptable values for --shared parameter to git init
 GitParamShared = Literal["false","true","umask","group","all","world","everybody"]|int
 
+_INIT = CmdSpec(
+    Flag('quiet'),
+    Flag('bare'),
+    Value('separate_git_dir'),
+    Value('branch', 'initial-branch'),
+    Separate('template'),
+    Separate('object_format'),
+    Separate('shared'),
+)
+
 def git_init(directory: Path|str='.', *,
                 quiet:bool=False,
                 bare:bool=False,
@@ -119,28 +213,40 @@ def git_init(directory: Path|str='.', *,
     else:
         xshared = shared
     args = ("init",
-            *flags(
-                quiet=quiet,
-                bare=bare,
-                _map={'verbose': '-v'}
-            ),
-            *arg1s(
-                separate_git_dir=separate_git_dir,
-                branch=branch,
-                _map={
-                    "branch": "initial-branch",
-                }
-            ),
-            *arg2s(
-                template=template,
-                object_format=object_format,
-                shared=xshared
-            ),
+            *_INIT.build(quiet=quiet,
+                         bare=bare,
+                         separate_git_dir=separate_git_dir,
+                         branch=branch,
+                         template=template,
+                         object_format=object_format,
+                         shared=xshared),
             directory)
     return git(*args,
                     check=check,
                     capture_output=capture_output)
 
+# merge gives both --merge and -m, so the -m flag has its own name.
+_CHECKOUT = CmdSpec(
+    Flag('guess'),
+    Flag('quiet'),
+    Flag('progress'),
+    Flag('merge'),
+    Flag('detach'),
+    Flag('orphan'),
+    Flag('overwrite_ignore'),
+    Flag('ignore_other_worktrees'),
+    Flag('ignore_skpworktree'),
+    Flag('pathspec_file_nul'),
+    Value('recurse_submodules'),
+    Value('conflict'),
+    Value('track'),
+    Value('merge_type'),
+    Value('pathspec'),
+    OneOf(Flag('create', '-b'),
+          Flag('reset', '-B'),
+          Flag('merge_branch', '-m')),
+)
+
 @overload
 def git_checkout(branch: str, _: Optional[Literal['--']], /,
                  *paths: Path|str,
@@ -221,28 +327,25 @@ def git_checkout(branch: str,
     else:
         xpaths = (mkstr(p) for p in paths if p is not None)
 
-    create_flag = exclusive(create=create, reset=reset, merge=merge,
-                            _map={'create': '-b', 'reset': '-B', 'merge': '-m'})
     args = ("checkout", *xpaths,
-            *flags(guess=guess,
-                   quiet=quiet,
-                   progress=progress,
-                   merge=merge,
-                   detach=detach,
-                   orphan=orphan,
-                   overwrite_ignore=overwrite_ignore,
-                   ignore_other_worktrees=ignore_other_worktrees,
-                   ignore_skpworktree=ignore_skpworktree,
-                   pathspec_file_nul=pathspec_file_nul,
-            ),
-            *arg1s(
-                recurse_submodules=recurse_submodules,
-                conflict=conflict,
-                track=track,
-                merge_type=merge_type,
-                pathspec=pathspec
-            ),
-            *create_flag,
+            *_CHECKOUT.build(guess=guess,
+                             quiet=quiet,
+                             progress=progress,
+                             merge=merge,
+                             detach=detach,
+                             orphan=orphan,
+                             overwrite_ignore=overwrite_ignore,
+                             ignore_other_worktrees=ignore_other_worktrees,
+                             ignore_skpworktree=ignore_skpworktree,
+                             pathspec_file_nul=pathspec_file_nul,
+                             recurse_submodules=recurse_submodules,
+                             conflict=conflict,
+                             track=track,
+                             merge_type=merge_type,
+                             pathspec=pathspec,
+                             create=create,
+                             reset=reset,
+                             merge_branch=merge),
             branch)
     return git(*args, check=True, capture_output=capture_output)
 
@@ -293,6 +396,18 @@ password={password}
     log.info(f'Credential approved for {txt}')
     git_credential('approve', input=filled)
 
+_BRANCH = CmdSpec(
+    Flag('all'),
+    Flag('create_reflog'),
+    Flag('force'),
+    Flag('move'),
+    Flag('quiet'),
+    Flag('delete', '-d'),
+    Flag('ignore_case'),
+    Flag('track'),
+)
+_BRANCH_UPSTREAM = CmdSpec(Value('set_upstream_to'))
+
 def git_branch(branch: Optional[str] = None,
                target: Optional[str] = None,
                /,
@@ -312,27 +427,35 @@ def git_branch(branch: Optional[str] = None,
     branch_arg = (branch,) if branch is not None else ()
     target_arg = (target,) if target is not None else ()
     args = (
-       *flags(
-            all=all,
-            create_reflog=create_reflog,
-            force=force,
-            move=move,
-            quiet=quiet,
-            delete=delete,
-            ignore_case=ignore_case,
-            track=track,
-            _map={
-                "delete": "-d"
-            }),
-            '--no-color',
-        *arg1s(
-            set_upstream_to=set_upstream_to,
-            ),
+        *_BRANCH.build(all=all,
+                       create_reflog=create_reflog,
+                       force=force,
+                       move=move,
+                       quiet=quiet,
+                       delete=delete,
+                       ignore_case=ignore_case,
+                       track=track),
+        '--no-color',
+        *_BRANCH_UPSTREAM.build(set_upstream_to=set_upstream_to),
         *branch_arg,
         *target_arg,
     )
     return git("branch", *args)
 
+_SWITCH = CmdSpec(
+    Flag('create'),
+    Flag('force'),
+    Flag('discard_changes'),
+    Flag('merge'),
+    Flag('detach'),
+    Flag('track_flag', 'track'),
+    Flag('progress'),
+    Flag('quiet'),
+    Flag('ignore_other_worktrees'),
+    Value('track'),
+    Value('conflict'),
+)
+
 def git_switch(branch: str, start: Optional[str] = None, /,
                 create: bool = False,
                 detach: bool = False,
@@ -349,18 +472,17 @@ def git_switch(branch: str, start: Optional[str] = None, /,
     Run git switch with the given arguments.
     '''
     args = ("switch", branch,
-            *flags(create=create,
-                    force=force,
-                    discard_changes=discard_changes,
-                    merge=merge,
-                    detach=detach,
-                    track=track is not None,
-                    progress=progress,
-                    quiet=quiet,
-                    ignore_other_worktrees=ignore_other_worktrees,
-                   ),
-            *arg1s(track=track,
-                   conflict=conflict,))
+            *_SWITCH.build(create=create,
+                           force=force,
+                           discard_changes=discard_changes,
+                           merge=merge,
+                           detach=detach,
+                           track_flag=track is not None,
+                           progress=progress,
+                           quiet=quiet,
+                           ignore_other_worktrees=ignore_other_worktrees,
+                           track=track,
+                           conflict=conflict))
     return git(*args)
 
 def git_clone(url: str, path: Path|str = '.') -> CmdResult:
@@ -370,6 +492,20 @@ def git_clone(url: str, path: Path|str = '.') -> CmdResult:
     args = ('clone', url, path)
     return git(*args)
 
+_PULL = CmdSpec(
+    Flag('quiet'),
+    Flag('progress'),
+    Flag('force'),
+    Flag('tags'),
+    Flag('set_upstream'),
+    Flag('dry_run'),
+    Flag('commit'),
+    Flag('ff'),
+    Flag('ff_only'),
+    Flag('all'),
+    Value('rebase'),
+)
+
 def git_pull(*paths: CmdArg,
              remote:str = 'origin',
             branch: str = 'main',
@@ -388,21 +524,35 @@ def git_pull(*paths: CmdArg,
     '''
     Run git pull with the given arguments.
     '''
-    flag_args = flags(quiet=quiet,
-                      progress=progress,
-                      force=force,
-                      tags=tags,
-                      set_upstream=set_upstream,
-                      dry_run=dry_run,
-                      commit=commit,
-                      ff=ff,
-                      ff_only=ff_only,
-                      all=all,)
     positional_args = (arg for arg in paths or (remote, branch) if arg is not None)
-    rebase_args = arg1s(rebase=rebase)
-    args = ('pull', *flag_args, *rebase_args, *positional_args)
+    args = ('pull',
+            *_PULL.build(quiet=quiet,
+                         progress=progress,
+                         force=force,
+                         tags=tags,
+                         set_upstream=set_upstream,
+                         dry_run=dry_run,
+                         commit=commit,
+                         ff=ff,
+                         ff_only=ff_only,
+                         all=all,
+                         rebase=rebase),
+            *positional_args)
     return git(*args)
 
+_PUSH = CmdSpec(
+    Flag('quiet'),
+    Flag('progress'),
+    Flag('force'),
+    Flag('tags'),
+    Flag('set_upstream'),
+    Flag('dry_run'),
+    Flag('ff'),
+    Flag('ff_only'),
+    Flag('all'),
+    Value('rebase'),
+)
+
 def git_push(repo: Optional[str] = None, *refspecs: CmdArg,
                 remote:str = 'origin',
                 branch: Optional[str] = None,
@@ -420,20 +570,32 @@ def git_push(repo: Optional[str] = None, *refspecs: CmdArg,
     '''
     Run git push with the given arguments.
     '''
-    flag_args = flags(quiet=quiet,
-                      progress=progress,
-                      force=force,
-                      tags=tags,
-                      set_upstream=set_upstream,
-                      dry_run=dry_run,
-                      ff=ff,
-                      ff_only=ff_only,
-                      all=all,)
-    rebase_args = arg1s(rebase=rebase)
     positional_args  = (*optional(repo or remote), *optional(branch), *refspecs)
-    args = ('push', *flag_args, *rebase_args, *positional_args)
+    args = ('push',
+            *_PUSH.build(quiet=quiet,
+                         progress=progress,
+                         force=force,
+                         tags=tags,
+                         set_upstream=set_upstream,
+                         dry_run=dry_run,
+                         ff=ff,
+                         ff_only=ff_only,
+                         all=all,
+                         rebase=rebase),
+            *positional_args)
     return git(*args)
 
+_FETCH = CmdSpec(
+    Flag('quiet'),
+    Flag('progress'),
+    Flag('force'),
+    Flag('tags'),
+    Flag('set_upstream'),
+    Flag('dry_run'),
+    Flag('all'),
+)
+
+@GitCommand
 def git_fetch(*paths: CmdArg,
                 remote:str = 'origin',
                 branch: str = 'main',
@@ -444,22 +606,22 @@ def git_fetch(*paths: CmdArg,
                 set_upstream: bool = False,
                 dry_run: bool = False,
                 all: bool = False
-                ) -> CmdResult:
+                ) -> Invocation:
     '''
     Run git fetch with the given arguments.
     '''
-    flag_args = flags(quiet=quiet,
-                      progress=progress,
-                      force=force,
-                      tags=tags,
-                      set_upstream=set_upstream,
-                      dry_run=dry_run,
-                      all=all,)
+    flag_args = _FETCH.build(quiet=quiet,
+                             progress=progress,
+                             force=force,
+                             tags=tags,
+                             set_upstream=set_upstream,
+                             dry_run=dry_run,
+                             all=all)
     alt_args = (remote, branch) if branch else (remote) if remote else ()
     p_args = paths or alt_args
     positional_args = (arg for arg in p_args if arg is not None)
     args = (*flag_args, *positional_args)
-    return git('fetch', *args)
+    return Invocation(('fetch', *args))
 
 @overload
 def git_remote(action: Literal['add'], url_or_path: str, /,  *paths: CmdArg,
@@ -481,6 +643,36 @@ def git_remote(action: Optional[Literal['add']], url_or_path: CmdArg, /, *paths:
     args = ('remote', *optional(action), *optional(url_or_path), *paths)
     return git(*args, **kwargs)
 
+_REV_PARSE = CmdSpec(
+    Flag('verify'),
+    Flag('quiet'),
+    Flag('symbolic_full_name'),
+    Flag('symbolic'),
+    Flag('all'),
+    Flag('local_env_vars'),
+    Flag('git_dir'),
+    Flag('git_common_dir'),
+    Flag('show_toplevel'),
+    Flag('show_superproject_working_tree'),
+    Flag('absolute_git_dir'),
+    Flag('is_inside_git_dir'),
+    Flag('is_inside_work_tree'),
+    Flag('is_bare_repository'),
+    Flag('show_cdup'),
+    Flag('show_prefix'),
+    EnumOrTrue('abbrev_ref', ['strict', 'loose']),
+    Value('branches'),
+    Value('tags'),
+    Value('remotes'),
+    Value('glob'),
+    Value('resolve_git_dir'),
+    Value('git_path'),
+    Value('shared_index_path'),
+    Value('show_object_format'),
+    Value('path_format'),
+)
+
+@GitCommand
 def git_rev_parse(*args: CmdArg,
                     verify: bool = False,
                     quiet: bool = False,
@@ -510,11 +702,11 @@ def git_rev_parse(*args: CmdArg,
                     show_object_format: Literal['storage', 'input', 'output'] = 'storage',
                     check: bool = True,
                     capture_output: bool = True,
-                  ) -> CmdResult:
+                  ) -> Invocation:
     '''
     Run git rev-parse with the given arguments.
     '''
-    flag_args = flags(
+    option_args = _REV_PARSE.build(
         verify=verify,
         quiet=quiet,
         symbolic_full_name=symbolic_full_name,
@@ -531,8 +723,7 @@ def git_rev_parse(*args: CmdArg,
         is_bare_repository=is_bare_repository,
         show_cdup=show_cdup,
         show_prefix=show_prefix,
-    )
-    paired_args = arg1s(
+        abbrev_ref=abbrev_ref,
         branches=branches,
         tags=tags,
         remotes=remotes,
@@ -543,10 +734,23 @@ def git_rev_parse(*args: CmdArg,
         show_object_format=show_object_format,
         path_format=path_format,
     )
-    abbrev_args = enum_or_true('abbrev-ref', abbrev_ref, _keywords=['strict', 'loose'])
-    return git('rev-parse', *flag_args, *abbrev_args, *paired_args, *args,
-               check=check,
-               capture_output=capture_output)
+    return Invocation(('rev-parse', *option_args, *args),
+                      dict(check=check,
+                           capture_output=capture_output))
+
+_MERGE = CmdSpec(
+    Flag('ff'),
+    Flag('ff_only'),
+    Flag('abort'),
+    Flag('quit'),
+    Flag('continue_'),
+    Flag('no_commit'),
+    Flag('quiet'),
+    Flag('verbose'),
+    Flag('progress'),
+    Value('log'),
+    Value('message'),
+)
 
 def git_merge(*commits: CmdArg,
                 abort: bool = False,
@@ -565,28 +769,33 @@ def git_merge(*commits: CmdArg,
     '''
     Run git merge with the given arguments.
     '''
-    flag_args = flags(
-        abort=abort,
-        quit=quit,
-        continue_=continue_,
-        no_commit=no_commit,
-        quiet=quiet,
-        verbose=verbose,
-        progress=progress,
-    )
-    ff_flags = flags(
-        ff=True if ff is True else False,
-        ff_only=True if ff == 'only' else False,
-    )
-    params = arg1s(
-        log=log,
-        message=message,
-    )
-    args = (*ff_flags, *flag_args, *params, *commits)
+    args = (*_MERGE.build(ff=ff is True,
+                          ff_only=ff == 'only',
+                          abort=abort,
+                          quit=quit,
+                          continue_=continue_,
+                          no_commit=no_commit,
+                          quiet=quiet,
+                          verbose=verbose,
+                          progress=progress,
+                          log=log,
+                          message=message),
+            *commits)
     return git('merge', *args,
                check=check,
                capture_output=capture_output)
 
+_TAG = CmdSpec(
+    Flag('annotate'),
+    Flag('sign'),
+    Flag('force'),
+    Flag('delete'),
+    Flag('verify'),
+    Flag('list'),
+    Flag('reflog'),
+    Value('message'),
+)
+
 def git_tag(name: Optional[str] = None,
             commit: Optional[str] = None,
             /,
@@ -602,21 +811,33 @@ def git_tag(name: Optional[str] = None,
     '''
     Run git tag with the given arguments.
     '''
-    flag_args = flags(
-        annotate=annotate,
-        sign=sign,
-        force=force,
-        delete=delete,
-        verify=verify,
-        list=list,
-        reflog=reflog,
-    )
-    params = arg1s(
-        message=message,
-    )
-    args = (*flag_args, *params, *optional(name), *optional(commit))
+    args = (*_TAG.build(annotate=annotate,
+                        sign=sign,
+                        force=force,
+                        delete=delete,
+                        verify=verify,
+                        list=list,
+                        reflog=reflog,
+                        message=message),
+                        *optional(name),
+                        *optional(commit))
     return git('tag', *args)
 
+_STATUS = CmdSpec(
+    Flag('long'),
+    Flag('short'),
+    Flag('branch'),
+    Flag('show_stash'),
+    Flag('ignored_too'),
+    Flag('ahead_behind'),
+    Flag('renames'),
+    Value('porcelain'),
+    Value('untracked_files'),
+    Value('ignored'),
+    Value('find_renames'),
+)
+
+@GitCommand
 def git_status(*paths: CmdArg,
                 porcelain: Optional[Literal['v1', 'v2']] = None,
                 long: bool = False,
@@ -629,24 +850,54 @@ def git_status(*paths: CmdArg,
                 ahead_behind: bool = False,
                 find_renames: Optional[int] = None,
                 renames: bool = False,
-    ) -> CmdResult:
+    ) -> Invocation:
     '''
     Run git status with the given arguments.
     '''
-    flag_args = flags(
-        long=long,
-        short=short,
-        branch=branch,
-        show_stash=show_stash,
-        ignored_too=ignored_too,
-        ahead_behind=ahead_behind,
-        renames=renames,
-    )
-    params = arg1s(
-        porcelain=porcelain,
-        untracked_files=untracked_files,
-        ignored=ignored,
-        find_renames=find_renames,
-    )
-    args = (*flag_args, *params, *paths)
-    return git('status', *args)
+    args = (*_STATUS.build(long=long,
+                           short=short,
+                           branch=branch,
+                           show_stash=show_stash,
+                           ignored_too=ignored_too,
+                           ahead_behind=ahead_behind,
+                           renames=renames,
+                           porcelain=porcelain,
+                           untracked_files=untracked_files,
+                           ignored=ignored,
+                           find_renames=find_renames),
+            *paths)
+    return Invocation(('status', *args))
+
+_MULTI_PACK_INDEX = CmdSpec(
+    Value('object_dir'),
+    Flag('progress'),
+)
+_MULTI_PACK_INDEX_ACTION = CmdSpec(
+    Flag('bitmap'),
+    Value('preferred_pack'),
+    Value('batch_size'),
+)
+
+@GitCommand
+def git_multi_pack_index(action: Literal['write', 'verify', 'expire', 'repack'] = 'write', /, *,
+                         object_dir: Optional[Path|str] = None,
+                         progress: bool = False,
+                         bitmap: bool = False,
+                         preferred_pack: Optional[str] = None,
+                         batch_size: Optional[int] = None,
+    ) -> Invocation:
+    '''
+    Run git multi-pack-index. ``write`` (re)writes the multi-pack-index for
+    all the packs in the objects directory.
+    '''
+    if action != 'write' and (bitmap or preferred_pack is not None):
+        raise ValueError('bitmap and preferred_pack apply only to write')
+    if action != 'repack' and batch_size is not None:
+        raise ValueError('batch_size applies only to repack')
+    args = (*_MULTI_PACK_INDEX.build(object_dir=object_dir,
+                                     progress=progress),
+            action,
+            *_MULTI_PACK_INDEX_ACTION.build(bitmap=bitmap,
+                                            preferred_pack=preferred_pack,
+                                            batch_size=batch_size))
+    return Invocation(('multi-pack-index', *args))
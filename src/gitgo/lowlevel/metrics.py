@@ -0,0 +1,169 @@
+'''
+Metrics for the commands run through the runners: per subcommand call
+counts, latency histograms, spawn overhead, output sizes, and outcomes.
+
+Each run has one of the OUTCOMES: it exited successfully ('ok') or not
+('failed'), was killed for taking too long ('timeout'), could not be
+started ('spawn_error'), or was a stream closed before the end ('closed').
+
+Collection is off until `enable_metrics` is called; when off, the runners
+only pay for a single attribute check.
+'''
+
+from dataclasses import dataclass, field, asdict
+from typing import Any
+import json
+import math
+import threading
+
+OUTCOMES: tuple[str, ...] = ('ok', 'failed', 'timeout', 'spawn_error', 'closed')
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS: tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf,
+)
+
+@dataclass
+class CommandMetrics:
+    '''
+    The metrics for one command/subcommand pair. failures counts the runs
+    whose outcome was not 'ok'; outcomes counts them by outcome.
+    '''
+    count: int = 0
+    failures: int = 0
+    outcomes: dict[str, int] = field(default_factory=lambda: dict.fromkeys(OUTCOMES, 0))
+    seconds: float = 0.0
+    spawn_seconds: float = 0.0
+    stdout_bytes: int = 0
+    stderr_bytes: int = 0
+    buckets: list[int] = field(default_factory=lambda: [0] * len(BUCKETS))
+
+    def record(self, elapsed: float, spawn: float, stdout: int, stderr: int, outcome: str) -> None:
+        self.count += 1
+        self.failures += outcome != 'ok'
+        self.outcomes[outcome] += 1
+        self.seconds += elapsed
+        self.spawn_seconds += spawn
+        self.stdout_bytes += stdout
+        self.stderr_bytes += stderr
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                self.buckets[i] += 1
+                break
+
+class MetricsRegistry:
+    '''
+    A registry of `CommandMetrics`, keyed by (command, subcommand).
+    '''
+    enabled: bool
+    _metrics: dict[tuple[str, str], CommandMetrics]
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(enabled={self.enabled}, commands={len(self._metrics)})'
+
+    def record(self, cmd: str, xargs: list[str], *,
+               elapsed: float,
+               spawn: float,
+               stdout: int,
+               stderr: int,
+               outcome: str = 'ok') -> None:
+        '''
+        Record one run of a command, with the sizes of its output in bytes,
+        and its outcome (one of OUTCOMES). Leading ``-c name=value`` options
+        are skipped to find the subcommand.
+        '''
+        if outcome not in OUTCOMES:
+            raise ValueError(f'Unknown outcome {outcome!r}')
+        i = 0
+        while i + 1 < len(xargs) and xargs[i] == '-c':
+            i += 2
+        sub = xargs[i] if i < len(xargs) and not xargs[i].startswith('-') else ''
+        with self._lock:
+            m = self._metrics.get((cmd, sub))
+            if m is None:
+                m = self._metrics[(cmd, sub)] = CommandMetrics()
+            m.record(elapsed, spawn, stdout, stderr, outcome)
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        '''
+        Return a copy of the current metrics, keyed by "command subcommand".
+        '''
+        with self._lock:
+            return {
+                f'{cmd} {sub}'.strip(): asdict(m)
+                for (cmd, sub), m in sorted(self._metrics.items())
+            }
+
+    def reset(self) -> None:
+        '''
+        Discard all the metrics collected so far.
+        '''
+        with self._lock:
+            self._metrics.clear()
+
+    def to_json(self, **kwargs) -> str:
+        '''
+        Export a snapshot as JSON. Keyword arguments are passed to `json.dumps`.
+        '''
+        snapshot = self.snapshot()
+        for m in snapshot.values():
+            m['buckets'] = dict(zip((str(b) for b in BUCKETS), m['buckets']))
+        return json.dumps(snapshot, **kwargs)
+
+    def to_prometheus(self, prefix: str = 'gitgo') -> str:
+        '''
+        Export a snapshot in the Prometheus text exposition format.
+        '''
+        with self._lock:
+            items = sorted((k, asdict(m)) for k, m in self._metrics.items())
+        lines: list[str] = []
+        def family(name: str, kind: str, help: str, key: str):
+            lines.append(f'# HELP {prefix}_{name} {help}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for (cmd, sub), m in items:
+                lines.append(f'{prefix}_{name}{{command="{cmd}",subcommand="{sub}"}} {m[key]}')
+        family('commands_total', 'counter', 'Commands run.', 'count')
+        family('command_failures_total', 'counter', 'Commands that failed.', 'failures')
+        family('command_spawn_seconds_total', 'counter', 'Time spent starting processes.', 'spawn_seconds')
+        family('command_stdout_bytes_total', 'counter', 'Output read from stdout.', 'stdout_bytes')
+        family('command_stderr_bytes_total', 'counter', 'Output read from stderr.', 'stderr_bytes')
+        name = f'{prefix}_command_outcomes_total'
+        lines.append(f'# HELP {name} Commands run, by outcome.')
+        lines.append(f'# TYPE {name} counter')
+        for (cmd, sub), m in items:
+            for outcome, n in m['outcomes'].items():
+                lines.append(f'{name}{{command="{cmd}",subcommand="{sub}",outcome="{outcome}"}} {n}')
+        name = f'{prefix}_command_seconds'
+        lines.append(f'# HELP {name} Command wall-clock time.')
+        lines.append(f'# TYPE {name} histogram')
+        for (cmd, sub), m in items:
+            labels = f'command="{cmd}",subcommand="{sub}"'
+            total = 0
+            for bound, n in zip(BUCKETS, m['buckets']):
+                total += n
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {total}')
+            lines.append(f'{name}_sum{{{labels}}} {m["seconds"]}')
+            lines.append(f'{name}_count{{{labels}}} {m["count"]}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+def enable_metrics() -> MetricsRegistry:
+    '''
+    Start collecting metrics. Returns the registry.
+    '''
+    metrics.enabled = True
+    return metrics
+
+def disable_metrics() -> None:
+    '''
+    Stop collecting metrics. What has been collected is kept until reset.
+    '''
+    metrics.enabled = False
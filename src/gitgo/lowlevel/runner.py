@@ -1,11 +1,23 @@
 #!/usr/bin/env python
 
-from typing import Optional
+from typing import IO, Any, Iterator, Optional, cast
 from pathlib import Path
-from subprocess import run
+from contextlib import contextmanager
+from contextvars import ContextVar
+from subprocess import Popen, PIPE, DEVNULL, TimeoutExpired
+from time import perf_counter
+import asyncio
 import os
+import locale
+import threading
+import weakref
 from gitgo.log import log
-from gitgo.lowlevel.cmdargs import CmdArg, CmdResult
+from gitgo.lowlevel.cmdargs import CmdArg, CmdResult, BytesCmdResult
+from gitgo.lowlevel.cache import CommandCache, command_cache, is_read_only
+from gitgo.lowlevel.metrics import metrics
+
+# The encoding text mode decodes output with.
+_ENCODING = locale.getpreferredencoding(False)
 
 last_cwd: Optional[Path] = None
 def track_cwd():
@@ -15,6 +27,142 @@ def track_cwd():
         log.info(f"> cd {cwd}")
         last_cwd = cwd
 
+_run_options: ContextVar[dict[str, Any]] = ContextVar('run_options', default={})
+
+@contextmanager
+def run_options(**kwargs):
+    '''
+    Supply default keyword arguments (e.g. cwd, timeout, env) to every
+    command run within this context. This is how a wrapper from
+    gitgo.lowlevel is pointed at a particular repository.
+
+    The defaults are kept in a context variable, so they apply to the current
+    thread or task only. Nested contexts add to the outer defaults.
+    '''
+    token = _run_options.set({**_run_options.get(), **kwargs})
+    try:
+        yield
+    finally:
+        _run_options.reset(token)
+
+def current_options() -> dict[str, Any]:
+    '''
+    Return the default keyword arguments in effect from `run_options`.
+    '''
+    return _run_options.get()
+
+def _check(cmd: str, xargs: list[str],
+           stdout, stderr, returncode: int, *,
+           check: bool) -> None:
+    '''
+    Log stderr, and check the return code.
+    '''
+    if stderr:
+        log.warn('%s', stderr)
+    if check and returncode != 0:
+        log.error(f'''{cmd}{xargs} returned {returncode}
+cwd={os.getcwd()}
+stdout={stdout}
+stdout={stdout}''')
+        raise ValueError(f"{cmd}{xargs} returned {returncode}")
+
+def _result(cmd: str, xargs: list[str],
+            stdout, stderr, returncode: int, *,
+            check: bool,
+            boolean_return: bool,
+            text: bool) -> CmdResult | BytesCmdResult:
+    '''
+    Log stderr, check the return code, and package up the result.
+    In bytes mode (text=False), the result is a `BytesCmdResult`.
+    '''
+    _check(cmd, xargs, stdout, stderr, returncode, check=check)
+    result = CmdResult if text else BytesCmdResult
+    if boolean_return:
+        if returncode and returncode != 1:
+            raise ValueError(f"{cmd}{xargs} returned {returncode}")
+        return result(stdout, stderr,  returncode == 0)
+    return result(stdout, stderr, returncode)
+
+def _run(argv: list[str], *,
+         input,
+         capture_output: bool,
+         text: bool,
+         timeout: Optional[float] = None,
+         **kwargs) -> tuple[Any, Any, int, float]:
+    '''
+    Like `subprocess.run`, returning (stdout, stderr, returncode, spawn), where
+    spawn is the time taken to start the process.
+    '''
+    pipe = PIPE if capture_output else None
+    start = perf_counter()
+    with Popen(argv,
+               stdin=PIPE if input is not None else None,
+               stdout=pipe,
+               stderr=pipe,
+               text=text,
+               **kwargs) as p:
+        spawn = perf_counter() - start
+        try:
+            stdout, stderr = p.communicate(input, timeout=timeout)
+        except TimeoutExpired:
+            p.kill()
+            p.communicate()
+            raise
+    return stdout, stderr, cast(int, p.returncode), spawn
+
+def _outcome(returncode: int, boolean_return: bool) -> str:
+    '''
+    The outcome of a process that ran to the end, for metrics.
+    '''
+    return 'failed' if returncode != 0 and not (boolean_return and returncode == 1) else 'ok'
+
+def _nbytes(output: Optional[str|bytes]) -> int:
+    '''
+    The size of output in bytes, as read from the pipe.
+    '''
+    if output is None:
+        return 0
+    if isinstance(output, str):
+        return len(output.encode(_ENCODING, 'surrogateescape'))
+    return len(output)
+
+def _record(cmd: str, xargs: list[str], start: float, *,
+            spawn: float = 0.0,
+            stdout: int = 0,
+            stderr: int = 0,
+            outcome: str) -> None:
+    if metrics.enabled:
+        metrics.record(cmd, xargs,
+                       elapsed=perf_counter() - start,
+                       spawn=spawn,
+                       stdout=stdout,
+                       stderr=stderr,
+                       outcome=outcome)
+
+def _cache_key(cache: Optional[CommandCache], cmd: str, xargs: list[str],
+               check: bool, boolean_return: bool, capture_output: bool,
+               input, text: bool, kwargs: dict):
+    '''
+    Return the key under which to cache this command's result, or None.
+    Only captured, input-free commands with no options but cwd and timeout are cached.
+    '''
+    if cache is None or not capture_output or input is not None or kwargs.keys() - {'cwd', 'timeout'}:
+        return None
+    return cache.key(cmd, xargs, kwargs.get('cwd'), check, boolean_return, text)
+
+def _cache_update(cache: Optional[CommandCache], key, result,
+                  cmd: str, xargs: list[str], kwargs: dict) -> None:
+    '''
+    Remember a cacheable result, or invalidate the repository's entries if
+    the command may have modified it.
+    '''
+    if cache is None:
+        return
+    if key is not None:
+        cache.put(key, result)
+    elif not is_read_only(cmd, xargs):
+        cache.invalidate(kwargs.get('cwd'))
+
 def runner(cmd: str):
     '''
     Produce a standard command runner
@@ -23,9 +171,9 @@ def runner(cmd: str):
             check: bool = True,
             boolean_return: bool = False,
             capture_output=True,
-            input: Optional[str] = None,
+            input: Optional[str|bytes] = None,
             text: bool = True,
-            **kwargs) -> CmdResult:
+            **kwargs) -> CmdResult | BytesCmdResult:
         '''
         Run command with the given arguments.
         Output to stderr is logged at the error level.
@@ -37,30 +185,277 @@ def runner(cmd: str):
             default: False
         :param capture_output: If True, capture stdout and stderr.
             default: True
+        :param text: If False, run in bytes mode: output is not decoded, and
+            a `BytesCmdResult` is returned, which decodes only on access.
+            default: True
         '''
         xargs = [str(a) for a in args]
+        kwargs = {**_run_options.get(), **kwargs}
         if boolean_return:
             check = False
+        cache = command_cache()
+        key = _cache_key(cache, cmd, xargs, check, boolean_return, capture_output, input, text, kwargs)
+        if key is not None:
+            hit = cast(CommandCache, cache).get(key)
+            if hit is not None:
+                log.debug(f"> {cmd}{xargs} (cached)")
+                return hit
         log.debug(f"> {cmd}{xargs}")
-        p = run([cmd, *xargs],
-                text=text,
-                input=input,
-                capture_output=capture_output,
-                **kwargs)
-        p_err = p.stderr
-        if p_err:
-            log.warn('%s', p_err)
-        if check and p.returncode != 0:
-            log.error(f'''{cmd}{xargs} returned {p.returncode}
-cwd={os.getcwd()}
-stdout={p.stdout}
-stdout={p.stdout}''')
-            raise ValueError(f"{cmd}{xargs} returned {p.returncode}")
+        if not text and isinstance(input, str):
+            input = input.encode(_ENCODING)
+        start = perf_counter()
+        try:
+            stdout, stderr, returncode, spawn = _run([cmd, *xargs],
+                    text=text,
+                    input=input,
+                    capture_output=capture_output,
+                    **kwargs)
+        except TimeoutExpired:
+            _record(cmd, xargs, start, outcome='timeout')
+            raise
+        except OSError:
+            _record(cmd, xargs, start, outcome='spawn_error')
+            raise
+        _record(cmd, xargs, start,
+                spawn=spawn,
+                stdout=_nbytes(stdout),
+                stderr=_nbytes(stderr),
+                outcome=_outcome(returncode, boolean_return))
+        result = _result(cmd, xargs, stdout, stderr, returncode,
+                       check=check,
+                       boolean_return=boolean_return,
+                       text=text)
+        _cache_update(cache, key, result, cmd, xargs, kwargs)
+        return result
+    return do_run
+
+def async_runner(cmd: str, *, limit: int = 8):
+    '''
+    Produce a command runner for use with asyncio. It has the same signature
+    and result as the runner produced by `runner`, but must be awaited.
+
+    :param limit: The maximum number of processes this runner will have
+        running at once. Further calls wait their turn.
+        default: 8
+    '''
+    if limit < 1:
+        raise ValueError(f'Invalid limit {limit}')
+    # A semaphore belongs to the event loop it first waits in, so each loop
+    # gets its own, made when the runner is first used there.
+    semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = \
+        weakref.WeakKeyDictionary()
+    lock = threading.Lock()
+    def semaphore() -> asyncio.Semaphore:
+        '''
+        The semaphore limiting this runner in the running event loop.
+        '''
+        loop = asyncio.get_running_loop()
+        with lock:
+            sem = semaphores.get(loop)
+            if sem is None:
+                sem = semaphores[loop] = asyncio.Semaphore(limit)
+            return sem
+    async def do_run(*args: CmdArg,
+            check: bool = True,
+            boolean_return: bool = False,
+            capture_output=True,
+            input: Optional[str] = None,
+            text: bool = True,
+            **kwargs) -> CmdResult | BytesCmdResult:
+        '''
+        Run command with the given arguments, as a coroutine.
+        Output to stderr is logged at the error level.
+        :param check: If True, raise an exception if the command fails
+            default: True
+        :param boolean_return: If True, return a tuple of (stdout, True/False)
+            indicating whether the command succeeded. Return codes other than
+            0 and 1 are still treated as errors.
+            default: False
+        :param capture_output: If True, capture stdout and stderr.
+            default: True
+        :param text: If False, run in bytes mode, returning a `BytesCmdResult`.
+            default: True
+        :param timeout: If given, kill the process and raise `TimeoutExpired`
+            if it runs longer than this many seconds.
+        '''
+        xargs = [str(a) for a in args]
+        kwargs = {**_run_options.get(), **kwargs}
         if boolean_return:
-            if p.returncode and p.returncode != 1:
-                raise ValueError(f"{cmd}{xargs} returned {p.returncode}")
-            return CmdResult(p.stdout, p.stderr,  p.returncode == 0)
-        return CmdResult(p.stdout, p.stderr, p.returncode)
+            check = False
+        cache = command_cache()
+        key = _cache_key(cache, cmd, xargs, check, boolean_return, capture_output, input, text, kwargs)
+        if key is not None:
+            hit = cast(CommandCache, cache).get(key)
+            if hit is not None:
+                log.debug(f"> {cmd}{xargs} (cached)")
+                return hit
+        timeout = kwargs.pop('timeout', None)
+        pipe = asyncio.subprocess.PIPE if capture_output else None
+        async with semaphore():
+            log.debug(f"> {cmd}{xargs}")
+            start = perf_counter()
+            try:
+                p = await asyncio.create_subprocess_exec(
+                    cmd, *xargs,
+                    stdin=asyncio.subprocess.PIPE if input is not None else None,
+                    stdout=pipe,
+                    stderr=pipe,
+                    **kwargs)
+            except OSError:
+                _record(cmd, xargs, start, outcome='spawn_error')
+                raise
+            spawn = perf_counter() - start
+            b_input = input.encode(_ENCODING) if isinstance(input, str) else input
+            try:
+                stdout, stderr = await asyncio.wait_for(p.communicate(b_input), timeout)
+            except BaseException as ex:
+                # Timed out, or cancelled: the process must not outlive us.
+                if p.returncode is None:
+                    p.kill()
+                await p.wait()
+                if isinstance(ex, asyncio.TimeoutError):
+                    _record(cmd, xargs, start, spawn=spawn, outcome='timeout')
+                    raise TimeoutExpired([cmd, *xargs], timeout or 0)
+                _record(cmd, xargs, start, spawn=spawn, outcome='closed')
+                raise
+            _record(cmd, xargs, start,
+                    spawn=spawn,
+                    stdout=_nbytes(stdout),
+                    stderr=_nbytes(stderr),
+                    outcome=_outcome(cast(int, p.returncode), boolean_return))
+        if text:
+            stdout = stdout.decode(_ENCODING) if stdout is not None else None
+            stderr = stderr.decode(_ENCODING) if stderr is not None else None
+        result = _result(cmd, xargs, stdout, stderr, cast(int, p.returncode),
+                       check=check,
+                       boolean_return=boolean_return,
+                       text=text)
+        _cache_update(cache, key, result, cmd, xargs, kwargs)
+        return result
+    do_run.semaphore = semaphore  # type: ignore[attr-defined]
     return do_run
 
+def stream_runner(cmd: str):
+    '''
+    Produce a command runner that yields stdout incrementally, as records,
+    rather than buffering it all.
+    '''
+    def do_stream(*args: CmdArg,
+            check: bool = True,
+            sep: str = '\n',
+            input: Optional[str] = None,
+            text: bool = True,
+            chunk_size: int = 64 * 1024,
+            **kwargs) -> Iterator[str] | Iterator[bytes]:
+        '''
+        Run command with the given arguments, yielding records from stdout
+        as they arrive. The process is only read as fast as the records are
+        consumed, so the pipe provides backpressure.
+
+        Output to stderr is logged once the stream ends, and the return code
+        checked. If the consumer stops early, the process is killed.
+
+        :param check: If True, raise an exception if the command fails
+            default: True
+        :param sep: The record separator, typically '\n' or '\0' (for -z).
+            The separator is not included in the records. A final unterminated
+            record is yielded as well.
+            default: '\n'
+        :param text: If True, yield `str` records; otherwise, `bytes`.
+            default: True
+        :param chunk_size: How much to read from the pipe at a time.
+        :param timeout: If given, kill the process and raise `TimeoutExpired`
+            if it has not finished this many seconds after it started,
+            however fast the records are being consumed.
+        '''
+        xargs = [str(a) for a in args]
+        kwargs = {**_run_options.get(), **kwargs}
+        timeout = kwargs.pop('timeout', None)
+        log.debug(f"> {cmd}{xargs} (streaming)")
+        return _stream(cmd, xargs, sep.encode(), check, input, text, chunk_size, timeout, kwargs)
+    return do_stream
+
+def _stream(cmd: str, xargs: list[str], bsep: bytes,
+            check: bool,
+            input: Optional[str],
+            text: bool,
+            chunk_size: int,
+            timeout: Optional[float],
+            kwargs: dict) -> Iterator:
+    start = perf_counter()
+    try:
+        p = Popen([cmd, *xargs],
+                  stdin=PIPE if input is not None else DEVNULL,
+                  stdout=PIPE,
+                  stderr=PIPE,
+                  **kwargs)
+    except OSError:
+        _record(cmd, xargs, start, outcome='spawn_error')
+        raise
+    spawn = perf_counter() - start
+    nbytes = 0
+    stdout = cast(IO[bytes], p.stdout)
+    stderr: list[bytes] = []
+    expired = threading.Event()
+    def drain():
+        stderr.append(cast(IO[bytes], p.stderr).read())
+    def feed():
+        with cast(IO[bytes], p.stdin) as stdin:
+            try:
+                stdin.write(cast(str, input).encode(_ENCODING))
+            except BrokenPipeError:
+                pass
+    def expire():
+        if p.poll() is None:
+            expired.set()
+            p.kill()
+    threads = [threading.Thread(target=drain, daemon=True)]
+    if input is not None:
+        threads.append(threading.Thread(target=feed, daemon=True))
+    for t in threads:
+        t.start()
+    timer = threading.Timer(timeout, expire) if timeout is not None else None
+    if timer is not None:
+        timer.daemon = True
+        timer.start()
+    complete = False
+    err = b''
+    try:
+        buf = bytearray()
+        # Where to resume looking for a separator: there is none before it.
+        scanned = 0
+        while chunk := stdout.read1(chunk_size):
+            nbytes += len(chunk)
+            buf += chunk
+            end = buf.rfind(bsep, scanned)
+            if end >= 0:
+                for record in bytes(buf[:end]).split(bsep):
+                    yield record.decode(_ENCODING) if text else record
+                del buf[:end + len(bsep)]
+            # A separator may straddle the end of the buffer.
+            scanned = max(0, len(buf) - len(bsep) + 1)
+        if expired.is_set():
+            raise TimeoutExpired([cmd, *xargs], cast(float, timeout))
+        if buf:
+            yield buf.decode(_ENCODING) if text else bytes(buf)
+        complete = True
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if not complete:
+            p.kill()
+        p.wait()
+        for t in threads:
+            t.join()
+        stdout.close()
+        err = b''.join(stderr)
+        _record(cmd, xargs, start,
+                spawn=spawn,
+                stdout=nbytes,
+                stderr=len(err),
+                outcome=('timeout' if expired.is_set()
+                         else 'closed' if not complete
+                         else _outcome(p.returncode, False)))
+    _check(cmd, xargs, '<streamed>', err.decode(_ENCODING) if text else err, p.returncode, check=check)
+
 ssh = runner('ssh')
@@ -0,0 +1,210 @@
+'''
+Structured `git status`, from ``git status --porcelain=v2 -z``.
+
+The output is streamed and parsed a record at a time, so a large worktree's
+status is never held as one big string. Each entry becomes a small tuple;
+modes are ints, and the repeated short strings (status codes, submodule
+states) are shared.
+
+Paths are as git reports them: relative to the directory git is run in.
+They are decoded with `os.fsdecode`, so names that are not valid UTF-8
+round-trip to the filesystem.
+'''
+
+from os import fsdecode
+from sys import intern
+from typing import Iterable, Iterator, Literal, NamedTuple, Optional
+
+from gitgo.lowlevel.cmdargs import CmdArg
+from gitgo.lowlevel.cmdspec import CmdSpec, Flag, Value
+from gitgo.lowlevel.lowlevel import git_stream
+
+class BranchStatus(NamedTuple):
+    '''
+    The ``# branch.*`` and ``# stash`` headers. oid is None on an unborn
+    branch, head is None when detached; the others are None if not reported
+    (git omits the stash count when there are no stashes).
+    '''
+    oid: Optional[str] = None
+    head: Optional[str] = None
+    upstream: Optional[str] = None
+    ahead: Optional[int] = None
+    behind: Optional[int] = None
+    stash: Optional[int] = None
+
+class ChangedEntry(NamedTuple):
+    '''
+    An ordinary changed entry (``1``). xy is the index and worktree status,
+    e.g. '.M'; submodule is 'N...' for a non-submodule.
+    '''
+    xy: str
+    submodule: str
+    mode_head: int
+    mode_index: int
+    mode_worktree: int
+    oid_head: str
+    oid_index: str
+    path: str
+
+class RenamedEntry(NamedTuple):
+    '''
+    A renamed or copied entry (``2``). kind is 'R' or 'C', and score the
+    similarity percentage.
+    '''
+    xy: str
+    submodule: str
+    mode_head: int
+    mode_index: int
+    mode_worktree: int
+    oid_head: str
+    oid_index: str
+    kind: str
+    score: int
+    path: str
+    orig_path: str
+
+class UnmergedEntry(NamedTuple):
+    '''
+    An unmerged entry (``u``), with the modes and oids of stages 1-3.
+    '''
+    xy: str
+    submodule: str
+    mode_1: int
+    mode_2: int
+    mode_3: int
+    mode_worktree: int
+    oid_1: str
+    oid_2: str
+    oid_3: str
+    path: str
+
+class UntrackedEntry(NamedTuple):
+    path: str
+
+class IgnoredEntry(NamedTuple):
+    path: str
+
+StatusEntry = ChangedEntry | RenamedEntry | UnmergedEntry | UntrackedEntry | IgnoredEntry
+StatusRecord = BranchStatus | StatusEntry
+
+_modes: dict[bytes, int] = {}
+
+def _mode(m: bytes) -> int:
+    mode = _modes.get(m)
+    if mode is None:
+        mode = _modes[m] = int(m, 8)
+    return mode
+
+def _str(b: bytes) -> str:
+    return intern(b.decode())
+
+def _header(branch: BranchStatus, record: bytes) -> BranchStatus:
+    key, _, value = record[2:].decode().partition(' ')
+    match key:
+        case 'branch.oid':
+            return branch._replace(oid=None if value == '(initial)' else value)
+        case 'branch.head':
+            return branch._replace(head=None if value == '(detached)' else value)
+        case 'branch.upstream':
+            return branch._replace(upstream=value)
+        case 'branch.ab':
+            ahead, _, behind = value.partition(' ')
+            return branch._replace(ahead=int(ahead), behind=-int(behind))
+        case 'stash':
+            return branch._replace(stash=int(value))
+        case _:
+            # Unknown headers are to be ignored.
+            return branch
+
+def parse_status_v2(records: Iterable[bytes]) -> Iterator[StatusRecord]:
+    '''
+    Parse the NUL-separated records of ``git status --porcelain=v2 -z``.
+
+    If there are any headers, a single `BranchStatus` is yielded before the
+    first entry; the entries follow in git's order.
+    '''
+    it = iter(records)
+    branch: Optional[BranchStatus] = None
+    for record in it:
+        if not record:
+            continue
+        kind = record[:1]
+        if kind == b'#':
+            branch = _header(branch or BranchStatus(), record)
+            continue
+        if branch is not None:
+            yield branch
+            branch = None
+        match kind:
+            case b'1':
+                _, xy, sub, mh, mi, mw, hh, hi, path = record.split(b' ', 8)
+                yield ChangedEntry(_str(xy), _str(sub),
+                                   _mode(mh), _mode(mi), _mode(mw),
+                                   hh.decode(), hi.decode(),
+                                   fsdecode(path))
+            case b'2':
+                _, xy, sub, mh, mi, mw, hh, hi, xscore, path = record.split(b' ', 9)
+                orig = next(it, None)
+                if orig is None:
+                    raise ValueError(f'Missing original path for renamed entry {record!r}')
+                yield RenamedEntry(_str(xy), _str(sub),
+                                   _mode(mh), _mode(mi), _mode(mw),
+                                   hh.decode(), hi.decode(),
+                                   _str(xscore[:1]), int(xscore[1:]),
+                                   fsdecode(path), fsdecode(orig))
+            case b'u':
+                _, xy, sub, m1, m2, m3, mw, h1, h2, h3, path = record.split(b' ', 10)
+                yield UnmergedEntry(_str(xy), _str(sub),
+                                    _mode(m1), _mode(m2), _mode(m3), _mode(mw),
+                                    h1.decode(), h2.decode(), h3.decode(),
+                                    fsdecode(path))
+            case b'?':
+                yield UntrackedEntry(fsdecode(record[2:]))
+            case b'!':
+                yield IgnoredEntry(fsdecode(record[2:]))
+            case _:
+                raise ValueError(f'Unrecognized status record {record!r}')
+    if branch is not None:
+        yield branch
+
+_STATUS_V2 = CmdSpec(
+    Flag('branch'),
+    Flag('show_stash'),
+    Value('untracked_files'),
+    Value('ignored'),
+    Value('find_renames'),
+)
+
+def git_status_v2(*paths: CmdArg,
+                  branch: bool = True,
+                  show_stash: bool = False,
+                  untracked_files: Optional[Literal['all', 'normal', 'no']] = None,
+                  ignored: Optional[Literal['traditional', 'no', 'matching']] = None,
+                  find_renames: Optional[int] = None,
+                  untracked_cache: Optional[bool] = None,
+                  fsmonitor: Optional[bool|str] = None,
+                  **kwargs) -> Iterator[StatusRecord]:
+    '''
+    Run ``git status --porcelain=v2 -z``, yielding its records as they are
+    read. See `parse_status_v2`.
+
+    :param untracked_cache: If given, override core.untrackedCache.
+    :param fsmonitor: If given, override core.fsmonitor: a bool, or the path
+        of a hook.
+    Other keyword arguments (cwd, check, ...) are passed to the runner.
+    '''
+    config: list[str] = []
+    if untracked_cache is not None:
+        config += ('-c', f'core.untrackedCache={str(untracked_cache).lower()}')
+    if fsmonitor is not None:
+        value = str(fsmonitor).lower() if isinstance(fsmonitor, bool) else fsmonitor
+        config += ('-c', f'core.fsmonitor={value}')
+    args = (*config, 'status', '--porcelain=v2', '-z',
+            *_STATUS_V2.build(branch=branch,
+                              show_stash=show_stash,
+                              untracked_files=untracked_files,
+                              ignored=ignored,
+                              find_renames=find_renames),
+            *paths)
+    records = git_stream(*args, sep='\0', text=False, **kwargs)
+    return parse_status_v2(records)
@@ -1,9 +1,21 @@
-from gitgo.object.gitobj import GitObj, Oid, is_oid, ObjType, ObjIType, T_IndexType, T_ObjType
+from gitgo.object.gitobj import GitObj, Oid, is_oid, make_obj, hash_object, HashAlgorithm, HASH_LENGTHS, \
+    decode_offset, encode_offset, CommitInfo, parse_commit, \
+    TreeEntry, parse_tree, ObjType, ObjIType, T_IndexType, T_ObjType
 
 __all__ = [
     'GitObj',
     'Oid',
     'is_oid',
+    'make_obj',
+    'hash_object',
+    'HashAlgorithm',
+    'HASH_LENGTHS',
+    'decode_offset',
+    'encode_offset',
+    'CommitInfo',
+    'parse_commit',
+    'TreeEntry',
+    'parse_tree',
     'ObjType',
     'ObjIType',
     'T_IndexType',
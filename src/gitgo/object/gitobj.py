@@ -1,9 +1,11 @@
 
 from dataclasses import dataclass
+import hashlib
 import re
-from typing import NewType, TypeGuard, Literal, TypeVar
+from typing import NamedTuple, NewType, Optional, TypeGuard, Literal, TypeVar, TYPE_CHECKING
 
-from gitgo.objectstore import ObjectStore
+if TYPE_CHECKING:
+    from gitgo.objectstore import ObjectStore
 
 Oid = NewType('Oid', str)
 
@@ -27,6 +29,105 @@ T_ObjType = TypeVar('T_ObjType', bound=ObjType)
 T_IndexType = TypeVar('T_IndexType', bound=ObjIType)
 
 
+HashAlgorithm = Literal['sha1', 'sha256']
+
+# The length of a binary oid, by hash algorithm.
+HASH_LENGTHS: dict[str, int] = {'sha1': 20, 'sha256': 32}
+
+def decode_offset(data: bytes, pos: int) -> tuple[int, int]:
+    '''
+    Decode git's offset-style varint (as in OFS_DELTA and index v4) at pos,
+    returning the value and the position after it.
+    '''
+    c = data[pos]
+    pos += 1
+    value = c & 0x7f
+    while c & 0x80:
+        c = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (c & 0x7f)
+    return value, pos
+
+def encode_offset(value: int) -> bytes:
+    '''
+    Encode git's offset-style varint.
+    '''
+    out = bytearray([value & 0x7f])
+    value >>= 7
+    while value:
+        value -= 1
+        out.append(0x80 | (value & 0x7f))
+        value >>= 7
+    return bytes(reversed(out))
+
+def hash_object(type: ObjType, data: bytes, algorithm: HashAlgorithm = 'sha1') -> Oid:
+    '''
+    Compute the OID git would assign to an object with the given type and contents.
+    '''
+    h = hashlib.new(algorithm)
+    h.update(f'{type} {len(data)}\0'.encode())
+    h.update(data)
+    return Oid(h.hexdigest())
+
+class CommitInfo(NamedTuple):
+    '''
+    The parts of a commit needed to walk history: its root tree, parents,
+    and committer time (seconds since the epoch).
+    '''
+    tree: Oid
+    parents: tuple[Oid, ...]
+    time: int
+
+def parse_commit(data: bytes) -> CommitInfo:
+    '''
+    Extract the `CommitInfo` from the raw contents of a commit object. Only
+    the headers are examined.
+    '''
+    tree: Optional[Oid] = None
+    parents: list[Oid] = []
+    time = 0
+    for line in data.split(b'\n\n', 1)[0].split(b'\n'):
+        key, _, value = line.partition(b' ')
+        match key:
+            case b'tree':
+                tree = Oid(value.decode())
+            case b'parent':
+                parents.append(Oid(value.decode()))
+            case b'committer':
+                time = int(value.rsplit(b' ', 2)[1])
+    if tree is None:
+        raise ValueError('Commit has no tree')
+    return CommitInfo(tree, tuple(parents), time)
+
+class TreeEntry(NamedTuple):
+    '''
+    An entry of a tree: its git mode, name, and oid.
+    '''
+    mode: int
+    name: str
+    oid: Oid
+
+def parse_tree(data: bytes, hash_len: int = 20) -> list[TreeEntry]:
+    '''
+    The entries of a tree object, from its raw contents.
+
+    :param hash_len: The length of a binary oid: 20 for SHA-1, 32 for SHA-256.
+    '''
+    entries: list[TreeEntry] = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        space = data.index(b' ', pos)
+        nul = data.index(b'\0', space)
+        oid_end = nul + 1 + hash_len
+        if oid_end > end:
+            raise ValueError('Truncated tree entry')
+        entries.append(TreeEntry(int(data[pos:space], 8),
+                                 data[space + 1:nul].decode('utf-8', 'surrogateescape'),
+                                 Oid(data[nul + 1:oid_end].hex())))
+        pos = oid_end
+    return entries
+
 RE_OID = re.compile(r'^[0-9a-f]$')
 def is_oid(oid: str) -> TypeGuard[Oid]:
     return (
@@ -38,7 +139,7 @@ class GitObj:
     '''
     Any object in a Git repository object store.
     '''
-    _store: ObjectStore
+    _store: 'ObjectStore'
     oid: Oid
     type: ObjType
 
@@ -72,7 +173,7 @@ class GitBlob(GitObj):
     A Git blob object.
     '''
     type: Literal['blob']
-    def __init__(self, store: ObjectStore, oid: Oid):
+    def __init__(self, store: 'ObjectStore', oid: Oid):
         super().__init__(store, oid, 'blob')
 
 class GitTree(GitObj):
@@ -80,7 +181,7 @@ class GitTree(GitObj):
     A Git tree object.
     '''
     type: Literal['tree']
-    def __init__(self, store: ObjectStore, oid: Oid):
+    def __init__(self, store: 'ObjectStore', oid: Oid):
         super().__init__(store, oid, 'tree')
 
 class GitCommit(GitObj):
@@ -88,15 +189,34 @@ class GitCommit(GitObj):
     A Git commit object.
     '''
     type: Literal['commit']
-    def __init__(self, store: ObjectStore, oid: Oid):
+    def __init__(self, store: 'ObjectStore', oid: Oid):
         super().__init__(store, oid, 'commit')
 
+    @property
+    def info(self) -> CommitInfo:
+        '''
+        The commit's tree, parents and time, from the commit-graph if the
+        backend has one that covers this commit.
+        '''
+        info = self._store.backend.read_commit(self.oid)
+        if info is None:
+            raise KeyError(self.oid)
+        return info
+
+    @property
+    def tree(self) -> 'GitTree':
+        return GitTree(self._store, self.info.tree)
+
+    @property
+    def parents(self) -> tuple['GitCommit', ...]:
+        return tuple(GitCommit(self._store, p) for p in self.info.parents)
+
 class GitAnnotatedTag(GitObj):
     '''
     An annitated Git tag object.
     '''
     type: Literal['tag']
-    def __init__(self, store: ObjectStore, oid: Oid):
+    def __init__(self, store: 'ObjectStore', oid: Oid):
         super().__init__(store, oid, 'tag')
 
 class GitTag(GitObj):
@@ -104,7 +224,7 @@ class GitTag(GitObj):
     A Git tag object.
     '''
     type: Literal['tag']
-    def __init__(self, store: ObjectStore, oid: Oid):
+    def __init__(self, store: 'ObjectStore', oid: Oid):
         super().__init__(store, oid, 'tag')
 
 class GitModule(GitObj):
@@ -112,7 +232,7 @@ class GitModule(GitObj):
     A Git submodule object.
     '''
     type: Literal['module']
-    def __init__(self, store: ObjectStore, oid: Oid):
+    def __init__(self, store: 'ObjectStore', oid: Oid):
         super().__init__(store, oid, 'module')
 
 class GitSymlink(GitObj):
@@ -120,7 +240,7 @@ class GitSymlink(GitObj):
     A Git symlink object.
     '''
     type: Literal['symlink']
-    def __init__(self, store: ObjectStore, oid: Oid):
+    def __init__(self, store: 'ObjectStore', oid: Oid):
         super().__init__(store, oid, 'symlink')
 
 class GitGitlink(GitObj):
@@ -128,5 +248,21 @@ class GitGitlink(GitObj):
     A Git gitlink object.
     '''
     type: Literal['gitlink']
-    def __init__(self, store: ObjectStore, oid: Oid):
-        super().__init__(store, oid, 'gitlink') 
+    def __init__(self, store: 'ObjectStore', oid: Oid):
+        super().__init__(store, oid, 'gitlink')
+
+_OBJ_CLASSES: dict[str, type[GitObj]] = {
+    'blob': GitBlob,
+    'tree': GitTree,
+    'commit': GitCommit,
+    'tag': GitAnnotatedTag,
+}
+
+def make_obj(store: 'ObjectStore', oid: Oid, type: ObjType) -> GitObj:
+    '''
+    Construct the `GitObj` subclass appropriate to the given object type.
+    '''
+    cls = _OBJ_CLASSES.get(type)
+    if cls is None:
+        raise ValueError(f'Unknown object type {type!r} for {oid}')
+    return cls(store, oid)  # type: ignore[call-arg]
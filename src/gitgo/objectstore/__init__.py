@@ -1,5 +1,10 @@
 from gitgo.objectstore.objectstore import ObjectStore
+from gitgo.objectstore.cache import ObjectCache, ObjectCacheStats, Budget, DEFAULT_BUDGETS
 
 __all__ = [
     'ObjectStore',
-]
\ No newline at end of file
+    'ObjectCache',
+    'ObjectCacheStats',
+    'Budget',
+    'DEFAULT_BUDGETS',
+]
@@ -0,0 +1,231 @@
+'''
+A bounded cache of object contents, for `ObjectStore`.
+
+Each kind of object has its own budget, of entries and of bytes: commits
+and trees are small and read again and again as history and trees are
+walked, while one blob can be larger than all of them together. A kind's
+least recently used objects are evicted when it is over either limit.
+
+Pinned objects are never evicted. They count towards their kind's
+budget, so pinning a lot leaves less room for the rest.
+'''
+
+from collections import OrderedDict
+from typing import Iterable, Mapping, NamedTuple, Optional, TYPE_CHECKING
+import threading
+
+if TYPE_CHECKING:
+    from gitgo.object import Oid, ObjType
+
+class Budget(NamedTuple):
+    '''
+    The most entries, and bytes of contents, to keep of one kind of object.
+    '''
+    max_entries: int
+    max_bytes: int
+
+MiB = 1 << 20
+
+DEFAULT_BUDGETS: Mapping[str, Budget] = {
+    'commit': Budget(100_000, 64 * MiB),
+    'tree': Budget(100_000, 64 * MiB),
+    'tag': Budget(10_000, 8 * MiB),
+    'blob': Budget(10_000, 64 * MiB),
+}
+
+# The kinds of object that share a budget.
+_KINDS: Mapping[str, str] = {
+    'symlink': 'blob',
+    'gitlink': 'blob',
+    'module': 'blob',
+}
+
+class ObjectCacheStats(NamedTuple):
+    '''
+    Cache counters. The type of an object that is not found is not known:
+    for one kind of object, misses counts those added to the cache (as
+    after a miss), while the totals count the lookups that missed.
+    '''
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    bytes: int
+    pinned: int
+
+class _Partition:
+    '''
+    The cache for one kind of object. Not locked: `ObjectCache` locks.
+    '''
+    budget: Budget
+    size: int
+
+    def __init__(self, budget: Budget):
+        if budget.max_entries < 0 or budget.max_bytes < 0:
+            raise ValueError(f'Invalid cache budget {budget}')
+        self.budget = budget
+        self.size = 0
+        self.entries: OrderedDict['Oid', tuple['ObjType', bytes]] = OrderedDict()
+        self.pinned: dict['Oid', tuple['ObjType', bytes]] = {}
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries) + len(self.pinned)
+
+    def evict(self) -> list['Oid']:
+        '''
+        Evict the least recently used until within budget. Returns the
+        evicted oids.
+        '''
+        max_entries, max_bytes = self.budget
+        entries = self.entries
+        evicted = []
+        while entries and (len(self) > max_entries or self.size > max_bytes):
+            oid, (_, data) = entries.popitem(last=False)
+            self.size -= len(data)
+            evicted.append(oid)
+        self.evictions += len(evicted)
+        return evicted
+
+    def stats(self) -> ObjectCacheStats:
+        return ObjectCacheStats(self.hits, self.misses, self.evictions,
+                                len(self), self.size, len(self.pinned))
+
+class ObjectCache:
+    '''
+    An LRU cache of object contents, (type, data) by oid, with a `Budget`
+    for each kind of object. Safe to share between threads.
+
+    :param budgets: Budgets for some or all of 'commit', 'tree', 'tag' and
+        'blob', replacing the defaults.
+    '''
+    def __init__(self, budgets: Optional[Mapping[str, Budget]] = None):
+        budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+        self._parts = {kind: _Partition(budget) for kind, budget in budgets.items()}
+        # Which partition each cached (or pinned) oid is in.
+        self._where: dict['Oid', _Partition] = {}
+        # Oids pinned before they were cached.
+        self._pins: set['Oid'] = set()
+        self._lock = threading.RLock()
+        self._misses = 0
+
+    def __repr__(self) -> str:
+        total = self.stats()
+        return f'{type(self).__name__}(entries={total.entries}, bytes={total.bytes})'
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, oid: object) -> bool:
+        return oid in self._where
+
+    def _part(self, type: 'ObjType') -> _Partition:
+        kind = _KINDS.get(type, type)
+        try:
+            return self._parts[kind]
+        except KeyError:
+            raise ValueError(f'Unknown object type {type!r}') from None
+
+    def get(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        '''
+        The cached type and contents, or None.
+        '''
+        with self._lock:
+            part = self._where.get(oid)
+            if part is None:
+                self._misses += 1
+                return None
+            part.hits += 1
+            found = part.pinned.get(oid)
+            if found is not None:
+                return found
+            part.entries.move_to_end(oid)
+            return part.entries[oid]
+
+    def put(self, oid: 'Oid', type: 'ObjType', data: bytes) -> None:
+        '''
+        Cache an object's contents, unless they are over its kind's budget
+        by themselves.
+        '''
+        part = self._part(type)
+        with self._lock:
+            if oid in self._where:
+                if oid in part.entries:
+                    part.entries.move_to_end(oid)
+                return
+            part.misses += 1
+            if oid in self._pins:
+                self._pins.discard(oid)
+                part.pinned[oid] = (type, data)
+            elif len(data) > part.budget.max_bytes or not part.budget.max_entries:
+                return
+            else:
+                part.entries[oid] = (type, data)
+            self._where[oid] = part
+            part.size += len(data)
+            self._evict(part)
+
+    def _evict(self, part: _Partition) -> None:
+        for oid in part.evict():
+            del self._where[oid]
+
+    def pin(self, oids: 'Oid | Iterable[Oid]') -> None:
+        '''
+        Keep objects until they are unpinned: those cached now, and those
+        cached later.
+        '''
+        with self._lock:
+            for oid in ([oids] if isinstance(oids, str) else oids):
+                part = self._where.get(oid)
+                if part is None:
+                    self._pins.add(oid)
+                elif oid in part.entries:
+                    part.pinned[oid] = part.entries.pop(oid)
+
+    def unpin(self, oids: 'Oid | Iterable[Oid]') -> None:
+        '''
+        Let objects be evicted again, as if just used.
+        '''
+        with self._lock:
+            for oid in ([oids] if isinstance(oids, str) else oids):
+                self._pins.discard(oid)
+                part = self._where.get(oid)
+                if part is not None and oid in part.pinned:
+                    part.entries[oid] = part.pinned.pop(oid)
+                    self._evict(part)
+
+    def discard(self, oid: 'Oid') -> None:
+        with self._lock:
+            self._pins.discard(oid)
+            part = self._where.pop(oid, None)
+            if part is not None:
+                found = part.entries.pop(oid, None) or part.pinned.pop(oid)
+                part.size -= len(found[1])
+
+    def clear(self) -> None:
+        '''
+        Drop everything but the pinned objects.
+        '''
+        with self._lock:
+            for part in self._parts.values():
+                part.size -= sum(len(data) for _, data in part.entries.values())
+                for oid in part.entries:
+                    del self._where[oid]
+                part.entries.clear()
+
+    def stats(self, type: Optional['ObjType'] = None) -> ObjectCacheStats:
+        '''
+        The counters for one kind of object, or the totals.
+        '''
+        with self._lock:
+            if type is not None:
+                return self._part(type).stats()
+            total = ObjectCacheStats(*(sum(column) for column in
+                                       zip(*(p.stats() for p in self._parts.values()))))
+            return total._replace(misses=self._misses)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            for part in self._parts.values():
+                part.hits = part.misses = part.evictions = 0
+            self._misses = 0
@@ -1,23 +1,123 @@
-
-from typing import Optional, TYPE_CHECKING
+from typing import Iterable, Iterator, Mapping, Optional, TYPE_CHECKING
+import re
 
 from gitgo.frontend.base import FrontendBase
+from gitgo.objectstore.cache import ObjectCache, Budget
 if TYPE_CHECKING:
     from gitgo.backend import ObjectStoreBackend
-    from gitgo.object import Oid, GitObj
+    from gitgo.object import Oid, GitObj, ObjType
+
+RE_OID = re.compile(r'[0-9a-f]{40}|[0-9a-f]{64}')
 
 class ObjectStore(FrontendBase['ObjectStoreBackend']):
+    '''
+    The objects of a repository, through its backend. Object contents read
+    through the store are kept in a bounded `ObjectCache`, and an object's
+    `GitObj` is made from its cached type without asking the backend.
+
+    Objects can also be got and stored as attributes named by their oids.
+
+    :param cache: The cache to use; it may be shared between stores.
+    :param budgets: Budgets for a new cache (see `ObjectCache`).
+    '''
     backend: 'ObjectStoreBackend'
-    _cache: dict['Oid', 'GitObj']
-    def __init__(self):
-        self.cache  = dict
-    def __getattr__(self, oid: 'Oid') -> Optional['GitObj']:
-        return self._cache.get(oid, None) or self._fetch(oid)
-    def __setattr__(self, oid: 'Oid', obj: 'GitObj'):
-        if oid not in self._cache:
-            self._cache[oid] = obj
-            self._store(oid, obj)
-    
+    cache: ObjectCache
+
+    def __init__(self, *,
+                 cache: Optional[ObjectCache] = None,
+                 budgets: Optional[Mapping[str, Budget]] = None):
+        self.cache = cache if cache is not None else ObjectCache(budgets)
+
+    def __getattr__(self, oid: str) -> Optional['GitObj']:
+        # Only called for what is not a real attribute.
+        if not RE_OID.fullmatch(oid):
+            raise AttributeError(f'{type(self).__name__!r} object has no attribute {oid!r}')
+        return self.fetch(oid)  # type: ignore[arg-type]
+
+    def __setattr__(self, oid: str, obj: 'GitObj'):
+        if not RE_OID.fullmatch(oid):
+            super().__setattr__(oid, obj)
+        else:
+            self._store(oid, obj)  # type: ignore[arg-type]
+
+    def fetch(self, oid: 'Oid') -> Optional['GitObj']:
+        '''
+        The object with the given oid.
+        '''
+        found = self.cache.get(oid)
+        if found is not None:
+            from gitgo.object import make_obj
+            return make_obj(self, oid, found[0])
+        return self._fetch(oid)
+
+    def read(self, oid: 'Oid') -> Optional[tuple['ObjType', bytes]]:
+        '''
+        The type and contents of an object, or None if it is not present.
+        '''
+        found = self.cache.get(oid)
+        if found is None:
+            found = self.backend.read(oid)
+            if found is not None:
+                self.cache.put(oid, *found)
+        return found
+
+    def get_many(self, oids: Iterable['Oid']) -> Iterator[tuple['Oid', Optional[tuple['ObjType', bytes]]]]:
+        '''
+        The types and contents of many objects (None for those not present),
+        each yielded with its oid as soon as it is had: first those in the
+        cache, then the rest as the backend reads them, in one batch.
+        '''
+        missing: list['Oid'] = []
+        for oid in dict.fromkeys(oids):
+            found = self.cache.get(oid)
+            if found is None:
+                missing.append(oid)
+            else:
+                yield oid, found
+        if missing:
+            for oid, found in self.backend.read_many(missing):
+                if found is not None:
+                    self.cache.put(oid, *found)
+                yield oid, found
+
+    def prefetch(self, oids: Iterable['Oid']) -> int:
+        '''
+        Read the objects not already cached into the cache, in one batch.
+        Returns how many were read.
+        '''
+        cache = self.cache
+        missing = [oid for oid in dict.fromkeys(oids) if oid not in cache]
+        count = 0
+        for oid, found in self.backend.read_many(missing):
+            if found is not None:
+                cache.put(oid, *found)
+                count += 1
+        return count
+
+    def prefetch_tree(self, oid: 'Oid', /, *, recursive: bool = False) -> int:
+        '''
+        Prefetch the entries of a tree, with a batch per level of the tree
+        when recursive. Submodules (gitlinks) are skipped. Returns how many
+        objects were read.
+        '''
+        from gitgo.object import parse_tree
+        hash_len = len(oid) // 2
+        count = 0
+        level = [oid]
+        while level:
+            count += self.prefetch(level)
+            children: list['Oid'] = []
+            for _, found in self.get_many(level):
+                if found is None or found[0] != 'tree':
+                    continue
+                children.extend(e.oid for e in parse_tree(found[1], hash_len)
+                                if e.mode != 0o160000)
+            if not recursive:
+                count += self.prefetch(children)
+                break
+            level = children
+        return count
+
     def _fetch(self, oid: 'Oid') -> Optional['GitObj']:
         return self.backend.fetch(oid)
 
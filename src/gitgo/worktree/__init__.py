@@ -1,5 +1,15 @@
 from gitgo.worktree.worktree import Worktree
+from gitgo.worktree.status import StatusEngine, WorktreeChanges, worktree_mode
+from gitgo.worktree.hashing import HashedFile, hash_file, hash_paths
+from gitgo.worktree.watcher import WorktreeWatcher
 
 __all__  = [
-    'Worktree'
-]
\ No newline at end of file
+    'Worktree',
+    'StatusEngine',
+    'WorktreeChanges',
+    'worktree_mode',
+    'HashedFile',
+    'hash_file',
+    'hash_paths',
+    'WorktreeWatcher',
+]
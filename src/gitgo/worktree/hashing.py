@@ -0,0 +1,134 @@
+'''
+Hashing worktree files as git blobs: ``blob <size>\\0`` and the contents,
+with SHA-1 or SHA-256, as ``git hash-object`` does (without filters).
+
+Files are never read whole: large ones are mapped and hashed a slice at a
+time, small ones read in one call. `hash_paths` hashes many files at once,
+yielding each result as it is ready. Threads are used for small batches:
+hashlib releases the GIL while it hashes more than a couple of KiB, so
+large files hash in parallel. Large batches go to a process pool, in
+chunks, since most files in a tree are small enough that the per-file
+overhead, not the hashing, is what needs more cores.
+'''
+
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from stat import S_ISLNK, S_ISREG
+from typing import Iterable, Iterator, NamedTuple, Optional, TYPE_CHECKING
+import hashlib
+import mmap
+import os
+
+from gitgo.object import Oid
+
+if TYPE_CHECKING:
+    from gitgo.object import HashAlgorithm
+
+# Files up to this size are read in one call; larger ones are mapped.
+SMALL_FILE = 1 << 20
+
+# The slice of a mapped file given to hashlib at a time.
+SLICE = 8 << 20
+
+# Batches with at least this many paths go to a process pool.
+PROCESS_MIN = 4096
+
+# Paths per task, for processes and for threads: a task per file would
+# cost more than hashing most files.
+PROCESS_CHUNK = 512
+THREAD_CHUNK = 32
+
+Pathish = str | bytes | os.PathLike
+
+class HashedFile(NamedTuple):
+    '''
+    A file's blob id, and the size that was hashed.
+    '''
+    path: Pathish
+    oid: Oid
+    size: int
+
+def hash_file(path: Pathish, /, *,
+              algorithm: 'HashAlgorithm' = 'sha1',
+              st: Optional[os.stat_result] = None) -> HashedFile:
+    '''
+    The blob id git would give the file at path: for a symlink, that of the
+    path it points to.
+
+    :param st: The file's `os.lstat`, if already known.
+    '''
+    if st is None:
+        st = os.lstat(path)
+    h = hashlib.new(algorithm)
+    if S_ISLNK(st.st_mode):
+        target = os.readlink(os.fsencode(path))
+        h.update(b'blob %d\0' % len(target))
+        h.update(target)
+        return HashedFile(path, Oid(h.hexdigest()), len(target))
+    if not S_ISREG(st.st_mode):
+        raise ValueError(f'{os.fsdecode(path)} is not a file or symlink')
+    with open(path, 'rb') as f:
+        # The size of what is opened, not what was stat-ed: the header must
+        # agree with what is hashed.
+        size = os.fstat(f.fileno()).st_size
+        h.update(b'blob %d\0' % size)
+        if size <= SMALL_FILE:
+            data = f.read(size)
+            if len(data) != size:
+                raise ValueError(f'{os.fsdecode(path)} changed while being hashed')
+            h.update(data)
+        else:
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mm)
+                try:
+                    for pos in range(0, size, SLICE):
+                        h.update(view[pos:pos + SLICE])
+                finally:
+                    view.release()
+    return HashedFile(path, Oid(h.hexdigest()), size)
+
+def _hash_chunk(paths: list[Pathish], algorithm: 'HashAlgorithm') -> list[HashedFile]:
+    return [hash_file(p, algorithm=algorithm) for p in paths]
+
+def hash_paths(paths: Iterable[Pathish], /, *,
+               algorithm: 'HashAlgorithm' = 'sha1',
+               executor: Optional[Executor] = None,
+               workers: Optional[int] = None,
+               processes: Optional[bool] = None) -> Iterator[HashedFile]:
+    '''
+    Hash many files, yielding each `HashedFile` as it is done, in no
+    particular order. An error hashing any file (such as `FileNotFoundError`)
+    is raised when its result is reached.
+
+    :param executor: Run the work here, instead of in a pool made for the
+        call.
+    :param workers: The size of the pool made for the call.
+    :param processes: Use processes rather than threads. By default,
+        processes are used for PROCESS_MIN paths or more.
+    '''
+    paths = list(paths)
+    if not paths:
+        return
+    if executor is None:
+        if processes is None:
+            processes = len(paths) >= PROCESS_MIN
+        pool: Executor
+        if processes:
+            pool = ProcessPoolExecutor(workers or os.cpu_count())
+        else:
+            pool = ThreadPoolExecutor(workers or min(32, (os.cpu_count() or 1) * 2),
+                                      thread_name_prefix='gitgo-hash')
+        with pool:
+            yield from hash_paths(paths, algorithm=algorithm, executor=pool)
+        return
+    size = PROCESS_CHUNK if isinstance(executor, ProcessPoolExecutor) else THREAD_CHUNK
+    chunks: list[Future[list[HashedFile]]] = [
+        executor.submit(_hash_chunk, paths[i:i + size], algorithm)
+        for i in range(0, len(paths), size)
+    ]
+    try:
+        for done in as_completed(chunks):
+            yield from done.result()
+    finally:
+        for future in chunks:
+            future.cancel()
@@ -0,0 +1,237 @@
+'''
+Worktree status without running git: the index entries are checked against
+the files, the way ``git status`` (and ``git diff-files``) does it.
+
+Each tracked file is ``lstat``-ed, from a pool of threads (the syscalls
+release the GIL), and its stat data compared with the index. Only files
+whose stat data no longer matches are read and hashed, and a file whose
+size changed is known to be modified without reading it.
+
+Racy git: a file changed within the same timestamp tick as the index was
+written can have the stat data recorded in the index and still differ.
+Entries whose mtime is not older than the index file's are therefore
+always hashed, as git does. The hashes are kept, keyed by stat data, so a
+second status of the same tree hashes nothing new; a file modified too
+recently to be told apart from its cached stat data is hashed again.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from stat import S_ISDIR, S_ISLNK, S_ISREG
+from typing import Iterable, NamedTuple, Optional, Sequence, TYPE_CHECKING
+import os
+import threading
+import time
+
+from gitgo.index.table import IndexTable, ASSUME_VALID, SKIP_WORKTREE, INTENT_TO_ADD, NS
+
+if TYPE_CHECKING:
+    from gitgo.backend import WorktreeBackend
+    from gitgo.object import HashAlgorithm
+
+SYMLINK = 0o120000
+GITLINK = 0o160000
+TYPE_MASK = 0o170000
+
+# Rows per task: enough to amortize the task, few enough to spread the work.
+CHUNK = 2048
+
+# Files modified this recently (by the filesystem's coarse clock) are not
+# trusted to the hash cache.
+RACY_NS = NS
+
+_MASK = 0xffffffff
+
+_MODIFIED, _DELETED, _TYPECHANGED, _STALE = range(4)
+
+# The stat data that, if unchanged, means the contents are: (mtime, ctime,
+# ino, uid, gid, size, mode), as the index records them.
+StatKey = tuple[int, int, int, int, int, int, int]
+
+class WorktreeChanges(NamedTuple):
+    '''
+    The differences between the index (stage 0) and the worktree, as paths
+    in index order. unmerged lists the conflicted paths, which are not
+    compared. stale lists the files that are unchanged, but whose stat data
+    no longer matches the index: they are hashed on each status until the
+    index is refreshed.
+    '''
+    modified: list[str]
+    deleted: list[str]
+    typechanged: list[str]
+    unmerged: list[str]
+    stale: list[str]
+
+    @property
+    def clean(self) -> bool:
+        return not (self.modified or self.deleted or self.typechanged or self.unmerged)
+
+def worktree_mode(st: os.stat_result) -> int:
+    '''
+    The mode git would record for a file with this stat data: 0 for what
+    git cannot track, and a directory is taken to be a submodule.
+    '''
+    mode = st.st_mode
+    if S_ISREG(mode):
+        return 0o100755 if mode & 0o100 else 0o100644
+    if S_ISLNK(mode):
+        return SYMLINK
+    if S_ISDIR(mode):
+        return GITLINK
+    return 0
+
+def stat_key(st: os.stat_result) -> StatKey:
+    return (st.st_mtime_ns, st.st_ctime_ns, st.st_ino & _MASK, st.st_uid & _MASK,
+            st.st_gid & _MASK, st.st_size & _MASK, worktree_mode(st))
+
+class StatusEngine:
+    '''
+    Compares index tables with the worktree of a `WorktreeBackend`.
+    Keep one per worktree: it holds the thread pool and the hashes of the
+    files it has read.
+
+    :param workers: The number of threads to stat and hash with.
+    '''
+    worktree: 'WorktreeBackend'
+    workers: int
+
+    def __init__(self, worktree: 'WorktreeBackend', /, *,
+                 workers: Optional[int] = None):
+        self.worktree = worktree
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self._hashed: dict[bytes, tuple[StatKey, bytes]] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='gitgo-status')
+            return self._pool
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def hash(self, path: bytes, st: os.stat_result,
+             algorithm: 'HashAlgorithm' = 'sha1') -> bytes:
+        '''
+        The binary blob id of the file at path (relative to the worktree),
+        from the cache if its stat data is as when it was last hashed.
+        '''
+        key = stat_key(st)
+        cached = self._hashed.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        oid = bytes.fromhex(self.worktree.hash_blob(path, st, algorithm))
+        if st.st_mtime_ns < time.time_ns() - RACY_NS:
+            self._hashed[path] = (key, oid)
+        return oid
+
+    def _check(self, table: IndexTable, rows: Iterable[int],
+               racy_ns: Optional[int]) -> list[tuple[int, int]]:
+        '''
+        Check rows, returning the (row, change) of those that differ.
+        '''
+        lstat = self.worktree.lstat
+        stage, flags, ends, paths = table.stage, table.flags, table.ends, table.paths
+        out: list[tuple[int, int]] = []
+        for i in rows:
+            if stage[i] or flags[i] & (ASSUME_VALID | SKIP_WORKTREE):
+                continue
+            if flags[i] & INTENT_TO_ADD:
+                out.append((i, _MODIFIED))
+                continue
+            path = bytes(paths[ends[i - 1] if i else 0:ends[i]])
+            try:
+                st = lstat(path)
+            except (FileNotFoundError, NotADirectoryError):
+                out.append((i, _DELETED))
+                continue
+            mode = table.mode[i]
+            wmode = worktree_mode(st)
+            if mode == GITLINK:
+                # Only the presence of a submodule is checked, not its HEAD.
+                if wmode != GITLINK:
+                    out.append((i, _TYPECHANGED))
+                continue
+            if wmode in (0, GITLINK):
+                out.append((i, _DELETED))
+                continue
+            if wmode & TYPE_MASK != mode & TYPE_MASK:
+                out.append((i, _TYPECHANGED))
+                continue
+            if wmode != mode:
+                out.append((i, _MODIFIED))
+                continue
+            size = table.size[i]
+            mtime = table.mtime[i]
+            if (st.st_mtime_ns == mtime
+                    and st.st_ctime_ns == table.ctime[i]
+                    and st.st_ino & _MASK == table.ino[i]
+                    and st.st_uid & _MASK == table.uid[i]
+                    and st.st_gid & _MASK == table.gid[i]
+                    and st.st_size & _MASK == size
+                    and (racy_ns is None or mtime < racy_ns)):
+                continue
+            # A size of 0 is what git records for an entry it has not yet
+            # stat-ed (or has smudged as racy): only then can a file of
+            # another size be unchanged.
+            if size and st.st_size & _MASK != size:
+                out.append((i, _MODIFIED))
+                continue
+            same = self.hash(path, st, table.algorithm) == table.oid_at(i)
+            out.append((i, _STALE if same else _MODIFIED))
+        return out
+
+    def status(self, table: IndexTable, /, *,
+               index_mtime_ns: Optional[int] = None,
+               rows: Optional[Sequence[int]] = None) -> WorktreeChanges:
+        '''
+        Compare the stage 0 entries of table with the worktree.
+
+        :param index_mtime_ns: The mtime of the index file the table was
+            read from; entries not older than it are racily clean, and are
+            hashed. None if the entries have not been written.
+        :param rows: Check only these rows (see `rows_for`). The conflicted
+            paths are listed all the same.
+        '''
+        table.compact()
+        if rows is None:
+            rows = range(table.rows)
+        n = len(rows)
+        if n <= CHUNK:
+            results = [self._check(table, rows, index_mtime_ns)]
+        else:
+            pool = self._executor()
+            results = list(pool.map(lambda lo: self._check(table, rows[lo:lo + CHUNK], index_mtime_ns),
+                                    range(0, n, CHUNK)))
+        changes: tuple[list[str], ...] = ([], [], [], [])
+        for result in results:
+            for i, change in result:
+                changes[change].append(table.path_at(i).decode('utf-8', 'surrogateescape'))
+        modified, deleted, typechanged, stale = changes
+        unmerged: list[str] = []
+        for i in table.conflict_rows():
+            path = table.path_at(i).decode('utf-8', 'surrogateescape')
+            if not unmerged or unmerged[-1] != path:
+                unmerged.append(path)
+        return WorktreeChanges(modified, deleted, typechanged, unmerged, stale)
+
+def rows_for(table: IndexTable, paths: Iterable[bytes]) -> list[int]:
+    '''
+    The rows, in order, for the given paths, and for everything under those
+    that are (or were) directories.
+    '''
+    table.compact()
+    rows: set[int] = set()
+    for path in paths:
+        path = path.rstrip(b'/')
+        if not path:
+            return list(range(table.rows))
+        lo = table.bisect((path, 0))
+        hi = table.bisect((path, 4), lo)
+        rows.update(range(lo, hi))
+        rows.update(range(*table.prefix_range(path + b'/')))
+    return sorted(rows)
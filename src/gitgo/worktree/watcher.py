@@ -0,0 +1,496 @@
+'''
+Watching a worktree with inotify (Linux), so that status need only look at
+what changed.
+
+`WorktreeWatcher` watches every directory of the worktree (but not
+``.git``) from a thread of its own, and keeps the paths changed since it
+started, each with the sequence number of its last change. A token names
+a point in that sequence: `changed_since(token)` gives the paths changed
+after it, or None if the watcher cannot tell, because the token is from
+before the kernel's event queue overflowed (or from another watcher). The
+caller must then look at everything.
+
+Events arrive after the fact. To be sure a change made before a query is
+seen, `sync` writes a cookie file into the git directory, and waits for
+its event: the events before it have been handled by then.
+
+The watcher can also serve git's ``core.fsmonitor`` hook, protocol version
+2: `serve` listens on a socket in the git directory, and the hook written
+by `write_hook` asks it.
+
+inotify is reached through ctypes; nothing outside the standard library is
+needed.
+'''
+
+from pathlib import Path
+from secrets import token_hex
+from typing import Iterator, Optional, TYPE_CHECKING
+import ctypes
+import ctypes.util
+import errno
+import itertools
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+
+from gitgo.log import log
+from gitgo.lowlevel.cache import find_git_dir
+
+if TYPE_CHECKING:
+    from gitgo.index import IndexTable
+    from gitgo.worktree.status import StatusEngine, WorktreeChanges
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK)
+
+COOKIE_DIR = 'gitgo-cookies'
+SOCKET_NAME = 'gitgo-fsmonitor.sock'
+
+_event = struct.Struct('iIII')
+
+_libc: Optional[ctypes.CDLL] = None
+
+def _inotify() -> ctypes.CDLL:
+    global _libc
+    if _libc is None:
+        if not sys.platform.startswith('linux'):
+            raise ValueError('inotify is only available on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+def _check(result: int, what: str) -> int:
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, f'{what}: {os.strerror(err)}')
+    return result
+
+def parse_token(token: str) -> Optional[tuple[str, int]]:
+    '''
+    The (epoch, sequence) of a token, or None if it is not one of ours.
+    '''
+    match token.split(':'):
+        case ['gitgo', epoch, seq] if seq.isdigit():
+            return epoch, int(seq)
+        case _:
+            return None
+
+class WorktreeWatcher:
+    '''
+    Watches a worktree, keeping what has changed since a token. Use as a
+    context manager, or `start` and `close`.
+
+    :param root: The top of the worktree.
+    '''
+    root: Path
+    git_dir: Path
+    # Bumped whenever changes may have been missed; older tokens are void.
+    epoch: str
+    overflows: int
+    # Why the thread stopped, if it failed; the watcher is then not running.
+    error: Optional[Exception]
+
+    def __init__(self, root: Path, /):
+        self.root = Path(root)
+        git_dir = find_git_dir(self.root.resolve())
+        if git_dir is None:
+            raise ValueError(f'{root} is not in a git repository')
+        self.git_dir = git_dir
+        self._root = os.fsencode(self.root)
+        self._cookies = git_dir / COOKIE_DIR
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._dirty: dict[bytes, int] = {}
+        self._seen: set[str] = set()
+        self._wds: dict[int, bytes] = {}
+        self._cookie_wd = -1
+        self._fd = -1
+        self._wake: Optional[tuple[int, int]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[socket.socket] = None
+        self._counter = itertools.count()
+        self.epoch = token_hex(8)
+        self.overflows = 0
+        self.error = None
+        # For incremental status: (table, generation, index mtime, token, changes).
+        self._last: Optional[tuple['IndexTable', int, Optional[int], str, 'WorktreeChanges']] = None
+
+    def __enter__(self) -> 'WorktreeWatcher':
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def running(self) -> bool:
+        thread = self._thread
+        return thread is not None and thread.is_alive() and self.error is None
+
+    def start(self) -> None:
+        '''
+        Watch the worktree and start handling its events.
+        '''
+        if self._thread is not None:
+            return
+        libc = _inotify()
+        self._fd = _check(libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC), 'inotify_init1')
+        self._wake = os.pipe()
+        self._cookies.mkdir(exist_ok=True)
+        self._cookie_wd = _check(libc.inotify_add_watch(self._fd, bytes(self._cookies),
+                                                        IN_CREATE | IN_ONLYDIR),
+                                 f'inotify_add_watch {self._cookies}')
+        self._add_tree(b'', mark=False)
+        self._thread = threading.Thread(target=self._run, name='gitgo-watcher', daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        '''
+        Stop watching, and serving the fsmonitor hook.
+        '''
+        if self._server is not None:
+            server, self._server = self._server, None
+            server.close()
+            try:
+                os.unlink(self.git_dir / SOCKET_NAME)
+            except FileNotFoundError:
+                pass
+        thread, self._thread = self._thread, None
+        if thread is not None and self._wake is not None:
+            os.write(self._wake[1], b'x')
+            thread.join()
+        if self._wake is not None:
+            for fd in self._wake:
+                os.close(fd)
+            self._wake = None
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._wds.clear()
+
+    # Watches
+
+    def _add_tree(self, top: bytes, mark: bool) -> None:
+        '''
+        Watch top and the directories under it; with mark, mark everything
+        in them changed (they are new, and may have changed before their
+        watch was added).
+        '''
+        libc = _inotify()
+        stack = [top]
+        while stack:
+            rel = stack.pop()
+            full = os.path.join(self._root, rel) if rel else self._root
+            wd = libc.inotify_add_watch(self._fd, full, WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(err, f'inotify_add_watch {os.fsdecode(full)}: {os.strerror(err)}')
+            self._wds[wd] = rel
+            try:
+                with os.scandir(full) as it:
+                    for entry in it:
+                        name = os.fsencode(entry.name)
+                        path = rel + b'/' + name if rel else name
+                        if entry.is_dir(follow_symlinks=False):
+                            if name != b'.git':
+                                stack.append(path)
+                        elif mark:
+                            self._mark(path)
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+
+    def _mark(self, path: bytes) -> None:
+        self._dirty[path] = self._seq
+
+    def _run(self) -> None:
+        try:
+            self._loop()
+        except Exception as ex:
+            log.error('Watching %s failed: %s', self.root, ex)
+            with self._cond:
+                self.error = ex
+                self.epoch = token_hex(8)
+                self._dirty.clear()
+                self._cond.notify_all()
+
+    def _loop(self) -> None:
+        assert self._wake is not None
+        poll = select.poll()
+        poll.register(self._fd, select.POLLIN)
+        poll.register(self._wake[0], select.POLLIN)
+        while True:
+            ready = {fd for fd, _ in poll.poll()}
+            if self._wake[0] in ready:
+                return
+            try:
+                data = os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                continue
+            with self._cond:
+                self._seq += 1
+                for wd, mask, name in self._events(data):
+                    self._handle(wd, mask, name)
+                self._cond.notify_all()
+
+    @staticmethod
+    def _events(data: bytes) -> Iterator[tuple[int, int, bytes]]:
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = _event.unpack_from(data, pos)
+            pos += _event.size
+            yield wd, mask, data[pos:pos + length].rstrip(b'\0')
+            pos += length
+
+    def _handle(self, wd: int, mask: int, name: bytes) -> None:
+        if mask & IN_Q_OVERFLOW:
+            self._overflow()
+            return
+        if wd == self._cookie_wd:
+            self._seen.add(os.fsdecode(name))
+            return
+        rel = self._wds.get(wd)
+        if rel is None:
+            return
+        if mask & IN_IGNORED:
+            del self._wds[wd]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if rel:
+                self._mark(rel + b'/')
+            return
+        if rel == b'' and name == b'.git':
+            return
+        path = rel + b'/' + name if rel else name
+        if mask & IN_ISDIR:
+            self._mark(path + b'/')
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path, mark=True)
+        else:
+            self._mark(path)
+
+    def _overflow(self) -> None:
+        '''
+        Events were lost: void the tokens so far, and watch any directories
+        that were missed.
+        '''
+        self.overflows += 1
+        self.epoch = token_hex(8)
+        self._dirty.clear()
+        self._add_tree(b'', mark=False)
+
+    # Queries
+
+    def sync(self, timeout: float = 5.0) -> None:
+        '''
+        Wait until the changes made before this call have been handled.
+        '''
+        if not self.running:
+            raise ValueError('The watcher is not running')
+        name = f'{os.getpid()}-{threading.get_ident()}-{next(self._counter)}'
+        cookie = self._cookies / name
+        cookie.touch()
+        try:
+            with self._cond:
+                if not self._cond.wait_for(lambda: name in self._seen or self.error is not None,
+                                           timeout):
+                    raise TimeoutError(f'No event for {cookie} in {timeout}s')
+                if self.error is not None:
+                    raise ValueError('The watcher is not running') from self.error
+                self._seen.discard(name)
+        finally:
+            cookie.unlink()
+
+    def token(self) -> str:
+        '''
+        A token for now: changes after this call are after the token.
+        '''
+        with self._cond:
+            return f'gitgo:{self.epoch}:{self._seq}'
+
+    def changed_since(self, token: str, *, sync: bool = True) -> Optional[set[bytes]]:
+        '''
+        The paths changed after token, relative to the worktree and encoded;
+        those of directories end in '/', and mean everything under them.
+        None if that cannot be told, and everything must be looked at.
+
+        :param sync: First wait for the changes made before this call.
+        '''
+        if sync:
+            self.sync()
+        parsed = parse_token(token)
+        with self._cond:
+            if parsed is None or parsed[0] != self.epoch or parsed[1] > self._seq:
+                return None
+            seq = parsed[1]
+            return {path for path, s in self._dirty.items() if s > seq}
+
+    def changes(self, token: str) -> tuple[str, Optional[set[bytes]]]:
+        '''
+        A new token, and the changes since the given one, at the same point:
+        none can fall between them. If the watcher has stopped, the changes
+        are None.
+        '''
+        try:
+            self.sync()
+        except ValueError:
+            return self.token(), None
+        with self._cond:
+            return self.token(), self.changed_since(token, sync=False)
+
+    def status(self, engine: 'StatusEngine', table: 'IndexTable', /, *,
+               index_mtime_ns: Optional[int] = None) -> 'WorktreeChanges':
+        '''
+        `StatusEngine.status`, checking only the rows for the paths changed
+        since the last status of the same entries (and index file). Anything
+        else means a full status.
+        '''
+        from gitgo.worktree.status import WorktreeChanges, rows_for
+        table.compact()
+        last = self._last
+        token, changed = self.changes(last[3] if last is not None else '')
+        if (last is None or changed is None or last[0] is not table
+                or last[1:3] != (table.generation, index_mtime_ns)):
+            result = engine.status(table, index_mtime_ns=index_mtime_ns)
+        else:
+            rows = rows_for(table, changed)
+            fresh = engine.status(table, index_mtime_ns=index_mtime_ns, rows=rows)
+            checked = {table.path_at(i) for i in rows}
+            def merge(old: list[str], new: list[str]) -> list[str]:
+                kept = [p for p in old if os.fsencode(p) not in checked]
+                return sorted(kept + new, key=os.fsencode)
+            previous = last[4]
+            result = WorktreeChanges(
+                merge(previous.modified, fresh.modified),
+                merge(previous.deleted, fresh.deleted),
+                merge(previous.typechanged, fresh.typechanged),
+                fresh.unmerged,
+                merge(previous.stale, fresh.stale),
+            )
+        self._last = (table, table.generation, index_mtime_ns, token, result)
+        return result
+
+    # The fsmonitor hook
+
+    def fsmonitor_response(self, token: str) -> bytes:
+        '''
+        The reply to git's fsmonitor query (protocol version 2): a new token,
+        then the changed paths, NUL-terminated; '/' for all of them if the
+        changes since the token are not known.
+        '''
+        new, changed = self.changes(token)
+        paths = sorted(changed) if changed is not None else [b'/']
+        return b''.join(p + b'\0' for p in (new.encode(), *paths))
+
+    def serve(self) -> Path:
+        '''
+        Answer fsmonitor hook queries, on a socket in the git directory.
+        Returns its path.
+        '''
+        path = self.git_dir / SOCKET_NAME
+        if self._server is not None:
+            return path
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(os.fsencode(path))
+        server.listen()
+        self._server = server
+        threading.Thread(target=self._serve, args=(server,),
+                         name='gitgo-fsmonitor', daemon=True).start()
+        return path
+
+    def _serve(self, server: socket.socket) -> None:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            with conn:
+                request = b''
+                while not request.endswith(b'\n'):
+                    chunk = conn.recv(4096)
+                    if not chunk:
+                        break
+                    request += chunk
+                try:
+                    conn.sendall(self.fsmonitor_response(request.decode().strip()))
+                except (OSError, TimeoutError, ValueError):
+                    pass
+
+def query(git_dir: Path, token: str) -> bytes:
+    '''
+    Ask the watcher serving git_dir for the changes since token, as the
+    fsmonitor hook does.
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(os.fsencode(git_dir / SOCKET_NAME))
+        conn.sendall(token.encode() + b'\n')
+        conn.shutdown(socket.SHUT_WR)
+        chunks = []
+        while chunk := conn.recv(1 << 16):
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+HOOK = """#!{python}
+# git fsmonitor hook (protocol version 2), written by gitgo: asks the
+# watcher serving {socket!r}. Fails, so git looks at everything, if there
+# is none.
+import socket
+import sys
+
+if len(sys.argv) != 3 or sys.argv[1] != '2':
+    sys.exit('Only fsmonitor hook protocol version 2 is supported')
+try:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect({socket!r})
+        conn.sendall(sys.argv[2].encode() + b'\\n')
+        conn.shutdown(socket.SHUT_WR)
+        response = b''.join(iter(lambda: conn.recv(1 << 16), b''))
+except OSError as ex:
+    sys.exit(f'No gitgo watcher: {{ex}}')
+if not response:
+    sys.exit(1)
+sys.stdout.buffer.write(response)
+"""
+
+def write_hook(git_dir: Path, path: Optional[Path] = None) -> Path:
+    '''
+    Write the fsmonitor hook for the watcher serving git_dir (by default, as
+    gitgo-fsmonitor-hook there), to be set as ``core.fsmonitor``. It uses
+    only the standard library, so starts quickly.
+    '''
+    if path is None:
+        path = git_dir / 'gitgo-fsmonitor-hook'
+    path.write_text(HOOK.format(python=sys.executable,
+                                socket=os.fsdecode(git_dir / SOCKET_NAME)))
+    path.chmod(0o755)
+    return path
@@ -0,0 +1,69 @@
+'''
+Microbenchmark: building argv with the compiled `CmdSpec` builders, versus
+the generator-based helpers in gitgo.lowlevel.cmdargs they replaced.
+
+Not collected by pytest; run directly:
+
+    python tests/bench_argv.py
+'''
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from gitgo.lowlevel.cmdargs import flags, arg1s  # noqa: E402
+from gitgo.lowlevel.lowlevel import _STATUS, _REV_PARSE  # noqa: E402
+
+def status_generators():
+    return ('status',
+            *flags(long=False, short=False, branch=True, show_stash=False,
+                   ignored_too=False, ahead_behind=False, renames=False),
+            *arg1s(porcelain='v2', untracked_files='all', ignored=None, find_renames=None))
+
+def status_compiled():
+    return ('status',
+            *_STATUS.build(long=False, short=False, branch=True, show_stash=False,
+                     ignored_too=False, ahead_behind=False, renames=False,
+                     porcelain='v2', untracked_files='all', ignored=None, find_renames=None))
+
+def rev_parse_generators():
+    return ('rev-parse',
+            *flags(verify=True, quiet=True, symbolic_full_name=False, symbolic=False,
+                   all=False, local_env_vars=False, git_dir=False, git_common_dir=False,
+                   show_toplevel=False, show_superproject_working_tree=False,
+                   absolute_git_dir=False, is_inside_git_dir=False, is_inside_work_tree=False,
+                   is_bare_repository=False, show_cdup=False, show_prefix=False),
+            *arg1s(branches=None, tags=None, remotes=None, glob=None, resolve_git_dir=None,
+                   git_path=None, shared_index_path=None, show_object_format='storage',
+                   path_format=None),
+            'HEAD')
+
+def rev_parse_compiled():
+    return ('rev-parse',
+            *_REV_PARSE.build(verify=True, quiet=True, symbolic_full_name=False, symbolic=False,
+                        all=False, local_env_vars=False, git_dir=False, git_common_dir=False,
+                        show_toplevel=False, show_superproject_working_tree=False,
+                        absolute_git_dir=False, is_inside_git_dir=False,
+                        is_inside_work_tree=False, is_bare_repository=False,
+                        show_cdup=False, show_prefix=False, abbrev_ref=False,
+                        branches=None, tags=None, remotes=None, glob=None,
+                        resolve_git_dir=None, git_path=None, shared_index_path=None,
+                        show_object_format='storage', path_format=None),
+            'HEAD')
+
+def main(number: int = 100_000):
+    for name, old, new in (
+        ('status', status_generators, status_compiled),
+        ('rev-parse', rev_parse_generators, rev_parse_compiled),
+    ):
+        assert old() == new(), name
+        t_old = min(timeit.repeat(old, number=number, repeat=5))
+        t_new = min(timeit.repeat(new, number=number, repeat=5))
+        print(f'{name:10} generators {t_old / number * 1e6:7.2f}us'
+              f'  compiled {t_new / number * 1e6:7.2f}us'
+              f'  ({t_old / t_new:.1f}x)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+'''
+Hashing benchmark: `hash_paths` with threads and with processes, against
+``git hash-object --stdin-paths``, on a generated set of files.
+
+Not collected by pytest; run directly:
+
+    python tests/bench_hashing.py [files] [size]
+'''
+
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from gitgo.worktree import hash_file, hash_paths  # noqa: E402
+
+def timed(label: str, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f'{label:>24}: {(time.perf_counter() - start) * 1000:8.1f} ms')
+    return result
+
+def main(n: int, size: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(n):
+            path = Path(tmp) / f'file{i:06d}'
+            path.write_bytes(i.to_bytes(4, 'big') * (size // 4))
+            paths.append(path)
+        serial = timed('serial', lambda: {p: hash_file(p).oid for p in paths})
+        threads = timed('threads', lambda: {f.path: f.oid for f in hash_paths(paths, processes=False)})
+        procs = timed('processes', lambda: {f.path: f.oid for f in hash_paths(paths, processes=True)})
+        timed('git hash-object', lambda: subprocess.run(
+            ['git', 'hash-object', '--stdin-paths'], input='\n'.join(map(str, paths)),
+            text=True, capture_output=True, check=True))
+        assert serial == threads == procs
+        print(f'{n} files of {size} bytes')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 4096)
@@ -0,0 +1,64 @@
+'''
+Memory benchmark: bytes per index entry held as `IndexEntry` objects (one
+dataclass, set, and oid and path strings each), versus the columns of an
+`IndexTable`.
+
+Not collected by pytest; run directly:
+
+    python tests/bench_index_memory.py [entries]
+'''
+
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from gitgo.index import IndexEntry, IndexTable  # noqa: E402
+from gitgo.index.table import entry_row  # noqa: E402
+
+def entries(n: int):
+    for i in range(n):
+        yield 0, IndexEntry(
+            name=f'src/module{i // 1000:04d}/file{i % 1000:04d}.py',
+            type='blob',
+            oid=f'{i * 2654435761 % (1 << 160):040x}',  # type: ignore[arg-type]
+            mode=0o644,
+            ctime=1700000000.0 + i,
+            mtime=1700000000.0 + i,
+            dev=2049,
+            ino=1000000 + i,
+            uid=1000,
+            gid=1000,
+            flags=set(),
+            size=1234 + i % 5000,
+        )
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, used, elapsed
+
+def build_table(n: int) -> IndexTable:
+    table = IndexTable()
+    for stage, e in entries(n):
+        table.append(e.name.encode(), stage, entry_row(e))
+    return table
+
+def main(n: int = 1_000_000):
+    objects, used, elapsed = measure(lambda: list(entries(n)))
+    print(f'IndexEntry objects: {used / n:7.1f} bytes/entry  ({used / 2**20:7.1f} MiB, built in {elapsed:.1f}s)')
+    del objects
+    table, used, elapsed = measure(lambda: build_table(n))
+    print(f'IndexTable columns: {used / n:7.1f} bytes/entry  ({used / 2**20:7.1f} MiB, built in {elapsed:.1f}s)')
+    print(f'  of which column data: {table.nbytes() / n:.1f} bytes/entry')
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
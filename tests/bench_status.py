@@ -0,0 +1,56 @@
+'''
+Status benchmark: `NativeWorktreeBackend.status` against ``git diff-files``
+on a generated tree, cold (first status), warm (repeated), and with the
+worktree watched (only changed files are looked at).
+
+Not collected by pytest; run directly:
+
+    python tests/bench_status.py [files]
+'''
+
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from gitgo.backend.native import NativeWorktreeBackend  # noqa: E402
+from gitgo.index import GitPhysIndex  # noqa: E402
+
+def timed(label: str, fn, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    print(f'{label:>24}: {(time.perf_counter() - start) / repeat * 1000:8.1f} ms')
+    return result
+
+def main(n: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = Path(tmp)
+        subprocess.run(['git', 'init', '-q', str(repo)], check=True)
+        for i in range(n):
+            d = repo / f'dir{i // 500:04d}'
+            d.mkdir(exist_ok=True)
+            (d / f'file{i % 500:04d}.txt').write_text(f'file {i}\n' * (i % 17 + 1))
+        subprocess.run(['git', 'add', '.'], cwd=repo, check=True)
+        time.sleep(1.1)
+        subprocess.run(['git', 'update-index', '--refresh'], cwd=repo, check=True)
+        (repo / 'dir0000' / 'file0000.txt').write_text('changed\n')
+        index = GitPhysIndex(path=str(repo / '.git' / 'index'))
+        timed('load index', index.load)
+        worktree = NativeWorktreeBackend(repo)
+        changes = timed('status (cold)', lambda: worktree.status(index))
+        timed('status (warm)', lambda: worktree.status(index), repeat=5)
+        worktree.watch()
+        timed('status (watched, first)', lambda: worktree.status(index))
+        timed('status (watched)', lambda: worktree.status(index), repeat=5)
+        timed('git diff-files', lambda: subprocess.run(['git', 'diff-files', '--name-only'],
+                                                        cwd=repo, check=True, capture_output=True),
+              repeat=5)
+        print(f'{n} files, modified: {changes.modified}')
+        worktree.close()
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,29 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+def git(repo: Path, *args: str, input: str|None = None) -> str:
+    return subprocess.run(['git', *args],
+                          cwd=repo,
+                          input=input,
+                          text=True,
+                          capture_output=True,
+                          check=True).stdout.strip()
+
+@pytest.fixture
+def git_repo(tmp_path: Path) -> Path:
+    '''
+    A small repository with a single commit.
+    '''
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    git(repo, 'init', '-q', '-b', 'main')
+    git(repo, 'config', 'user.name', 'Test')
+    git(repo, 'config', 'user.email', 'test@example.com')
+    (repo / 'README').write_text('Hello, world\n')
+    (repo / 'src').mkdir()
+    (repo / 'src' / 'main.py').write_text('print("hi")\n')
+    git(repo, 'add', '.')
+    git(repo, 'commit', '-q', '-m', 'Initial commit')
+    return repo
@@ -0,0 +1,46 @@
+import pytest
+
+from tests.conftest import git
+
+from gitgo.lowlevel import CatFile, CatFilePool
+
+class TestCatFile:
+    def test_read(self, git_repo):
+        oid = git(git_repo, 'rev-parse', 'HEAD:README')
+        with CatFile(git_repo) as cf:
+            header, data = cf.read(oid)
+            assert header.type == 'blob'
+            assert header.size == 13
+            assert data == b'Hello, world\n'
+            assert cf.read('0' * 40) is None
+
+    def test_restart(self, git_repo):
+        with CatFile(git_repo, mode='batch-check') as cf:
+            assert cf.header('HEAD').type == 'commit'
+            cf._proc.kill()
+            cf._proc.wait()
+            assert cf.header('HEAD^{tree}').type == 'tree'
+
+    def test_pool(self, git_repo):
+        with CatFilePool(git_repo, size=2) as pool:
+            assert pool.header('HEAD:src').type == 'tree'
+            assert pool.read('HEAD:src/main.py')[1] == b'print("hi")\n'
+
+    def test_names(self, git_repo):
+        with CatFile(git_repo) as cf:
+            assert cf.read('HEAD:a b missing') is None
+            assert cf.header('HEAD:no such file') is None
+            with pytest.raises(ValueError):
+                cf.read('HEAD\nHEAD')
+            assert cf.read('HEAD:README')[1] == b'Hello, world\n'
+
+    def test_error_mid_read(self, git_repo, monkeypatch):
+        with CatFile(git_repo) as cf:
+            def fail(header):
+                raise RuntimeError('interrupted')
+            monkeypatch.setattr(cf, '_read_body', fail)
+            with pytest.raises(RuntimeError):
+                cf.read('HEAD:README')
+            monkeypatch.undo()
+            # The unread contents were not taken for the next response.
+            assert cf.read('HEAD')[0].type == 'commit'
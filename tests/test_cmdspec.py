@@ -0,0 +1,109 @@
+import pytest
+
+from gitgo.lowlevel.cmdargs import CmdResult, flags, arg1s, arg2s, exclusive, enum_or_true
+from gitgo.lowlevel.cmdspec import CmdSpec, Param, Flag, Value, Separate, EnumOrTrue, OneOf
+import gitgo.lowlevel.lowlevel as lowlevel
+
+class TestCmdSpec:
+    def test_matches_cmdargs(self):
+        spec = CmdSpec(Flag('quiet'),
+                       Flag('dry_run'),
+                       Flag('delete', '-d'),
+                       Value('branch', 'initial-branch'),
+                       Value('find_renames'),
+                       Separate('template'),
+                       EnumOrTrue('abbrev_ref', ['strict', 'loose']))
+        for kwargs in (
+            {},
+            dict(quiet=True, delete=True, find_renames=50),
+            dict(dry_run=1, branch='main', template='/t', abbrev_ref=True),
+            dict(quiet=False, branch='', find_renames=0, abbrev_ref='loose'),
+        ):
+            k = {**dict.fromkeys(('quiet', 'dry_run', 'delete', 'branch',
+                                  'find_renames', 'template', 'abbrev_ref')),
+                 **kwargs}
+            expected = [
+                *flags(quiet=k['quiet'], dry_run=k['dry_run'], delete=k['delete'],
+                       _map={'delete': '-d'}),
+                *arg1s(branch=k['branch'], find_renames=k['find_renames'],
+                       _map={'branch': 'initial-branch'}),
+                *arg2s(template=k['template']),
+                *enum_or_true('abbrev-ref', k['abbrev_ref'], _keywords=['strict', 'loose']),
+            ]
+            assert spec(**kwargs) == expected
+
+    def test_one_of(self):
+        spec = CmdSpec(OneOf(Flag('create', '-b'), Flag('reset', '-B')))
+        assert spec(reset=True) == [*exclusive(reset=True, _map={'reset': '-B'})]
+        assert spec() == []
+        with pytest.raises(ValueError):
+            spec(create=True, reset=True)
+        with pytest.raises(ValueError):
+            CmdSpec(OneOf(Flag('a'), Flag('b'), required=True))()
+
+    def test_enum_or_true_rejects(self):
+        with pytest.raises(ValueError):
+            CmdSpec(EnumOrTrue('abbrev_ref', ['strict', 'loose']))(abbrev_ref='bad')
+
+    def test_duplicate(self):
+        with pytest.raises(ValueError):
+            CmdSpec(Flag('merge'), OneOf(Flag('merge', '-m')))
+
+    def test_param_abstract(self):
+        with pytest.raises(TypeError):
+            Param('merge')
+
+class TestWrapperArgv:
+    '''
+    The argv the git_* wrappers produce, pinned so changes to how they are
+    built cannot change what is run.
+    '''
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        calls = []
+        def fake_git(*args, **kwargs):
+            calls.append([str(a) for a in args])
+            return CmdResult('', '', 0)
+        monkeypatch.setattr(lowlevel, 'git', fake_git)
+        return calls
+
+    @pytest.mark.parametrize('call, argv', [
+        (lambda: lowlevel.git_config('user.name', 'Bob', is_global=True),
+         ['config', '--global', 'user.name', 'Bob']),
+        (lambda: lowlevel.git_config('a.b', file='/tmp/x', get_all=True, null=True, type='bool'),
+         ['config', '--file=/tmp/x', '--get-all', '--null', '--type=bool', 'a.b']),
+        (lambda: lowlevel.git_init('d', quiet=True, branch='main', shared=0o664, object_format='sha256'),
+         ['init', '--quiet', '--initial-branch=main', '--object-format', 'sha256', '--shared', '0664', 'd']),
+        (lambda: lowlevel.git_checkout('main', reset=True, track='direct', quiet=True),
+         ['checkout', '--quiet', '--track=direct', '-B', 'main']),
+        (lambda: lowlevel.git_branch('b', delete=True, set_upstream_to='o/m'),
+         ['branch', '-d', '--no-color', '--set-upstream-to=o/m', 'b']),
+        (lambda: lowlevel.git_switch('b', create=True, track='inherit'),
+         ['switch', 'b', '--create', '--track', '--track=inherit']),
+        (lambda: lowlevel.git_pull(ff_only=True, rebase='merges'),
+         ['pull', '--commit', '--ff-only', '--rebase=merges', 'origin', 'main']),
+        (lambda: lowlevel.git_push(force=True),
+         ['push', '--force', 'origin']),
+        (lambda: lowlevel.git_fetch('o', 'm', dry_run=True),
+         ['fetch', '--dry-run', 'o', 'm']),
+        (lambda: lowlevel.git_rev_parse('HEAD', verify=True, abbrev_ref='strict'),
+         ['rev-parse', '--verify', '--abbrev-ref=strict', '--show-object-format=storage', 'HEAD']),
+        (lambda: lowlevel.git_merge('x', ff='only', message='m'),
+         ['merge', '--ff-only', '--message=m', 'x']),
+        (lambda: lowlevel.git_tag('v1', annotate=True, message='m'),
+         ['tag', '--annotate', '--message=m', 'v1']),
+        (lambda: lowlevel.git_status('p', porcelain='v2', branch=True, find_renames=50),
+         ['status', '--branch', '--porcelain=v2', '--find-renames=50', 'p']),
+        (lambda: lowlevel.git_multi_pack_index(object_dir='o', bitmap=True, preferred_pack='p.pack'),
+         ['multi-pack-index', '--object-dir=o', 'write', '--bitmap', '--preferred-pack=p.pack']),
+    ])
+    def test_argv(self, calls, call, argv):
+        call()
+        assert calls == [argv]
+
+    def test_exclusive(self, calls):
+        with pytest.raises(ValueError):
+            lowlevel.git_config('x', get=True, get_all=True)
+        with pytest.raises(ValueError):
+            lowlevel.git_checkout('main', create=True, merge=True)
+        assert calls == []
@@ -0,0 +1,102 @@
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+
+from gitgo.backend.native import NativeObjectStoreBackend, CommitGraph
+from gitgo.object.gitobj import GitCommit
+from tests.conftest import git
+
+def _commit(repo, message):
+    git(repo, 'commit', '-q', '--allow-empty', '-m', message)
+    return git(repo, 'rev-parse', 'HEAD')
+
+@pytest.fixture
+def history(git_repo):
+    '''
+    main: initial - m1 - m2 - merge(a, b, c) - m3
+    with branches a, b and c forked from m1.
+    '''
+    _commit(git_repo, 'm1')
+    for branch in 'abc':
+        git(git_repo, 'checkout', '-q', '-b', branch, 'main')
+        _commit(git_repo, f'{branch}1')
+        _commit(git_repo, f'{branch}2')
+    git(git_repo, 'checkout', '-q', 'main')
+    _commit(git_repo, 'm2')
+    git(git_repo, 'merge', '-q', '--no-edit', 'a', 'b', 'c')
+    _commit(git_repo, 'm3')
+    git(git_repo, 'checkout', '-q', '-b', 'd', 'a~1')
+    _commit(git_repo, 'd1')
+    return git_repo
+
+def _check(repo, graph):
+    for line in git(repo, 'rev-list', '--all', '--parents').splitlines():
+        oid, *parents = line.split()
+        commit = graph[oid]
+        assert commit.parents == tuple(parents)
+        assert commit.tree == git(repo, 'rev-parse', f'{oid}^{{tree}}')
+        assert commit.time == int(git(repo, 'log', '-1', '--format=%ct', oid))
+        for p in parents:
+            assert graph[p].generation < commit.generation
+    refs = {r: git(repo, 'rev-parse', r) for r in ('main', 'a', 'b', 'c', 'd', 'main~1', 'a~1')}
+    for x, xo in refs.items():
+        for y, yo in refs.items():
+            expected = git(repo, 'merge-base', '--all', x, y).split()
+            assert sorted(graph.merge_bases(xo, yo)) == sorted(expected), (x, y)
+            counts = git(repo, 'rev-list', '--left-right', '--count', f'{x}...{y}').split()
+            assert graph.ahead_behind(xo, yo) == tuple(int(c) for c in counts), (x, y)
+            assert graph.is_ancestor(xo, yo) == (expected == [xo])
+
+class TestCommitGraph:
+    def test_single(self, history):
+        git(history, 'commit-graph', 'write', '--reachable')
+        graph = CommitGraph.open(history / '.git' / 'objects')
+        assert len(graph.layers) == 1
+        assert len(graph) == 12
+        _check(history, graph)
+
+    def test_split(self, history):
+        git(history, 'commit-graph', 'write', '--reachable', '--split')
+        git(history, 'checkout', '-q', 'main')
+        _commit(history, 'm4')
+        git(history, 'commit-graph', 'write', '--reachable', '--split=no-merge')
+        graph = CommitGraph.open(history / '.git' / 'objects')
+        assert len(graph.layers) == 2
+        _check(history, graph)
+
+    def test_git_commit(self, history):
+        backend = NativeObjectStoreBackend(history)
+        store = SimpleNamespace(backend=backend)
+        head = GitCommit(store, git(history, 'rev-parse', 'main~1'))
+        expected = git(history, 'rev-parse', 'main~1^1', 'main~1^2', 'main~1^3', 'main~1^4').split()
+        assert backend.commit_graph is None
+        assert [p.oid for p in head.parents] == expected
+        git(history, 'commit-graph', 'write', '--reachable')
+        assert [p.oid for p in head.parents] == expected
+        assert backend.commit_graph is not None
+        assert head.tree.oid == git(history, 'rev-parse', 'main~1^{tree}')
+
+    def test_wide(self, git_repo):
+        # 200 branches from the initial commit, merged by one octopus, and
+        # a side branch off one of them.
+        lines = []
+        for i in range(200):
+            lines += [f'commit refs/heads/w{i}', f'mark :{i + 1}',
+                      'committer A <a@example.com> 0 +0000', 'data 3', f'{i:03}',
+                      'from refs/heads/main^0', '']
+        lines += ['commit refs/heads/wide', 'committer A <a@example.com> 0 +0000',
+                  'data 4', 'wide', 'from :1', *(f'merge :{i + 1}' for i in range(1, 200)), '']
+        lines += ['commit refs/heads/side', 'committer A <a@example.com> 0 +0000',
+                  'data 4', 'side', 'from :100', '']
+        subprocess.run(['git', 'fast-import', '--quiet'], cwd=git_repo, check=True,
+                       input='\n'.join(lines).encode())
+        git(git_repo, 'commit-graph', 'write', '--reachable')
+        graph = CommitGraph.open(git_repo / '.git' / 'objects')
+        refs = {r: git(git_repo, 'rev-parse', r) for r in ('main', 'wide', 'side', 'w7')}
+        for x, xo in refs.items():
+            for y, yo in refs.items():
+                expected = git(git_repo, 'merge-base', '--all', x, y).split()
+                assert sorted(graph.merge_bases(xo, yo)) == sorted(expected), (x, y)
+                counts = git(git_repo, 'rev-list', '--left-right', '--count', f'{x}...{y}').split()
+                assert graph.ahead_behind(xo, yo) == tuple(int(c) for c in counts), (x, y)
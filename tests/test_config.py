@@ -0,0 +1,69 @@
+import pytest
+
+from gitgo.lowlevel import git_config, run_options, ConfigSnapshot, enable_config_snapshots, \
+    disable_config_snapshots, enable_metrics, disable_metrics, metrics
+
+from tests.conftest import git
+
+@pytest.fixture
+def configured(git_repo):
+    git(git_repo, 'config', 'core.bigFileThreshold', '2m')
+    git(git_repo, 'config', 'gitgo.flag', 'yes')
+    git(git_repo, 'config', '--add', 'remote.origin.fetch', '+refs/heads/*:refs/remotes/origin/*')
+    git(git_repo, 'config', '--add', 'remote.origin.fetch', '+refs/tags/*:refs/tags/*')
+    git(git_repo, 'config', 'http.sslVerify', 'true')
+    git(git_repo, 'config', 'http.https://example.com.sslVerify', 'false')
+    git(git_repo, 'config', 'http.https://*.example.com/repos.sslVerify', '0')
+    git(git_repo, 'config', 'Section.SubSection.Key', '~/somewhere')
+    return git_repo
+
+class TestConfigSnapshot:
+    def test_get(self, configured):
+        snapshot = ConfigSnapshot(configured)
+        assert snapshot.get('core.bigfilethreshold', type='int') == 2 * 1024 * 1024
+        assert snapshot.get('GITGO.FLAG', type='bool') is True
+        assert snapshot.get('section.SubSection.key', type='path').is_absolute()
+        assert snapshot.get('section.subsection.key') is None
+        assert snapshot.get_all('remote.origin.fetch')[1] == '+refs/tags/*:refs/tags/*'
+        assert [k for k, _ in snapshot.get_regexp(r'^remote\.')] == ['remote.origin.fetch'] * 2
+
+    def test_urlmatch(self, configured):
+        snapshot = ConfigSnapshot(configured)
+        assert snapshot.get_urlmatch('http.sslverify', 'https://example.com/x', type='bool') is False
+        assert snapshot.get_urlmatch('http.sslverify', 'https://other.org/', type='bool') is True
+        assert snapshot.get_urlmatch('http.sslverify', 'https://a.example.com/repos/r') == '0'
+
+    def test_urlmatch_section(self, configured):
+        git(configured, 'config', 'http.postBuffer', '1000')
+        with run_options(cwd=configured):
+            expected = git_config('http', 'https://example.com/x', get_urlmatch=True)
+            assert expected.stdout == 'http.postbuffer 1000\nhttp.sslverify false\n'
+            enable_config_snapshots()
+            try:
+                assert git_config('http', 'https://example.com/x', get_urlmatch=True) == expected
+            finally:
+                disable_config_snapshots()
+
+    def test_stale(self, configured):
+        snapshot = ConfigSnapshot(configured)
+        assert not snapshot.is_stale()
+        git(configured, 'config', 'gitgo.flag', 'no')
+        assert snapshot.refresh().get('gitgo.flag', type='bool') is False
+
+    def test_git_config(self, configured):
+        enable_config_snapshots()
+        enable_metrics()
+        metrics.reset()
+        try:
+            with run_options(cwd=configured):
+                assert git_config('gitgo.flag', get=True, type='bool') == ('true\n', '', True)
+                assert git_config('no.such', get=True) == ('', '', False)
+                assert git_config('no.such', get=True, default=3, type='int') == ('3\n', '', True)
+                assert git_config('remote.origin.fetch', get_all=True).stdout.count('\n') == 2
+            assert metrics.snapshot()['git config']['count'] == 1
+        finally:
+            disable_config_snapshots()
+            disable_metrics()
+            metrics.reset()
+        with run_options(cwd=configured):
+            assert git_config('gitgo.flag', get=True, type='bool') == ('true\n', '', True)
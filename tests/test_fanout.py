@@ -0,0 +1,82 @@
+from subprocess import TimeoutExpired
+import time
+
+from gitgo.lowlevel import fan_out, git_fetch, git_status
+from gitgo.lowlevel.cmdargs import CmdResult
+from gitgo.lowlevel.fanout import url_host
+from gitgo.lowlevel.runner import current_options
+
+from tests.conftest import git
+
+class TestFanout:
+    def test_fetch(self, git_repo, tmp_path):
+        clones = []
+        for i in range(3):
+            clone = tmp_path / f'clone{i}'
+            git(tmp_path, 'clone', '-q', str(git_repo), str(clone))
+            clones.append(clone)
+        git(git_repo, 'commit', '-q', '--allow-empty', '-m', 'Second')
+        head = git(git_repo, 'rev-parse', 'HEAD')
+        results = list(fan_out(clones, git_fetch, remote='origin', branch='main',
+                               max_workers=2, per_host=1))
+        assert sorted(r.repo for r in results) == clones
+        assert all(r.ok for r in results)
+        assert all(git(c, 'rev-parse', 'origin/main') == head for c in clones)
+
+    def test_errors(self, git_repo, tmp_path):
+        not_repo = tmp_path / 'empty'
+        not_repo.mkdir()
+        results = {r.repo: r for r in fan_out([git_repo, not_repo], git_status,
+                                              retries=1, retry_delay=0)}
+        assert results[git_repo].ok
+        assert 'working tree clean' in results[git_repo].result.stdout
+        assert isinstance(results[not_repo].error, ValueError)
+        assert results[not_repo].attempts == 2
+
+    def test_other_errors(self, git_repo, tmp_path):
+        def operation():
+            if current_options()['cwd'] == git_repo:
+                raise KeyError('broken')
+            return git_status()
+        other = tmp_path / 'other'
+        git(tmp_path, 'clone', '-q', str(git_repo), str(other))
+        results = {r.repo: r for r in fan_out([git_repo, other], operation,
+                                              retries=2, retry_delay=0)}
+        assert results[other].ok
+        assert isinstance(results[git_repo].error, KeyError)
+        assert results[git_repo].attempts == 1
+
+    def test_zero_timeout(self, git_repo):
+        [result] = fan_out([git_repo], git_status, timeout=0)
+        assert isinstance(result.error, TimeoutExpired)
+
+    def test_hosts(self, tmp_path):
+        repos = [tmp_path / name for name in ('slow1', 'slow2', 'slow3', 'fast')]
+        def operation():
+            if current_options()['cwd'].name.startswith('slow'):
+                time.sleep(0.3)
+            return CmdResult('', '', True)
+        def host(repo):
+            return repo.name.rstrip('123')
+        results = fan_out(repos, operation, max_workers=2, per_host=1, host=host)
+        # The slow host's queue does not tie up the second worker.
+        assert [r.repo.name for r in results] == ['fast', 'slow1', 'slow2', 'slow3']
+
+    def test_retry_delay(self, tmp_path):
+        repos = [tmp_path / 'flaky', tmp_path / 'other']
+        def operation():
+            if current_options()['cwd'].name == 'flaky':
+                raise OSError('unavailable')
+            time.sleep(0.1)
+            return CmdResult('', '', True)
+        results = fan_out(repos, operation, max_workers=1, retries=1, retry_delay=1)
+        # While flaky waits to be retried, other has the only worker.
+        start = time.monotonic()
+        first = next(results)
+        assert first.repo.name == 'other' and time.monotonic() - start < 0.5
+        assert next(results).attempts == 2
+
+    def test_url_host(self):
+        assert url_host('https://github.com/BobKerns/gitgo.git') == 'github.com'
+        assert url_host('git@github.com:BobKerns/gitgo.git') == 'github.com'
+        assert url_host('/some/local/path') is None
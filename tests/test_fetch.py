@@ -0,0 +1,61 @@
+import threading
+import time
+
+from gitgo.lowlevel import FetchCoordinator, FetchStats
+from gitgo.lowlevel.cmdargs import CmdResult
+from tests.conftest import git
+
+class TestFetchCoordinator:
+    def test_coalesce(self, git_repo):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+        def fetch(remote, *refspecs, **options):
+            calls.append(refspecs)
+            started.set()
+            release.wait()
+            return CmdResult('', '', 0)
+        coordinator = FetchCoordinator(fetch=fetch)
+        results = []
+        def request(*refspecs):
+            results.append(coordinator.fetch('origin', *refspecs, repo=git_repo))
+        first = threading.Thread(target=request, args=('refs/heads/a',))
+        first.start()
+        started.wait()
+        others = [threading.Thread(target=request, args=refspecs)
+                  for refspecs in (('refs/heads/a',), ('refs/heads/b',), ('refs/heads/c',))]
+        for t in others:
+            t.start()
+        while coordinator.stats.requests < 4:
+            time.sleep(0.01)
+        release.set()
+        for t in (first, *others):
+            t.join()
+        assert calls[0] == ('refs/heads/a',)
+        assert sorted(calls[1]) == ['refs/heads/b', 'refs/heads/c']
+        assert len(calls) == 2
+        assert len(results) == 4
+        assert coordinator.stats == FetchStats(requests=4, fetches=2, coalesced=2, fresh=0)
+
+    def test_fresh(self, git_repo, tmp_path):
+        clone = tmp_path / 'clone'
+        git(tmp_path, 'clone', '-q', str(git_repo), str(clone))
+        git(git_repo, 'commit', '-q', '--allow-empty', '-m', 'Second')
+        coordinator = FetchCoordinator(fresh_for=60)
+        first = coordinator.fetch('origin', repo=clone)
+        assert git(clone, 'rev-parse', 'origin/main') == git(git_repo, 'rev-parse', 'HEAD')
+        assert coordinator.fetch('origin', repo=clone) is first
+        coordinator.fetch('origin', repo=clone, fresh_for=0)
+        assert coordinator.stats == FetchStats(requests=3, fetches=2, coalesced=0, fresh=1)
+
+    def test_error(self, git_repo):
+        def fetch(remote, *refspecs, **options):
+            raise ValueError('no such remote')
+        coordinator = FetchCoordinator(fetch=fetch, fresh_for=60)
+        for _ in range(2):
+            try:
+                coordinator.fetch('nowhere', repo=git_repo)
+                assert False
+            except ValueError:
+                pass
+        assert coordinator.stats.fetches == 2
@@ -0,0 +1,56 @@
+import os
+import subprocess
+
+import pytest
+
+from gitgo.backend.script import Script, ScriptWorktreeBackend
+from gitgo.object import hash_object
+from gitgo.worktree import hash_file, hash_paths
+from gitgo.worktree import hashing
+from tests.conftest import git
+
+def _git_hash(repo, name, *args):
+    return subprocess.run(['git', 'hash-object', *args, '--', name], cwd=repo,
+                          capture_output=True, text=True, check=True).stdout.strip()
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / 'empty').write_bytes(b'')
+    (tmp_path / 'small').write_bytes(b'hello\n')
+    # Past SMALL_FILE, and more than one SLICE: mapped and hashed in slices.
+    (tmp_path / 'large').write_bytes(bytes(range(256)) * (40 << 12) + b'tail')
+    os.symlink('small', tmp_path / 'link')
+    return tmp_path
+
+class TestHashing:
+    def test_hash_file(self, files, monkeypatch):
+        monkeypatch.setattr(hashing, 'SLICE', 1 << 20)
+        for name in ('empty', 'small', 'large'):
+            found = hash_file(files / name)
+            assert found.oid == _git_hash(files, name)
+            assert found.size == (files / name).stat().st_size
+        # A symlink is the path it points to.
+        assert hash_file(files / 'link').oid == hash_object('blob', b'small')
+        with pytest.raises(ValueError):
+            hash_file(files)
+
+    def test_sha256(self, tmp_path):
+        git(tmp_path, 'init', '-q', '--object-format=sha256')
+        (tmp_path / 'f').write_text('sha256\n')
+        assert hash_file(tmp_path / 'f', algorithm='sha256').oid == _git_hash(tmp_path, 'f')
+
+    @pytest.mark.parametrize('processes', [False, True])
+    def test_hash_paths(self, files, processes):
+        names = ['empty', 'small', 'large', 'link'] * 3
+        found = list(hash_paths([files / n for n in names], processes=processes, workers=2))
+        assert sorted(str(f.path) for f in found) == sorted(str(files / n) for n in names)
+        assert {f.path.name: f.oid for f in found} == {n: hash_file(files / n).oid for n in names}
+        assert len({f.oid for f in found}) == 4
+        with pytest.raises(FileNotFoundError):
+            list(hash_paths([files / 'small', files / 'missing'], processes=processes))
+
+    def test_stat(self, git_repo):
+        worktree = ScriptWorktreeBackend(Script(git_repo), git_repo)
+        entry = worktree.stat('README')
+        assert entry.oid == git(git_repo, 'rev-parse', ':README')
+        assert (entry.type, entry.mode) == ('blob', 0o644)
@@ -0,0 +1,188 @@
+from dataclasses import replace
+import os
+
+import pytest
+
+from gitgo.index import GitPhysIndex, read_index, write_index
+from tests.conftest import git
+
+def _ls_stage(repo):
+    return [
+        (int(stage), oid, int(mode, 8), name)
+        for line in git(repo, 'ls-files', '--stage').splitlines()
+        for mode, oid, stage, name in [line.replace('\t', ' ').split(' ', 3)]
+    ]
+
+def _populate(repo):
+    (repo / 'docs').mkdir()
+    for i in range(20):
+        (repo / 'docs' / f'page{i}.md').write_text(f'Page {i}\n')
+    (repo / 'src' / 'deeply' / 'nested').mkdir(parents=True)
+    (repo / 'src' / 'deeply' / 'nested' / 'a-rather-long-file-name.py').write_text('x = 1\n')
+    (repo / 'run.sh').write_text('#!/bin/sh\n')
+    os.chmod(repo / 'run.sh', 0o755)
+    os.symlink('README', repo / 'link')
+    git(repo, 'add', '.')
+
+class TestReadIndex:
+    @pytest.mark.parametrize('version', [2, 3, 4])
+    def test_entries(self, git_repo, version):
+        _populate(git_repo)
+        if version == 3:
+            # git writes version 2 unless some entry needs extended flags.
+            (git_repo / 'later').write_text('later\n')
+            git(git_repo, 'add', '-N', 'later')
+        git(git_repo, 'update-index', f'--index-version={version}')
+        file = read_index(git_repo / '.git' / 'index', verify=True)
+        assert file.version == version
+        expected = _ls_stage(git_repo)
+        assert [(s, e.oid, e.name) for s, e in file.entries] == [(s, o, n) for s, o, _, n in expected]
+        by_name = {e.name: e for _, e in file.entries}
+        assert by_name['run.sh'].mode == 0o755
+        assert by_name['link'].type == 'symlink'
+        st = os.lstat(git_repo / 'README')
+        assert by_name['README'].size == st.st_size
+        assert by_name['README'].ino == st.st_ino
+        assert by_name['README'].mtime == pytest.approx(st.st_mtime, abs=1e-6)
+
+    def test_extended_flags(self, git_repo):
+        (git_repo / 'new').write_text('new\n')
+        git(git_repo, 'add', '-N', 'new')
+        git(git_repo, 'update-index', '--skip-worktree', 'README')
+        file = read_index(git_repo / '.git' / 'index')
+        assert file.version == 3
+        flags = {e.name: e.flags for _, e in file.entries}
+        assert flags == {'README': {'skip-worktree'}, 'new': {'intent-to-add'}, 'src/main.py': set()}
+
+    def test_cache_tree(self, git_repo):
+        _populate(git_repo)
+        top = git(git_repo, 'write-tree')
+        tree = read_index(git_repo / '.git' / 'index').cache_tree
+        by_path = {t.path: t for t in tree}
+        assert by_path[''].oid == top
+        assert by_path[''].entry_count == len(_ls_stage(git_repo))
+        assert by_path['src/deeply/nested'].oid == git(git_repo, 'rev-parse', f'{top}:src/deeply/nested')
+        assert tree[0].path == ''
+        assert sorted(t.path for t in tree) == ['', 'docs', 'src', 'src/deeply', 'src/deeply/nested']
+        (git_repo / 'docs' / 'page1.md').write_text('Changed\n')
+        git(git_repo, 'add', 'docs')
+        tree = read_index(git_repo / '.git' / 'index').cache_tree
+        invalid = {t.path for t in tree if t.oid is None}
+        assert invalid == {'', 'docs'}
+
+    def test_conflicts_and_resolve_undo(self, git_repo):
+        git(git_repo, 'checkout', '-q', '-b', 'other')
+        (git_repo / 'README').write_text('Other\n')
+        git(git_repo, 'commit', '-q', '-am', 'other')
+        git(git_repo, 'checkout', '-q', 'main')
+        (git_repo / 'README').write_text('Main\n')
+        git(git_repo, 'commit', '-q', '-am', 'main')
+        with pytest.raises(Exception):
+            git(git_repo, 'merge', 'other')
+        file = read_index(git_repo / '.git' / 'index')
+        assert [(s, e.name) for s, e in file.entries if s] == [(1, 'README'), (2, 'README'), (3, 'README')]
+        git(git_repo, 'add', 'README')
+        reuc = read_index(git_repo / '.git' / 'index').resolve_undo
+        assert len(reuc) == 1
+        assert reuc[0].path == 'README'
+        assert reuc[0].modes == (0o100644,) * 3
+        assert reuc[0].oids[1] == git(git_repo, 'rev-parse', 'main:README')
+
+    def test_untracked_cache(self, git_repo):
+        (git_repo / 'junk.txt').write_text('junk\n')
+        (git_repo / 'src' / 'scratch.py').write_text('\n')
+        git(git_repo, 'config', 'core.untrackedCache', 'true')
+        git(git_repo, 'update-index', '--untracked-cache')
+        git(git_repo, 'status', '--porcelain')
+        untracked = read_index(git_repo / '.git' / 'index').untracked
+        assert untracked.exclude_per_dir == '.gitignore'
+        dirs = {d.path: d for d in untracked.dirs}
+        assert dirs[''].untracked == ['junk.txt']
+        assert dirs['src/'].untracked == ['scratch.py']
+        assert dirs[''].valid and dirs[''].stat is not None
+
+    def test_checksum(self, git_repo):
+        path = git_repo / '.git' / 'index'
+        data = bytearray(path.read_bytes())
+        data[20] ^= 0xff
+        path.write_bytes(bytes(data))
+        read_index(path)
+        with pytest.raises(ValueError):
+            read_index(path, verify=True)
+
+    def test_phys_index(self, git_repo):
+        index = GitPhysIndex(str(git_repo / '.git' / 'index'))
+        file = index.load()
+        assert index.ls_files() == {'README', 'src/main.py'}
+        assert len(file.entries) == 2
+
+    def test_phys_index_identical_files(self, git_repo):
+        (git_repo / 'copy').write_text('Hello, world\n')
+        git(git_repo, 'add', 'copy')
+        index = GitPhysIndex(str(git_repo / '.git' / 'index'))
+        index.load()
+        assert index.ls_files() == {'README', 'copy', 'src/main.py'}
+
+def _tree_listing(repo, tree):
+    return [
+        (0, oid, int(mode, 8), name)
+        for line in git(repo, 'ls-tree', '-r', tree).splitlines()
+        for mode, _, oid, name in [line.replace('\t', ' ').split(' ', 3)]
+    ]
+
+class TestWriteIndex:
+    @pytest.mark.parametrize('version', [2, 3, 4])
+    def test_round_trip(self, git_repo, version):
+        _populate(git_repo)
+        expected = _ls_stage(git_repo)
+        index = GitPhysIndex(str(git_repo / '.git' / 'index'))
+        index.load()
+        index.save(version=version)
+        assert read_index(git_repo / '.git' / 'index', verify=True).version == (2 if version == 3 else version)
+        assert _ls_stage(git_repo) == expected
+        assert git(git_repo, 'diff', '--stat') == ''
+
+    def test_cache_tree_kept(self, git_repo):
+        _populate(git_repo)
+        git(git_repo, 'write-tree')
+        index = GitPhysIndex(str(git_repo / '.git' / 'index'))
+        index.load()
+        (git_repo / 'docs' / 'page3.md').write_text('Changed\n')
+        changed = git(git_repo, 'hash-object', '-w', 'docs/page3.md')
+        entry = index._stages[0]['docs/page3.md']
+        index._stages[0]['docs/page3.md'] = replace(entry, oid=changed, size=8)
+        index.save()
+        tree = {t.path: t for t in read_index(git_repo / '.git' / 'index').cache_tree}
+        assert tree['src'].oid is not None and tree['src/deeply/nested'].oid is not None
+        assert tree['docs'].oid is None and tree[''].oid is None
+        assert _tree_listing(git_repo, git(git_repo, 'write-tree')) == _ls_stage(git_repo)
+        assert git(git_repo, 'diff', '--stat') == ''
+
+    def test_locked(self, git_repo):
+        path = git_repo / '.git' / 'index'
+        before = path.read_bytes()
+        (git_repo / '.git' / 'index.lock').write_bytes(b'')
+        with pytest.raises(ValueError, match='index.lock'):
+            write_index(path, read_index(path).entries)
+        assert path.read_bytes() == before
+
+    def test_split(self, git_repo):
+        _populate(git_repo)
+        path = git_repo / '.git' / 'index'
+        index = GitPhysIndex(str(path))
+        index.load()
+        first = index.save(split=True)
+        shared = git_repo / '.git' / f'sharedindex.{first.shared_index}'
+        assert shared.exists()
+        assert [(s, o, n) for s, o, _, n in _ls_stage(git_repo)] == [(s, e.oid, e.name) for s, e in first.entries]
+        (git_repo / 'added').write_text('added\n')
+        git(git_repo, 'add', 'added')
+        git(git_repo, 'rm', '-q', '--cached', 'run.sh')
+        expected = _ls_stage(git_repo)
+        index.load()
+        assert index.file.shared_index == first.shared_index
+        second = index.save(split=True)
+        assert second.shared_index == first.shared_index
+        assert read_index(path).entries == second.entries
+        assert _ls_stage(git_repo) == expected
+        assert path.stat().st_size < shared.stat().st_size
@@ -0,0 +1,107 @@
+import random
+
+from gitgo.index import GitIndex, IndexEntry, IndexTable, read_index
+from gitgo.index.table import entry_row, row_entry
+
+def _entry(name, oid='ab' * 20, **kwargs):
+    return IndexEntry(**{
+        'name': name, 'type': 'blob', 'oid': oid, 'mode': 0o644,
+        'ctime': 1700000000.5, 'mtime': 1700000001.25,
+        'dev': 1, 'ino': 2, 'uid': 3, 'gid': 4, 'flags': set(), 'size': 5,
+        **kwargs})
+
+class TestIndexTable:
+    def test_rows(self):
+        e = _entry('a/b', flags={'skip-worktree', 'assume-valid'}, mode=0o755)
+        assert row_entry(b'a/b', entry_row(e)) == e
+        table = IndexTable.from_entries([(0, _entry('b')), (2, _entry('a')), (1, _entry('a'))])
+        assert [(s, e.name) for s, e in table] == [(1, 'a'), (2, 'a'), (0, 'b')]
+        assert table.find(b'a', 2) == 1
+        assert table.find(b'a', 0) is None
+
+    def test_changes(self):
+        rng = random.Random(17)
+        names = [f'dir{i % 7}/file{i}' for i in range(300)]
+        model = {(n.encode(), 0): entry_row(_entry(n)) for n in names[:200]}
+        table = IndexTable.from_entries((0, _entry(n)) for n in names[:200])
+        for step in range(2000):
+            name = rng.choice(names).encode()
+            stage = rng.choice((0, 0, 0, 1, 2, 3))
+            if rng.random() < 0.4:
+                assert table.remove(name, stage) == ((name, stage) in model)
+                model.pop((name, stage), None)
+            else:
+                row = entry_row(_entry(name.decode(), oid=f'{step:040x}'))
+                table.put(name, stage, row)
+                model[name, stage] = row
+            assert len(table) == len(model)
+            if step % 97 == 0:
+                table.compact()
+            probe = rng.choice(names).encode()
+            assert table.get(probe, 0) == model.get((probe, 0))
+        table.compact()
+        assert [(table.key_at(i), table.row_at(i)) for i in range(table.rows)] == sorted(model.items())
+        assert table.changed
+
+    def test_git_index(self, git_repo):
+        index = GitIndex()
+        index._stages[0]['x'] = _entry('x')
+        index._stages[2]['y'] = _entry('y')
+        assert index.len() == 2
+        assert index.ls_files() == {'x'}
+        assert index.ls_files(unmerged=True) == {'x', 'y'}
+        assert sorted((s, e.name) for s, e in index) == [(0, 'x'), (2, 'y')]
+        table = read_index(git_repo / '.git' / 'index').entries
+        # Columns, not objects: the on-disk size plus a few bytes per entry.
+        assert table.nbytes() < 100 * len(table)
+
+class TestPathQueries:
+    def _index(self):
+        index = GitIndex()
+        for name in ('a', 'docs/x', 'docs/y', 'docs0', 'docs/sub/z', 'e'):
+            index[name] = _entry(name)
+        index[1, 'docs/c'] = _entry('docs/c', oid='01' * 20)
+        index[2, 'docs/c'] = _entry('docs/c', oid='02' * 20)
+        index[3, 'e'] = _entry('e', oid='03' * 20)
+        return index
+
+    def test_lookup(self):
+        index = self._index()
+        assert index['docs/x'].name == 'docs/x'
+        assert index['docs'] is None
+        assert 'docs/c' in index and 'docs' not in index
+        assert [e and e.oid for e in index[..., 'docs/c']] == [None, '01' * 20, '02' * 20, None]
+        del index['docs/c']
+        assert 'docs/c' not in index
+
+    def test_under(self):
+        index = self._index()
+        assert [(s, e.name) for s, e in index.under('docs')] == [
+            (1, 'docs/c'), (2, 'docs/c'), (0, 'docs/sub/z'), (0, 'docs/x'), (0, 'docs/y')]
+        assert list(index.paths('docs/')) == ['docs/sub/z', 'docs/x', 'docs/y']
+        assert list(index.paths('nope')) == []
+        assert len(list(index.under())) == index.len()
+
+    def test_prefix(self):
+        index = self._index()
+        assert list(index.paths('do')) == []
+        assert list(index.paths('do', prefix=True)) == ['docs/sub/z', 'docs/x', 'docs/y', 'docs0']
+        assert [e.name for _, e in index.under('docs', prefix=True)] == [
+            'docs/c', 'docs/c', 'docs/sub/z', 'docs/x', 'docs/y', 'docs0']
+
+    def test_conflicts(self):
+        index = self._index()
+        conflicts = dict(index.conflicts())
+        assert list(conflicts) == ['docs/c', 'e']
+        assert [e and e.oid for e in conflicts['e']] == [None, None, None, '03' * 20]
+        files = index.ls_files()
+        assert 'e' not in files and 'docs/c' not in files
+        assert index.ls_files() is files
+        index[0, 'docs/c'] = _entry('docs/c')
+        assert [p for p, _ in index.conflicts()] == ['e']
+        assert 'docs/c' in index.ls_files()
+
+    def test_prefix_range(self):
+        table = IndexTable.from_entries((0, _entry(n)) for n in ('a\xff', 'a\xffb', 'b'))
+        paths = [table.path_at(i) for i in range(*table.prefix_range('a\xff'.encode()))]
+        assert paths == ['a\xff'.encode(), 'a\xffb'.encode()]
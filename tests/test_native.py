@@ -0,0 +1,126 @@
+import pytest
+
+from gitgo.backend.native import NativeObjectStoreBackend, object_format
+from tests.conftest import git
+
+class TestLooseObjects:
+    def test_read(self, git_repo):
+        backend = NativeObjectStoreBackend(git_repo)
+        oid = git(git_repo, 'rev-parse', 'HEAD:README')
+        assert backend.read_header(oid) == ('blob', 13)
+        assert backend.read(oid) == ('blob', b'Hello, world\n')
+        assert backend.read_header(git(git_repo, 'rev-parse', 'HEAD'))[0] == 'commit'
+        assert backend.read('0' * 40) is None
+
+    def test_write(self, git_repo):
+        backend = NativeObjectStoreBackend(git_repo)
+        data = b'new contents\n' * 1000
+        oid = backend.write('blob', data)
+        assert oid == git(git_repo, 'hash-object', '--stdin', input=data.decode())
+        assert git(git_repo, 'cat-file', '-s', oid) == str(len(data))
+        assert backend.write('blob', data) == oid
+        assert oid in backend.loose
+        assert backend.read_header(oid) == ('blob', len(data))
+
+    @pytest.mark.parametrize('algorithm', ['sha1', 'sha256'])
+    def test_object_format(self, tmp_path, algorithm):
+        repo = tmp_path / algorithm
+        repo.mkdir()
+        git(repo, 'init', '-q', f'--object-format={algorithm}')
+        assert object_format(repo / '.git') == algorithm
+        backend = NativeObjectStoreBackend(repo)
+        oid = backend.write('blob', b'hello\n')
+        assert oid == git(repo, 'hash-object', '--stdin', input='hello\n')
+        assert git(repo, 'cat-file', '-p', oid) == 'hello'
+
+    def test_alternates(self, git_repo, tmp_path):
+        clone = tmp_path / 'shared'
+        git(tmp_path, 'clone', '-q', '--shared', str(git_repo), str(clone))
+        backend = NativeObjectStoreBackend(clone)
+        assert backend.read(git(git_repo, 'rev-parse', 'HEAD:README'))[1] == b'Hello, world\n'
+
+def _make_history(repo, n=30):
+    for i in range(n):
+        lines = [f'line {j}\n' for j in range(200)]
+        lines[i * 5] = f'changed in {i}\n'
+        (repo / 'README').write_text(''.join(lines))
+        git(repo, 'commit', '-q', '-am', f'Commit {i}')
+
+def _all_objects(repo):
+    listing = git(repo, 'cat-file', '--batch-all-objects', '--batch-check')
+    return [line.split() for line in listing.splitlines()]
+
+class TestPacks:
+    @pytest.mark.parametrize('ofs_delta', [True, False])
+    def test_read(self, git_repo, ofs_delta):
+        _make_history(git_repo)
+        git(git_repo, '-c', f'repack.useDeltaBaseOffset={str(ofs_delta).lower()}',
+            'repack', '-adfq', '--depth=50', '--window=50')
+        git(git_repo, 'prune-packed')
+        backend = NativeObjectStoreBackend(git_repo, cache_bytes=1 << 20)
+        objects = _all_objects(git_repo)
+        assert len(backend.stores[0].packs) == 1
+        for oid, type, size in objects:
+            assert backend.read_header(oid) == (type, int(size))
+            _, data = backend.read(oid)
+            assert len(data) == int(size)
+            assert backend.write(type, data) == oid
+        readme = git(git_repo, 'rev-parse', 'HEAD~10:README')
+        assert backend.read(readme)[1].decode() == git(git_repo, 'show', 'HEAD~10:README') + '\n'
+        assert backend.cache.size <= 1 << 20
+        assert len(backend.cache) > 0
+        backend.close()
+
+    def test_new_pack(self, git_repo):
+        backend = NativeObjectStoreBackend(git_repo)
+        git(git_repo, 'repack', '-adq')
+        git(git_repo, 'prune-packed')
+        assert backend.read(git(git_repo, 'rev-parse', 'HEAD:README'))[1] == b'Hello, world\n'
+        assert len(backend.stores[0].packs) == 1
+
+    def test_removed_pack(self, git_repo):
+        git(git_repo, 'repack', '-adq')
+        backend = NativeObjectStoreBackend(git_repo)
+        readme = git(git_repo, 'rev-parse', 'HEAD:README')
+        # As held by a reader in another thread while the packs change.
+        pack, offset = backend.stores[0].locate(readme)
+        git(git_repo, 'commit', '-q', '--allow-empty', '-m', 'Second')
+        git(git_repo, 'repack', '-adfq')
+        assert backend.stores[0].rescan()
+        assert pack not in backend.stores[0].packs
+        assert pack.read_at(offset) == ('blob', b'Hello, world\n')
+
+class TestMultiPackIndex:
+    def test_read(self, git_repo):
+        for i in range(4):
+            _make_history(git_repo, 3)
+            git(git_repo, 'repack', '-dq')
+        backend = NativeObjectStoreBackend(git_repo)
+        backend.write_midx()
+        packed = backend.stores[0]
+        assert packed.midx is not None
+        assert len(packed.midx.pack_names) == len(packed.packs) >= 4
+        for oid, type, size in _all_objects(git_repo):
+            assert backend.read_header(oid) == (type, int(size))
+        # Lookups went through the MIDX, not the packs' own indexes.
+        assert not any('index' in vars(pack) for pack in packed.packs)
+        backend.close()
+
+    def test_uncovered_and_rewrite(self, git_repo):
+        git(git_repo, 'repack', '-dq')
+        backend = NativeObjectStoreBackend(git_repo)
+        backend.write_midx()
+        checksum = backend.stores[0].midx.checksum
+        _make_history(git_repo, 2)
+        git(git_repo, 'repack', '-dq')
+        git(git_repo, 'prune-packed')
+        head = git(git_repo, 'rev-parse', 'HEAD')
+        assert backend.read_header(head) == ('commit', int(git(git_repo, 'cat-file', '-s', head)))
+        packed = backend.stores[0]
+        assert len(packed.midx.pack_names) == 1 and len(packed.packs) == 2
+        git(git_repo, 'multi-pack-index', 'write')
+        packed.rescan()
+        assert packed.midx.checksum != checksum
+        assert len(packed.midx.pack_names) == 2
+        assert backend.read_header(head)[0] == 'commit'
+        backend.close()
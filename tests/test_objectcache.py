@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from gitgo.backend.native import NativeObjectStoreBackend
+from gitgo.objectstore import ObjectCache, ObjectStore, Budget
+from tests.conftest import git
+
+def _oid(i):
+    return f'{i:040x}'
+
+class TestObjectCache:
+    def test_entries(self):
+        cache = ObjectCache({'commit': Budget(3, 1000)})
+        for i in range(3):
+            cache.put(_oid(i), 'commit', b'c')
+        assert cache.get(_oid(0)) == ('commit', b'c')
+        cache.put(_oid(3), 'commit', b'c')
+        # 1 was least recently used.
+        assert _oid(1) not in cache and _oid(0) in cache
+        stats = cache.stats('commit')
+        assert (stats.hits, stats.evictions, stats.entries, stats.bytes) == (1, 1, 3, 3)
+        assert cache.get(_oid(1)) is None
+        assert cache.stats().misses == 1
+
+    def test_bytes(self):
+        cache = ObjectCache({'blob': Budget(100, 10), 'tree': Budget(100, 10)})
+        cache.put(_oid(1), 'blob', b'x' * 6)
+        cache.put(_oid(2), 'tree', b'x' * 6)
+        # Separate budgets: the tree does not push out the blob.
+        assert len(cache) == 2
+        cache.put(_oid(3), 'symlink', b'x' * 6)
+        assert _oid(1) not in cache and _oid(3) in cache
+        cache.put(_oid(4), 'blob', b'x' * 11)
+        assert _oid(4) not in cache
+        assert cache.stats('blob').bytes == 6
+
+    def test_pin(self):
+        cache = ObjectCache({'tree': Budget(2, 100)})
+        cache.put(_oid(0), 'tree', b't')
+        cache.pin([_oid(0), _oid(1)])
+        cache.put(_oid(1), 'tree', b't')
+        for i in range(2, 6):
+            cache.put(_oid(i), 'tree', b't')
+        assert _oid(0) in cache and _oid(1) in cache
+        assert cache.stats('tree').pinned == 2
+        cache.clear()
+        assert len(cache) == 2
+        cache.unpin(_oid(0))
+        cache.unpin(_oid(1))
+        assert len(cache) == 2
+        cache.put(_oid(9), 'tree', b't')
+        assert _oid(0) not in cache
+
+    def test_threads(self):
+        cache = ObjectCache({'blob': Budget(50, 1 << 20)})
+        def work(k):
+            for i in range(2000):
+                oid = _oid(i % 200 + k)
+                if cache.get(oid) is None:
+                    cache.put(oid, 'blob', b'b' * (i % 7))
+        threads = [threading.Thread(target=work, args=(k,)) for k in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = cache.stats('blob')
+        assert stats.entries == len(cache) <= 50
+        assert stats.bytes == sum(len(cache.get(o)[1]) for o in list(cache._where))
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            ObjectCache({'blob': Budget(-1, 0)})
+        with pytest.raises(ValueError):
+            ObjectCache().put(_oid(0), 'nonsense', b'')
+
+class TestObjectStore:
+    def test_store(self, git_repo):
+        store = ObjectStore(budgets={'blob': Budget(1, 1 << 20)})
+        store.backend = NativeObjectStoreBackend(git_repo)
+        store.backend.frontend = store
+        readme = git(git_repo, 'rev-parse', 'HEAD:README')
+        assert store.read(readme) == ('blob', b'Hello, world\n')
+        assert store.read(readme) == ('blob', b'Hello, world\n')
+        assert store.cache.stats('blob').hits == 1
+        obj = getattr(store, readme)
+        assert (obj.oid, obj.type) == (readme, 'blob')
+        commit = getattr(store, git(git_repo, 'rev-parse', 'HEAD'))
+        assert commit.type == 'commit'
+        with pytest.raises(AttributeError):
+            store.missing_attribute
@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+from gitgo.backend.git import GitObjectStoreBackend
+from gitgo.backend.native import NativeObjectStoreBackend
+from gitgo.lowlevel.catfile import CatFile
+from gitgo.object import parse_tree
+from gitgo.objectstore import ObjectStore
+from tests.conftest import git
+
+MISSING = '0' * 40
+
+def _store(backend):
+    store = ObjectStore()
+    store.backend = backend
+    backend.frontend = store
+    return store
+
+@pytest.fixture(params=['git', 'native', 'packed'])
+def store(request, git_repo):
+    if request.param == 'git':
+        return _store(GitObjectStoreBackend(git_repo))
+    if request.param == 'packed':
+        git(git_repo, 'repack', '-adq')
+    return _store(NativeObjectStoreBackend(git_repo))
+
+def _objects(repo):
+    return git(repo, 'rev-list', '--objects', '--all').split('\n')
+
+class TestParseTree:
+    def test_entries(self, git_repo):
+        tree = git(git_repo, 'rev-parse', 'HEAD^{tree}')
+        data = git(git_repo, 'ls-tree', 'HEAD').split('\n')
+        store = _store(NativeObjectStoreBackend(git_repo))
+        entries = parse_tree(store.read(tree)[1])
+        assert [f'{e.mode:06o} {"tree" if e.mode == 0o40000 else "blob"} {e.oid}\t{e.name}'
+                for e in entries] == data
+
+    def test_truncated(self):
+        with pytest.raises(ValueError):
+            parse_tree(b'100644 x\0' + b'\1' * 10)
+
+class TestGetMany:
+    def test_get_many(self, store, git_repo):
+        oids = [line.split()[0] for line in _objects(git_repo)]
+        expected = {oid: store.backend.read(oid) for oid in oids}
+        store.read(oids[0])
+        got = list(store.get_many([*oids, MISSING, oids[1]]))
+        # Cached first, then the rest; each once.
+        assert got[0] == (oids[0], expected[oids[0]])
+        assert dict(got) == {**expected, MISSING: None}
+        assert len(got) == len(oids) + 1
+        assert all(oid in store.cache for oid in oids)
+
+    def test_prefetch(self, store, git_repo):
+        oids = [line.split()[0] for line in _objects(git_repo)]
+        assert store.prefetch([*oids, MISSING]) == len(oids)
+        assert store.prefetch(oids) == 0
+        store.cache.reset_stats()
+        for oid in oids:
+            store.read(oid)
+        assert store.cache.stats().misses == 0
+
+    def test_prefetch_tree(self, store, git_repo):
+        tree = git(git_repo, 'rev-parse', 'HEAD^{tree}')
+        top = git(git_repo, 'ls-tree', '--object-only', 'HEAD').split('\n')
+        assert store.prefetch_tree(tree) == 1 + len(top)
+        assert all(oid in store.cache for oid in top)
+        src_main = git(git_repo, 'rev-parse', 'HEAD:src/main.py')
+        assert src_main not in store.cache
+        assert store.prefetch_tree(tree, recursive=True) == 1
+        assert src_main in store.cache
+
+    def test_nested(self, git_repo):
+        for path in ('a/b/c/d', 'a/x/y', 'e/f'):
+            (git_repo / path).mkdir(parents=True)
+            (git_repo / path / 'file').write_text(path)
+        git(git_repo, 'add', '.')
+        git(git_repo, 'commit', '-qm', 'nested')
+        store = _store(GitObjectStoreBackend(git_repo, pool_size=2))
+        found = []
+        def walk(oids):
+            # Each level's get_many is still being iterated below it.
+            for oid, (type, data) in store.get_many(oids):
+                if type == 'tree':
+                    walk([e.oid for e in parse_tree(data)])
+                else:
+                    found.append(data)
+        tree = git(git_repo, 'rev-parse', 'HEAD^{tree}')
+        thread = threading.Thread(target=walk, args=([tree],), daemon=True)
+        thread.start()
+        thread.join(10)
+        assert not thread.is_alive()
+        assert sorted(found) == [b'Hello, world\n', b'a/b/c/d', b'a/x/y', b'e/f',
+                                 b'print("hi")\n']
+
+class TestCatFileReadMany:
+    def test_pipelined(self, git_repo):
+        oids = [line.split()[0] for line in _objects(git_repo)] * 300
+        with CatFile(git_repo) as cat:
+            got = list(cat.read_many(oids))
+            assert [o for o, _ in got] == oids
+            assert got[0][1] == cat.read(oids[0])
+
+    def test_abandoned(self, git_repo):
+        oids = [line.split()[0] for line in _objects(git_repo)] * 300
+        with CatFile(git_repo) as cat:
+            it = cat.read_many(oids)
+            next(it)
+            it.close()
+            assert not cat.running
+            # Restarted for the next request.
+            assert cat.read(oids[0]) is not None
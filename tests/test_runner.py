@@ -0,0 +1,226 @@
+import asyncio
+import os
+from subprocess import TimeoutExpired
+
+import pytest
+
+from gitgo.lowlevel.cmdargs import BytesCmdResult, split_records
+
+from gitgo.lowlevel.runner import runner, async_runner, stream_runner
+from gitgo.lowlevel import git_rev_parse, async_git_rev_parse, enable_cache, disable_cache, \
+    enable_metrics, disable_metrics
+from tests.conftest import git as git_cmd
+
+class TestRunner:
+    def test_run(self, git_repo):
+        result = runner('git')('rev-parse', '--show-toplevel', cwd=git_repo)
+        assert result.stdout.strip() == str(git_repo)
+        assert result.returncode == 0
+
+    def test_check(self, git_repo):
+        with pytest.raises(ValueError):
+            runner('git')('rev-parse', 'nonexistent', cwd=git_repo)
+
+class TestAsyncRunner:
+    def test_run(self, git_repo):
+        git = async_runner('git', limit=2)
+        async def main():
+            return await asyncio.gather(*(
+                git('rev-parse', '--show-toplevel', cwd=git_repo)
+                for _ in range(6)
+            ))
+        results = asyncio.run(main())
+        assert all(r.stdout.strip() == str(git_repo) for r in results)
+
+    def test_limit(self, tmp_path):
+        sh = async_runner('sh', limit=2)
+        # Each process counts the others running alongside it.
+        script = 'touch $$; sleep 0.3; ls | wc -l; rm $$'
+        async def main():
+            return await asyncio.gather(*(sh('-c', script, cwd=tmp_path) for _ in range(6)))
+        # A second event loop gets its own semaphore.
+        for _ in range(2):
+            counts = [int(r.stdout) for r in asyncio.run(main())]
+            assert max(counts) == 2
+
+    def test_boolean_return(self, git_repo):
+        git = async_runner('git')
+        result = asyncio.run(git('config', '--get', 'no.such', boolean_return=True, cwd=git_repo))
+        assert result.returncode is False
+
+    def test_cancelled(self, tmp_path):
+        sh = async_runner('sh')
+        pidfile = tmp_path / 'pid'
+        async def main():
+            task = asyncio.ensure_future(sh('-c', f'echo $$ > {pidfile}; exec sleep 10'))
+            while not pidfile.exists() or not pidfile.read_text():
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        asyncio.run(main())
+        # Killed and reaped.
+        with pytest.raises(ProcessLookupError):
+            os.kill(int(pidfile.read_text()), 0)
+
+    def test_wrapper(self, git_repo, monkeypatch):
+        monkeypatch.chdir(git_repo)
+        result = asyncio.run(async_git_rev_parse(git_dir=True))
+        assert result.stdout.splitlines()[0] == '.git'
+        assert git_rev_parse(git_dir=True).stdout == result.stdout
+
+class TestStreamRunner:
+    def test_lines(self, git_repo):
+        stream = stream_runner('git')
+        files = list(stream('ls-files', cwd=git_repo, chunk_size=4))
+        assert files == ['README', 'src/main.py']
+
+    def test_nul(self, git_repo):
+        stream = stream_runner('git')
+        files = list(stream('ls-files', '-z', sep='\0', text=False, cwd=git_repo))
+        assert files == [b'README', b'src/main.py']
+
+    def test_check(self, git_repo):
+        stream = stream_runner('git')
+        with pytest.raises(ValueError):
+            list(stream('log', 'nonexistent', cwd=git_repo))
+
+    def test_early_exit(self, git_repo):
+        stream = stream_runner('git')
+        records = stream('rev-list', '--all', '--objects', cwd=git_repo)
+        assert next(records)
+        records.close()
+
+    def test_long_record(self):
+        stream = stream_runner('sh')
+        script = 'head -c 3000000 /dev/zero | tr "\\0" x; printf "\\0\\0y"'
+        records = list(stream('-c', script, sep='\0\0', chunk_size=4096))
+        assert [len(r) for r in records] == [3000000, 1]
+
+    def test_timeout(self):
+        stream = stream_runner('sh')
+        records = stream('-c', 'echo a; exec sleep 10', timeout=0.5)
+        assert next(records) == 'a'
+        with pytest.raises(TimeoutExpired):
+            next(records)
+
+class TestBytesMode:
+    def test_bytes(self, git_repo):
+        result = runner('git')('ls-files', '-z', text=False, cwd=git_repo)
+        assert isinstance(result, BytesCmdResult)
+        assert result.raw_stdout == b'README\0src/main.py\0'
+        assert [bytes(r) for r in result.records()] == [b'README', b'src/main.py']
+        stdout, stderr, returncode = result
+        assert stdout == 'README\0src/main.py\0'
+        assert returncode == 0
+
+    def test_split_records(self):
+        data = b'a\0bc\0\0d'
+        assert [bytes(r) for r in split_records(data)] == [b'a', b'bc', b'', b'd']
+        assert all(r.obj is data for r in split_records(data))
+
+class TestCommandCache:
+    def test_cache(self, git_repo):
+        git = runner('git')
+        cache = enable_cache(maxsize=2)
+        try:
+            first = git('rev-parse', 'HEAD', cwd=git_repo)
+            assert git('rev-parse', 'HEAD', cwd=git_repo) is first
+            assert cache.stats.hits == 1
+            assert cache.stats.misses == 1
+            # A write through the runner invalidates
+            git('commit', '-q', '--allow-empty', '-m', 'Second', cwd=git_repo)
+            second = git('rev-parse', 'HEAD', cwd=git_repo)
+            assert second.stdout != first.stdout
+            git('rev-parse', 'HEAD~1', cwd=git_repo)
+            git('rev-parse', '--git-dir', cwd=git_repo)
+            assert cache.stats.evictions == 1
+        finally:
+            disable_cache()
+
+    def test_fingerprint(self, git_repo):
+        git = runner('git')
+        cache = enable_cache()
+        try:
+            first = git('rev-parse', 'HEAD', cwd=git_repo)
+            # A write behind the cache's back still changes the fingerprint
+            git_cmd(git_repo, 'checkout', '-q', '-b', 'other')
+            git_cmd(git_repo, 'commit', '-q', '--allow-empty', '-m', 'Other')
+            assert git('rev-parse', 'HEAD', cwd=git_repo).stdout != first.stdout
+            assert (cache.stats.hits, cache.stats.misses) == (0, 2)
+        finally:
+            disable_cache()
+
+    def test_nested_ref(self, git_repo):
+        git = runner('git')
+        git_cmd(git_repo, 'branch', 'feature/x')
+        git_cmd(git_repo, 'commit', '-q', '--allow-empty', '-m', 'Second')
+        enable_cache()
+        try:
+            first = git('rev-parse', 'feature/x', cwd=git_repo)
+            # Only refs/heads/feature changes.
+            git_cmd(git_repo, 'update-ref', 'refs/heads/feature/x', 'HEAD')
+            assert git('rev-parse', 'feature/x', cwd=git_repo).stdout != first.stdout
+        finally:
+            disable_cache()
+
+    def test_new_repo(self, git_repo):
+        git = runner('git')
+        enable_cache()
+        try:
+            sub = git_repo / 'sub'
+            sub.mkdir()
+            outer = git('rev-parse', '--git-dir', cwd=sub)
+            git_cmd(sub, 'init', '-q')
+            assert git('rev-parse', '--git-dir', cwd=sub).stdout != outer.stdout
+        finally:
+            disable_cache()
+
+class TestMetrics:
+    def test_metrics(self, git_repo):
+        git = runner('git')
+        registry = enable_metrics()
+        registry.reset()
+        try:
+            git('rev-parse', 'HEAD', cwd=git_repo)
+            git('rev-parse', 'nonexistent', cwd=git_repo, check=False)
+            list(stream_runner('git')('ls-files', cwd=git_repo))
+            snapshot = registry.snapshot()
+            rev_parse = snapshot['git rev-parse']
+            assert rev_parse['count'] == 2
+            assert rev_parse['failures'] == 1
+            assert rev_parse['stdout_bytes'] >= 41
+            assert sum(rev_parse['buckets']) == 2
+            assert snapshot['git ls-files']['stdout_bytes'] == len('README\nsrc/main.py\n')
+            text = registry.to_prometheus()
+            assert 'gitgo_commands_total{command="git",subcommand="rev-parse"} 2' in text
+            assert 'gitgo_command_seconds_count{command="git",subcommand="rev-parse"} 2' in text
+            assert '"git rev-parse"' in registry.to_json()
+        finally:
+            disable_metrics()
+            registry.reset()
+
+    def test_outcomes(self, tmp_path):
+        registry = enable_metrics()
+        registry.reset()
+        try:
+            runner('echo')('-n', '\u00e9')
+            with pytest.raises(TimeoutExpired):
+                runner('sleep')('5', timeout=0.1)
+            with pytest.raises(OSError):
+                runner('no-such-command-here')()
+            records = stream_runner('yes')()
+            next(records)
+            records.close()
+            snapshot = registry.snapshot()
+            # Bytes, not characters.
+            assert snapshot['echo']['stdout_bytes'] == 2
+            assert snapshot['sleep 5']['outcomes']['timeout'] == 1
+            assert snapshot['no-such-command-here']['outcomes']['spawn_error'] == 1
+            assert snapshot['yes']['outcomes']['closed'] == 1
+            assert snapshot['yes']['failures'] == 1
+            text = registry.to_prometheus()
+            assert 'gitgo_command_outcomes_total{command="sleep",subcommand="5",outcome="timeout"} 1' in text
+        finally:
+            disable_metrics()
+            registry.reset()
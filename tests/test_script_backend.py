@@ -0,0 +1,66 @@
+from gitgo.backend.git import GitObjectStoreBackend
+from gitgo.backend.script import ScriptBackend
+from gitgo.backend.script.script import UNPACK_LIMIT
+from gitgo.index import IndexEntry, GitIndex
+from gitgo.worktree import Worktree
+
+from tests.conftest import git
+
+class TestScriptBackend:
+    def test_run(self, git_repo):
+        backend = ScriptBackend(git_repo, base=GitObjectStoreBackend(git_repo))
+        store = backend.make_object_store_backend()
+        index = backend.make_index(GitIndex())
+        worktree = backend.make_worktree(Worktree(), git_repo)
+        head = git(git_repo, 'rev-parse', 'HEAD')
+
+        blob = store.write('blob', b'New file\n')
+        assert store.read(blob) == ('blob', b'New file\n')
+        tree = store.write('tree', b'100644 NEW\0' + bytes.fromhex(blob))
+        commit = store.write('commit', (
+            f'tree {tree}\nparent {head}\n'
+            'author A <a@example.com> 0 +0000\n'
+            'committer A <a@example.com> 0 +0000\n\nScripted\n').encode())
+        backend.script.update_ref('refs/heads/main', commit, head)
+        index.store(blob, IndexEntry(name='NEW', type='blob', oid=blob, mode=0o644,
+                                     ctime=0, mtime=0, dev=0, ino=0, uid=0, gid=0,
+                                     flags=set(), size=9))
+        with worktree.open('NEW', 'w') as f:
+            f.write('New file\n')
+        assert not (git_repo / 'NEW').exists()
+        assert len(backend.script) == 6
+
+        commands = [c.args[0] for c in backend.script.commands()]
+        assert commands == ['fast-import', 'unpack-objects', 'update-index', 'update-ref']
+        backend.run()
+
+        assert len(backend.script) == 0
+        assert git(git_repo, 'rev-parse', 'HEAD') == commit
+        assert git(git_repo, 'cat-file', 'blob', blob) == 'New file'
+        assert 'NEW' in git(git_repo, 'ls-files').split()
+        assert (git_repo / 'NEW').read_text() == 'New file\n'
+        assert store.read_header(head) == ('commit', store.read(head)[1].__len__())
+        store.base.close()
+
+    def test_many_objects(self, git_repo):
+        backend = ScriptBackend(git_repo)
+        store = backend.make_object_store_backend()
+        blob = store.write('blob', b'x\n')
+        trees = [store.write('tree', f'100644 f{i}\0'.encode() + bytes.fromhex(blob))
+                 for i in range(UNPACK_LIMIT)]
+        assert [c.args[0] for c in backend.script.commands()] == ['fast-import', 'index-pack']
+        backend.run()
+        assert all(git(git_repo, 'cat-file', '-t', t) == 'tree' for t in trees)
+
+    def test_sha256(self, tmp_path):
+        repo = tmp_path / 'repo'
+        git(tmp_path, 'init', '-q', '--object-format=sha256', str(repo))
+        backend = ScriptBackend(repo)
+        assert backend.script.algorithm == 'sha256'
+        store = backend.make_object_store_backend()
+        blob = store.write('blob', b'Hello\n')
+        tree = store.write('tree', b'100644 hello\0' + bytes.fromhex(blob))
+        assert len(tree) == 64
+        backend.run()
+        assert git(repo, 'cat-file', '-t', tree) == 'tree'
+        assert git(repo, 'ls-tree', tree) == f'100644 blob {blob}\thello'
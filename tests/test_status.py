@@ -0,0 +1,51 @@
+import subprocess
+
+from gitgo.lowlevel import git_status_v2, parse_status_v2, BranchStatus, ChangedEntry, \
+    RenamedEntry, UnmergedEntry, UntrackedEntry, IgnoredEntry
+from tests.conftest import git
+
+class TestStatusV2:
+    def test_entries(self, git_repo):
+        head = git(git_repo, 'rev-parse', 'HEAD')
+        (git_repo / 'README').write_text('Changed\n')
+        git(git_repo, 'mv', 'src/main.py', 'src/app.py')
+        (git_repo / 'new file').write_text('x')
+        (git_repo / '.gitignore').write_text('*.log\n')
+        (git_repo / 'debug.log').write_text('x')
+        records = list(git_status_v2(cwd=git_repo, untracked_files='all', ignored='matching',
+                                     show_stash=True, untracked_cache=False, fsmonitor=False))
+        assert records[0] == BranchStatus(oid=head, head='main')
+        entries = {type(r): r for r in records[1:]}
+        readme = entries[ChangedEntry]
+        assert (readme.xy, readme.path, readme.mode_worktree) == ('.M', 'README', 0o100644)
+        renamed = entries[RenamedEntry]
+        assert (renamed.kind, renamed.score) == ('R', 100)
+        assert (renamed.path, renamed.orig_path) == ('src/app.py', 'src/main.py')
+        untracked = sorted(r.path for r in records if isinstance(r, UntrackedEntry))
+        assert untracked == ['.gitignore', 'new file']
+        assert entries[IgnoredEntry] == IgnoredEntry('debug.log')
+
+    def test_unmerged(self, git_repo):
+        git(git_repo, 'checkout', '-q', '-b', 'other')
+        (git_repo / 'README').write_text('Other\n')
+        git(git_repo, 'commit', '-q', '-am', 'other')
+        git(git_repo, 'checkout', '-q', 'main')
+        (git_repo / 'README').write_text('Main\n')
+        git(git_repo, 'commit', '-q', '-am', 'main')
+        subprocess.run(['git', 'merge', 'other'], cwd=git_repo, capture_output=True)
+        records = list(git_status_v2(cwd=git_repo, branch=False))
+        assert [(type(r), r.xy, r.path) for r in records] == [(UnmergedEntry, 'UU', 'README')]
+
+    def test_parse(self):
+        records = [
+            b'# branch.oid (initial)',
+            b'# branch.head (detached)',
+            b'# branch.upstream origin/main',
+            b'# branch.ab +2 -3',
+            b'# future.header whatever',
+            b'? a b',
+        ]
+        assert list(parse_status_v2(records)) == [
+            BranchStatus(None, None, 'origin/main', 2, 3),
+            UntrackedEntry('a b'),
+        ]
@@ -0,0 +1,101 @@
+import errno
+import sys
+
+import pytest
+
+from gitgo.backend.native import NativeWorktreeBackend
+from gitgo.index import GitPhysIndex
+from gitgo.worktree import WorktreeWatcher
+from gitgo.worktree.watcher import query, write_hook
+from tests.conftest import git
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify')
+
+class TestWatcher:
+    def test_changes(self, git_repo):
+        with WorktreeWatcher(git_repo) as watcher:
+            token = watcher.token()
+            assert watcher.changed_since(token) == set()
+            (git_repo / 'README').write_text('changed\n')
+            (git_repo / 'src' / 'main.py').unlink()
+            (git_repo / 'new' / 'deeper').mkdir(parents=True)
+            (git_repo / 'new' / 'deeper' / 'file').write_text('x')
+            git(git_repo, 'status')  # Activity in .git is not reported.
+            changed = watcher.changed_since(token)
+            assert {b'README', b'src/main.py', b'new/', b'new/deeper/file'} <= changed
+            assert not any(p.startswith(b'.git') for p in changed)
+            later = watcher.token()
+            (git_repo / 'new' / 'deeper' / 'file').write_text('y')
+            assert watcher.changed_since(later) == {b'new/deeper/file'}
+
+    def test_overflow(self, git_repo):
+        with WorktreeWatcher(git_repo) as watcher:
+            token = watcher.token()
+            watcher._overflow()
+            assert watcher.changed_since(token) is None
+            assert watcher.changed_since('not a token') is None
+            assert watcher.changed_since(watcher.token()) == set()
+
+    def test_status(self, git_repo):
+        worktree = NativeWorktreeBackend(git_repo)
+        index = GitPhysIndex(path=str(git_repo / '.git' / 'index'))
+        index.load()
+        worktree.watch()
+        try:
+            assert worktree.status(index).clean
+            checked = []
+            status = worktree._status.status
+            def spy(table, **kwargs):
+                checked.append(kwargs.get('rows'))
+                return status(table, **kwargs)
+            worktree._status.status = spy
+            (git_repo / 'README').write_text('changed\n')
+            assert worktree.status(index).modified == ['README']
+            (git_repo / 'README').write_text('Hello, world\n')
+            (git_repo / 'src' / 'main.py').unlink()
+            changes = worktree.status(index)
+            assert (changes.modified, changes.deleted) == ([], ['src/main.py'])
+            # Only the changed rows were looked at.
+            assert checked == [[0], [0, 1]]
+        finally:
+            worktree.close()
+
+    def test_failed(self, git_repo, monkeypatch):
+        worktree = NativeWorktreeBackend(git_repo)
+        index = GitPhysIndex(path=str(git_repo / '.git' / 'index'))
+        index.load()
+        watcher = worktree.watch()
+        try:
+            token = watcher.token()
+            assert worktree.status(index).clean
+            def fail(top, mark):
+                raise OSError(errno.ENOSPC, 'No space left on device')
+            monkeypatch.setattr(watcher, '_add_tree', fail)
+            (git_repo / 'new').mkdir()
+            watcher._thread.join(5)
+            assert not watcher.running
+            assert isinstance(watcher.error, OSError)
+            assert watcher.changes(token)[1] is None
+            # Status falls back to looking at everything.
+            (git_repo / 'README').write_text('changed\n')
+            assert worktree.status(index).modified == ['README']
+        finally:
+            worktree.close()
+
+    def test_fsmonitor(self, git_repo):
+        with WorktreeWatcher(git_repo) as watcher:
+            watcher.serve()
+            token, *paths = query(watcher.git_dir, 'stale').split(b'\0')
+            assert paths == [b'/', b'']
+            (git_repo / 'README').write_text('changed\n')
+            _, *paths = query(watcher.git_dir, token.decode()).split(b'\0')
+            assert paths == [b'README', b'']
+            hook = write_hook(watcher.git_dir)
+            git(git_repo, 'config', 'core.fsmonitor', str(hook))
+            git(git_repo, 'update-index', '--fsmonitor')
+            assert git(git_repo, 'status', '--porcelain') == 'M README'
+            # Lower case: git took the hook's word that it is unchanged.
+            assert 'h src/main.py' in git(git_repo, 'ls-files', '-f').split('\n')
+            (git_repo / 'src' / 'main.py').write_text('changed\n')
+            lines = git(git_repo, 'status', '--porcelain').split('\n')
+            assert [line.strip() for line in lines] == ['M README', 'M src/main.py']
@@ -0,0 +1,78 @@
+import os
+
+from gitgo.backend.native import NativeWorktreeBackend
+from gitgo.index import GitPhysIndex
+from gitgo.worktree import StatusEngine
+from tests.conftest import git
+
+def _load(repo):
+    index = GitPhysIndex(path=str(repo / '.git' / 'index'))
+    index.load()
+    return index
+
+def _age(repo):
+    '''
+    Backdate the files and rewrite the index, so no entry is racy.
+    '''
+    for name in ('README', 'src/main.py'):
+        os.utime(repo / name, ns=(1_600_000_000_000_000_000,) * 2)
+    git(repo, 'update-index', '--refresh')
+
+class TestWorktreeStatus:
+    def test_clean(self, git_repo):
+        _age(git_repo)
+        worktree = NativeWorktreeBackend(git_repo)
+        changes = worktree.status(_load(git_repo))
+        assert changes.clean and not changes.stale
+
+    def test_changes(self, git_repo):
+        _age(git_repo)
+        (git_repo / 'README').write_text('Hello, World\n')  # Same size.
+        (git_repo / 'src' / 'main.py').unlink()
+        (git_repo / 'new').write_text('untracked\n')
+        git(git_repo, 'add', 'new')
+        os.chmod(git_repo / 'new', 0o755)
+        worktree = NativeWorktreeBackend(git_repo)
+        changes = worktree.status(_load(git_repo))
+        assert changes.modified == ['README', 'new']
+        assert changes.deleted == ['src/main.py']
+        assert git(git_repo, 'diff-files', '--name-only').split() == ['README', 'new', 'src/main.py']
+
+    def test_racy(self, git_repo):
+        # README changed after being staged, within the same tick: the stat
+        # data in the index is the file's, but the oid is of the old contents.
+        index = _load(git_repo)
+        readme = git_repo / 'README'
+        readme.write_text('Hello, WORLD\n')
+        st = readme.stat()
+        row = index._table.get(b'README')
+        index._table.put(b'README', 0, (st.st_ctime_ns, st.st_mtime_ns, st.st_dev, st.st_ino,
+                                        *row[4:7], st.st_size, *row[8:]))
+        worktree = NativeWorktreeBackend(git_repo)
+        # Trusted if the index was written later; hashed if not.
+        assert worktree.status(index._table, index_mtime_ns=st.st_mtime_ns + 1).clean
+        assert worktree.status(index._table, index_mtime_ns=st.st_mtime_ns).modified == ['README']
+
+    def test_stale(self, git_repo):
+        _age(git_repo)
+        os.utime(git_repo / 'README', ns=(1_500_000_000_000_000_000,) * 2)
+        worktree = NativeWorktreeBackend(git_repo)
+        engine = StatusEngine(worktree, workers=2)
+        table = _load(git_repo)._table
+        reads = []
+        hash_blob = worktree.hash_blob
+        worktree.hash_blob = lambda path, *args: reads.append(path) or hash_blob(path, *args)
+        for _ in range(2):
+            changes = engine.status(table)
+            assert changes.clean and changes.stale == ['README']
+        # Hashed once, then found in the cache.
+        assert reads == [b'README']
+        engine.close()
+
+    def test_unmerged(self, git_repo):
+        blob = git(git_repo, 'hash-object', '-w', 'README')
+        git(git_repo, 'update-index', '--index-info',
+            input=f'0 {"0" * 40}\tREADME\n100644 {blob} 1\tREADME\n100644 {blob} 3\tREADME\n')
+        changes = NativeWorktreeBackend(git_repo).status(_load(git_repo))
+        assert changes.unmerged == ['README']
+        assert not changes.modified